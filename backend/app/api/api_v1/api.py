@@ -1,8 +1,11 @@
 from fastapi import APIRouter
 
-from app.api.api_v1.endpoints import users, meetings, chat
+from app.api.api_v1.endpoints import users, meetings, chat, locations, metrics, admin
 
 api_router = APIRouter()
 api_router.include_router(users.router, prefix="/users", tags=["users"])
 api_router.include_router(meetings.router, prefix="/meetings", tags=["meetings"])
 api_router.include_router(chat.router, prefix="/chat", tags=["chat"])
+api_router.include_router(locations.router, prefix="/locations", tags=["locations"])
+api_router.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
+api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
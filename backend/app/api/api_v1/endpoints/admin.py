@@ -0,0 +1,43 @@
+import secrets
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi.responses import StreamingResponse
+
+from app.models.user import ErrorResponse
+from app.services.export_service import ExportService, get_export_service
+from app.core.config import settings
+
+router = APIRouter()
+
+
+def check_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Reject the request unless it carries ADMIN_TOKEN. Without a configured token every request is rejected"""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled, ADMIN_TOKEN is not set")
+    if not secrets.compare_digest((x_admin_token or "").encode(), settings.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@router.get("/export/{table}", responses={400: {"model": ErrorResponse}, 403: {"model": ErrorResponse}}, dependencies=[Depends(check_admin_token)])
+def export_table(table: str, format: str = "ndjson", since: Optional[datetime] = None, until: Optional[datetime] = None, after: int = 0, export_service: ExportService = Depends(get_export_service)):
+    """
+    Stream the `logs` or the `meetings` as NDJSON or CSV, in ID order,
+    optionally within a time range (the log timestamp, the meeting start).
+    To resume an interrupted export, pass the ID of the last row received
+    as `after`.
+    """
+    try:
+        result = export_service.export(table, format, since, until, after)
+    except:
+        raise HTTPException(status_code=500, detail="Failed to export table")
+
+    if isinstance(result, dict) and "error" in result:
+        raise HTTPException(status_code=400, detail=f"Failed to export table: {result['error']}")
+
+    return StreamingResponse(
+        result,
+        media_type=export_service.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{format}"'}
+    )
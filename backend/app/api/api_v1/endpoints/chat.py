@@ -2,16 +2,19 @@ from fastapi import APIRouter, HTTPException, Depends
 
 from app.models.message import MessageCreate, MessageListResponse
 from app.models.user import SuccessResponse, ErrorResponse
-from app.services.chat_service import ChatService
+from app.services.chat_service import ChatService, get_chat_service
+from app.core.rate_limit import rate_limit
+from app.core.circuit_breaker import BackendUnavailableError
 
 router = APIRouter()
-chat_service = ChatService()
 
 
-@router.post("/post", response_model=SuccessResponse, responses={400: {"model": ErrorResponse}})
-async def post_message(message: MessageCreate):
+@router.post("/post", response_model=SuccessResponse, responses={400: {"model": ErrorResponse}, 429: {"model": ErrorResponse}, 503: {"model": ErrorResponse}}, dependencies=[Depends(rate_limit("chat_post"))])
+def post_message(message: MessageCreate, chat_service: ChatService = Depends(get_chat_service)):
     try:
         result = chat_service.post_message(message.email, message.text)
+    except BackendUnavailableError:
+        raise HTTPException(status_code=503, detail="Failed to post message: service temporarily unavailable")
     except:
         raise HTTPException(status_code=500, detail=f"Failed to post message")
 
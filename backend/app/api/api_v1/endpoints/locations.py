@@ -0,0 +1,28 @@
+from fastapi import APIRouter, HTTPException, Depends
+
+from app.models.location import LocationBatchRequest, LocationBatchResponse, GeofenceTransition
+from app.models.user import ErrorResponse
+from app.services.location_service import LocationService, get_location_service
+from app.core.circuit_breaker import BackendUnavailableError
+
+router = APIRouter()
+
+
+@router.post("", response_model=LocationBatchResponse, responses={400: {"model": ErrorResponse}, 503: {"model": ErrorResponse}})
+def post_locations(batch: LocationBatchRequest, location_service: LocationService = Depends(get_location_service)):
+    try:
+        result = location_service.ingest_locations([
+            (update.email, update.x, update.y, update.timestamp)
+            for update in batch.updates
+        ])
+    except BackendUnavailableError:
+        raise HTTPException(status_code=503, detail="Failed to process location updates: service temporarily unavailable")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Failed to process location updates")
+
+    return LocationBatchResponse(
+        accepted=result["accepted"],
+        dropped=result["dropped"],
+        joined=[GeofenceTransition(email=e, meeting_id=m) for e, m in result["joined"]],
+        left=[GeofenceTransition(email=e, meeting_id=m) for e, m in result["left"]]
+    )
@@ -1,16 +1,24 @@
-from fastapi import APIRouter, HTTPException, Depends
+from datetime import datetime
+from typing import Optional
 
-from app.models.meeting import MeetingCreate, MeetingResponse, MeetingIdResponse, MeetingListResponse
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
+
+from app.models.meeting import MeetingCreate, MeetingResponse, MeetingIdResponse, MeetingListResponse, MeetingStatsResponse, MeetingOccupancyResponse
 from app.models.user import JoinLeaveRequest, SuccessResponse, ErrorResponse, ParticipantListResponse, EndMeetingResponse
-from app.models.message import MessageListResponse
-from app.services.meeting_service import MeetingService
+from app.models.message import MessageListResponse, MessageSearchResponse
+from app.services.meeting_service import MeetingService, get_meeting_service
+from app.services.analytics_service import AnalyticsService, get_analytics_service
+from app.utils.http_utils import check_not_modified, set_cache_headers
+from app.core.rate_limit import rate_limit, enforce_rate_limit
+from app.core.circuit_breaker import BackendUnavailableError
+from app.core.constants import SEARCH_PAGE_SIZE, HEATMAP_PRECISION, GEOJSON_LIMIT
 
 router = APIRouter()
-meeting_service = MeetingService()
 
 
 @router.post("", response_model=MeetingIdResponse, responses={400: {"model": ErrorResponse}})
-async def create_meeting(meeting: MeetingCreate):
+def create_meeting(meeting: MeetingCreate, meeting_service: MeetingService = Depends(get_meeting_service)):
     try:
         result = meeting_service.create_meeting(
             meeting.title,
@@ -33,7 +41,7 @@ async def create_meeting(meeting: MeetingCreate):
     return MeetingIdResponse(meeting_id=result)
 
 @router.delete("/{meeting_id}", response_model=SuccessResponse, responses={404: {"model": ErrorResponse}})
-async def delete_meeting(meeting_id: int, email: str = None):
+def delete_meeting(meeting_id: int, email: str = None, meeting_service: MeetingService = Depends(get_meeting_service)):
     try:
         if email:
             result = meeting_service.delete_meeting(meeting_id, email)
@@ -51,7 +59,7 @@ async def delete_meeting(meeting_id: int, email: str = None):
     return SuccessResponse()
 
 @router.get("/{email}/meetings", response_model=MeetingListResponse)
-async def get_user_meetings(email: str):
+def get_user_meetings(email: str, meeting_service: MeetingService = Depends(get_meeting_service)):
     """
     Retrieve all meetings created by a specific user.
     """
@@ -64,7 +72,7 @@ async def get_user_meetings(email: str):
         raise HTTPException(status_code=500, detail="Failed to retrieve user meetings")
 
 @router.delete("/meetings/{meeting_id}", response_model=MeetingListResponse)
-async def delete_user_meeting(meeting_id: int, email: str):
+def delete_user_meeting(meeting_id: int, email: str, meeting_service: MeetingService = Depends(get_meeting_service)):
     """
     Delete a meeting created by the user and return the updated list.
     """
@@ -87,21 +95,63 @@ async def delete_user_meeting(meeting_id: int, email: str):
 
     return MeetingListResponse(meetings=meetings)
 
-@router.get("/active", response_model=MeetingListResponse)
-async def active_meetings():
+@router.get("/active", response_model=MeetingListResponse, responses={304: {"description": "Not modified"}})
+def active_meetings(request: Request, response: Response, meeting_service: MeetingService = Depends(get_meeting_service)):
+    # The active meetings are kept in sync by the scheduler, reads only hit the cache
     try:
-        meetings = meeting_service.get_active_meetings()
-        if meetings is None:
-            meetings = []
-        return MeetingListResponse(meetings=meetings)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        meetings, etag = meeting_service.get_active_meetings_cached()
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to retrieve active meetings")
 
+    cached = check_not_modified(request, "active_meetings", (etag, None))
+    if cached:
+        return cached
+
+    set_cache_headers(response, etag)
+    return MeetingListResponse(meetings=meetings)
+
+
+@router.get("/active.geojson", responses={400: {"model": ErrorResponse}})
+def active_meetings_geojson(bbox: Optional[str] = None, limit: int = GEOJSON_LIMIT, meeting_service: MeetingService = Depends(get_meeting_service)):
+    """
+    The active meetings within `bbox` (min_long,min_lat,max_long,max_lat),
+    as a streamed GeoJSON FeatureCollection of points. At most `limit`
+    meetings are returned, the ones nearest to the center of the box.
+    """
+    try:
+        result = meeting_service.get_active_meetings_geojson(bbox, limit)
+    except BackendUnavailableError:
+        raise HTTPException(status_code=503, detail="Failed to retrieve active meetings: service temporarily unavailable")
+    except:
+        raise HTTPException(status_code=500, detail="Failed to retrieve active meetings")
+
+    if isinstance(result, dict) and "error" in result:
+        raise HTTPException(status_code=400, detail=f"Failed to retrieve active meetings: {result['error']}")
+    return StreamingResponse(result, media_type="application/geo+json")
+
 
-@router.get("/nearby", response_model=MeetingListResponse)
-async def nearby_meetings(email: str, x: float, y: float):
+@router.get("/heatmap", responses={400: {"model": ErrorResponse}})
+def meetings_heatmap(bbox: Optional[str] = None, precision: int = HEATMAP_PRECISION, meeting_service: MeetingService = Depends(get_meeting_service)):
+    """
+    Heatmap of the active meetings and their joined users, as a GeoJSON
+    FeatureCollection of geohash cells within `bbox`
+    (min_long,min_lat,max_long,max_lat). Large boxes are answered with a
+    coarser precision than requested, the one used is in `precision`.
+    """
+    try:
+        result = meeting_service.get_heatmap(bbox, precision)
+    except BackendUnavailableError:
+        raise HTTPException(status_code=503, detail="Failed to retrieve heatmap: service temporarily unavailable")
+    except:
+        raise HTTPException(status_code=500, detail="Failed to retrieve heatmap")
+
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=f"Failed to retrieve heatmap: {result['error']}")
+    return ORJSONResponse(result)
+
+
+@router.get("/nearby", response_model=MeetingListResponse, dependencies=[Depends(rate_limit("nearby"))])
+def nearby_meetings(email: str, x: float, y: float, meeting_service: MeetingService = Depends(get_meeting_service)):
     try:
         # Convert string parameters to appropriate types
         x_float = float(x)
@@ -126,22 +176,70 @@ async def nearby_meetings(email: str, x: float, y: float):
     return MeetingListResponse(meetings=result)
 
 
-@router.get("/{meeting_id}", response_model=MeetingResponse, responses={404: {"model": ErrorResponse}})
-async def get_meeting(meeting_id: int):
+@router.get("/{meeting_id}", response_model=MeetingResponse, responses={304: {"description": "Not modified"}, 404: {"model": ErrorResponse}})
+def get_meeting(meeting_id: int, request: Request, response: Response, meeting_service: MeetingService = Depends(get_meeting_service)):
     try:
+        version = meeting_service.get_meeting_version(meeting_id, "meeting")
+        cached = check_not_modified(request, "meeting", version)
+        if cached:
+            return cached
+
         meeting = meeting_service.get_meeting(meeting_id)
     except:
         raise HTTPException(status_code=500, detail="Failed to retrieve meeting")
 
     if meeting is None:
         raise HTTPException(status_code=404, detail="Failed to retrieve meeting: Meeting not found")
+
+    if version:
+        set_cache_headers(response, *version)
     return meeting
 
 
+@router.get("/{meeting_id}/stats", response_model=MeetingStatsResponse, responses={404: {"model": ErrorResponse}})
+def meeting_stats(meeting_id: int, analytics_service: AnalyticsService = Depends(get_analytics_service)):
+    """
+    Attendance of a meeting, from the rollups of the logs. The logs are
+    folded by the scheduler, so the stats may lag behind by a few seconds.
+    """
+    try:
+        stats = analytics_service.get_meeting_stats(meeting_id)
+    except:
+        raise HTTPException(status_code=500, detail="Failed to retrieve meeting stats")
+
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Failed to retrieve meeting stats: No attendance recorded")
+    return stats
+
+
+@router.get("/{meeting_id}/occupancy", response_model=MeetingOccupancyResponse, responses={400: {"model": ErrorResponse}, 404: {"model": ErrorResponse}})
+def meeting_occupancy(meeting_id: int, start: Optional[datetime] = Query(None, alias="from"), end: Optional[datetime] = Query(None, alias="to"), step: int = 60, meeting_service: MeetingService = Depends(get_meeting_service)):
+    """
+    Occupancy of a meeting over time, in points of `step` seconds (rounded
+    up to whole minutes) between `from` and `to`. Each point has the peak
+    number of joined participants in it and the number it closed with.
+    Long ranges are downsampled to a coarser step.
+    """
+    try:
+        result = meeting_service.get_meeting_occupancy(meeting_id, start, end, step)
+    except BackendUnavailableError:
+        raise HTTPException(status_code=503, detail="Failed to retrieve meeting occupancy: service temporarily unavailable")
+    except:
+        raise HTTPException(status_code=500, detail="Failed to retrieve meeting occupancy")
+
+    if result is None:
+        raise HTTPException(status_code=404, detail="Failed to retrieve meeting occupancy: No occupancy recorded")
+    if isinstance(result, dict) and "error" in result:
+        raise HTTPException(status_code=400, detail=f"Failed to retrieve meeting occupancy: {result['error']}")
+    return result
+
+
 @router.post("/{meeting_id}/join", response_model=SuccessResponse, responses={400: {"model": ErrorResponse}})
-async def join_meeting(meeting_id: int, request: JoinLeaveRequest):
+def join_meeting(meeting_id: int, request: JoinLeaveRequest, meeting_service: MeetingService = Depends(get_meeting_service)):
     try:
         result = meeting_service.join_meeting(request.email, meeting_id)
+    except BackendUnavailableError:
+        raise HTTPException(status_code=503, detail="Failed to join meeting: service temporarily unavailable")
     except:
         raise HTTPException(status_code=500, detail="Failed to join meeting")
 
@@ -151,9 +249,11 @@ async def join_meeting(meeting_id: int, request: JoinLeaveRequest):
 
 
 @router.post("/{meeting_id}/leave", response_model=SuccessResponse, responses={400: {"model": ErrorResponse}})
-async def leave_meeting(meeting_id: int, request: JoinLeaveRequest):
+def leave_meeting(meeting_id: int, request: JoinLeaveRequest, meeting_service: MeetingService = Depends(get_meeting_service)):
     try:
         result = meeting_service.leave_meeting(request.email, meeting_id)
+    except BackendUnavailableError:
+        raise HTTPException(status_code=503, detail="Failed to leave meeting: service temporarily unavailable")
     except:
         raise HTTPException(status_code=500, detail="Failed to leave meeting")
 
@@ -162,10 +262,20 @@ async def leave_meeting(meeting_id: int, request: JoinLeaveRequest):
     return SuccessResponse()
 
 
-@router.get("/{meeting_id}/participants", response_model=ParticipantListResponse)
-async def meeting_participants(meeting_id: int):
+@router.get("/{meeting_id}/participants", response_model=ParticipantListResponse, responses={304: {"description": "Not modified"}})
+def meeting_participants(meeting_id: int, request: Request, meeting_service: MeetingService = Depends(get_meeting_service)):
     try:
+        version = meeting_service.get_meeting_version(meeting_id, "participants")
+        cached = check_not_modified(request, "participants", version)
+        if cached:
+            return cached
+
         result = meeting_service.get_meeting_participants(meeting_id)
+    except BackendUnavailableError:
+        raise HTTPException(
+            status_code=503,
+            detail="Failed to retrieve meeting joined participants: service temporarily unavailable"
+        )
     except:
         raise HTTPException(
             status_code=500,
@@ -177,11 +287,16 @@ async def meeting_participants(meeting_id: int):
             status_code=400,
             detail=f"Failed to retrieve meeting joined participants: {result['error']}"
         )
-    return ParticipantListResponse(participants=result)
+
+    # the emails come from our own sets, no need to validate them again
+    response = ORJSONResponse({"participants": result})
+    if version:
+        set_cache_headers(response, *version)
+    return response
 
 
 @router.post("/{meeting_id}/end", response_model=EndMeetingResponse)
-async def end_meeting(meeting_id: int):
+def end_meeting(meeting_id: int, meeting_service: MeetingService = Depends(get_meeting_service)):
     try:
         result = meeting_service.end_meeting(meeting_id)
     except Exception as e:
@@ -198,10 +313,23 @@ async def end_meeting(meeting_id: int):
     )
 
 
-@router.get("/{meeting_id}/messages", response_model=MessageListResponse)
-async def meeting_messages(meeting_id: int):
+@router.get("/{meeting_id}/messages", response_model=MessageListResponse, responses={304: {"description": "Not modified"}, 429: {"model": ErrorResponse}})
+def meeting_messages(meeting_id: int, request: Request, meeting_service: MeetingService = Depends(get_meeting_service)):
+    # The polls that are up to date get their 304 before the rate limit,
+    # only the ones that fetch the messages spend a token
+    version = meeting_service.get_meeting_version(meeting_id, "messages")
+    cached = check_not_modified(request, "messages", version)
+    if cached:
+        return cached
+    enforce_rate_limit("messages", request)
+
     try:
-        result = meeting_service.get_meeting_messages(meeting_id)
+        result = meeting_service.get_meeting_messages(meeting_id, as_json=True)
+    except BackendUnavailableError:
+        raise HTTPException(
+            status_code=503,
+            detail="Failed to retrieve messages of meeting: service temporarily unavailable"
+        )
     except:
         raise HTTPException(
             status_code=500,
@@ -213,13 +341,51 @@ async def meeting_messages(meeting_id: int):
             status_code=400,
             detail=f"Failed to retrieve messages of meeting: {result['error']}"
         )
-    return MessageListResponse(messages=result)
+
+    response = _messages_response(result)
+    if version:
+        set_cache_headers(response, *version)
+    return response
 
 
-@router.get("/{meeting_id}/messages/{email}", response_model=MessageListResponse)
-async def user_messages(meeting_id: int, email: str):
+@router.get("/{meeting_id}/messages/search", response_model=MessageSearchResponse, dependencies=[Depends(rate_limit("messages"))])
+def search_meeting_messages(meeting_id: int, q: str, offset: int = 0, limit: int = SEARCH_PAGE_SIZE, meeting_service: MeetingService = Depends(get_meeting_service)):
+    """
+    Search the chat of a meeting, active or ended. Results are ranked best
+    match first, pass `next_offset` as `offset` for the next page.
+    """
     try:
-        result = meeting_service.get_user_messages(email, meeting_id)
+        result = meeting_service.search_meeting_messages(meeting_id, q, offset, limit)
+    except BackendUnavailableError:
+        raise HTTPException(
+            status_code=503,
+            detail="Failed to search messages of meeting: service temporarily unavailable"
+        )
+    except:
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to search messages of meeting"
+        )
+
+    if isinstance(result, dict) and "error" in result:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Failed to search messages of meeting: {result['error']}"
+        )
+
+    messages, next_offset = result
+    return MessageSearchResponse(messages=messages, next_offset=next_offset)
+
+
+@router.get("/{meeting_id}/messages/{email}", response_model=MessageListResponse, dependencies=[Depends(rate_limit("messages"))])
+def user_messages(meeting_id: int, email: str, meeting_service: MeetingService = Depends(get_meeting_service)):
+    try:
+        result = meeting_service.get_user_messages(email, meeting_id, as_json=True)
+    except BackendUnavailableError:
+        raise HTTPException(
+            status_code=503,
+            detail="Failed to retrieve messages of user: service temporarily unavailable"
+        )
     except:
         raise HTTPException(
             status_code=500,
@@ -231,4 +397,9 @@ async def user_messages(meeting_id: int, email: str):
             status_code=400,
             detail=f"Failed to retrieve messages of user: {result['error']}"
         )
-    return MessageListResponse(messages=result)
\ No newline at end of file
+    return _messages_response(result)
+
+
+def _messages_response(messages_json):
+    """Wrap an already serialized JSON array of messages, skipping the model validation"""
+    return Response(content=b'{"messages":' + messages_json + b"}", media_type="application/json")
\ No newline at end of file
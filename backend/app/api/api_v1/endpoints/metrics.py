@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+
+from app.core.metrics import metrics
+
+router = APIRouter()
+
+
+@router.get("")
+async def get_metrics():
+    """
+    Counters of the worker process that serves the request.
+    """
+    return {
+        "counters": metrics.snapshot(),
+        "gauges": metrics.gauges(),
+        "not_modified_ratio": metrics.not_modified_ratios()
+    }
@@ -1,14 +1,22 @@
+from datetime import datetime
+from typing import Optional
+
 from fastapi import APIRouter, HTTPException, Depends
 
-from app.models.user import UserCreate, User, SuccessResponse, ErrorResponse
-from app.services.user_service import UserService
+from app.models.user import UserCreate, User, SuccessResponse, ErrorResponse, UserStatsResponse
+from app.models.message import MessageHistoryResponse
+from app.services.user_service import UserService, get_user_service
+from app.services.meeting_service import MeetingService, get_meeting_service
+from app.services.analytics_service import AnalyticsService, get_analytics_service
+from app.core.rate_limit import rate_limit
+from app.core.circuit_breaker import BackendUnavailableError
+from app.core.constants import HISTORY_PAGE_SIZE
 
 router = APIRouter()
-user_service = UserService()
 
 
 @router.post("", response_model=SuccessResponse, responses={400: {"model": ErrorResponse}})
-async def create_user(user: UserCreate):
+def create_user(user: UserCreate, user_service: UserService = Depends(get_user_service)):
     try:
         result = user_service.create_user(user.email, user.name, user.age, user.gender)
     except Exception as e:
@@ -19,7 +27,7 @@ async def create_user(user: UserCreate):
     return SuccessResponse()
 
 @router.get("/{email}", response_model=User, responses={404: {"model": ErrorResponse}})
-async def get_user(email: str):
+def get_user(email: str, user_service: UserService = Depends(get_user_service)):
     try:
         user = user_service.get_user(email)
     except:
@@ -30,7 +38,7 @@ async def get_user(email: str):
     return user
 
 @router.delete("/{email}", response_model=SuccessResponse, responses={404: {"model": ErrorResponse}})
-async def delete_user(email: str):
+def delete_user(email: str, user_service: UserService = Depends(get_user_service)):
     try:
         result = user_service.delete_user(email)
     except Exception as e:
@@ -42,4 +50,31 @@ async def delete_user(email: str):
     if isinstance(result, dict) and "error" in result:
         raise HTTPException(status_code=400, detail=f"Failed to delete user: {result['error']}")
 
-    return SuccessResponse()
\ No newline at end of file
+    return SuccessResponse()
+
+@router.get("/{email}/messages", response_model=MessageHistoryResponse, responses={400: {"model": ErrorResponse}}, dependencies=[Depends(rate_limit("messages"))])
+def user_message_history(email: str, since: Optional[datetime] = None, until: Optional[datetime] = None, cursor: Optional[str] = None, limit: int = HISTORY_PAGE_SIZE, meeting_service: MeetingService = Depends(get_meeting_service)):
+    """
+    Messages of a user across all meetings, active or ended, newest first.
+    Pass `next_cursor` as `cursor` for the next page.
+    """
+    try:
+        result = meeting_service.get_user_message_history(email, since, until, cursor, limit)
+    except BackendUnavailableError:
+        raise HTTPException(status_code=503, detail="Failed to retrieve messages of user: service temporarily unavailable")
+    except:
+        raise HTTPException(status_code=500, detail="Failed to retrieve messages of user")
+
+    if isinstance(result, dict) and "error" in result:
+        raise HTTPException(status_code=400, detail=f"Failed to retrieve messages of user: {result['error']}")
+
+    messages, next_cursor = result
+    return MessageHistoryResponse(messages=messages, next_cursor=next_cursor)
+
+@router.get("/{email}/stats", response_model=UserStatsResponse)
+def user_stats(email: str, analytics_service: AnalyticsService = Depends(get_analytics_service)):
+    """Attendance of a user over all meetings, from the rollups of the logs"""
+    try:
+        return analytics_service.get_user_stats(email)
+    except:
+        raise HTTPException(status_code=500, detail="Failed to retrieve user stats")
@@ -0,0 +1,93 @@
+import time
+import threading
+
+from app.core.metrics import metrics
+
+
+class BackendUnavailableError(Exception):
+    """Raised when a backend call fails, or is not attempted, because the backend is unavailable"""
+
+
+class CircuitOpenError(BackendUnavailableError):
+    """Raised instead of calling a backend while its circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a backend after `failure_threshold` consecutive failures.
+    After `reset_timeout` seconds a single trial call is let through: if it
+    succeeds the breaker closes again, otherwise it stays open.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold, reset_timeout, exceptions):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.exceptions = exceptions  # the errors that count as the backend being unavailable
+
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._report_state()
+
+    def call(self, func, *args, **kwargs):
+        """Call `func` through the breaker"""
+        self._before_call()
+        try:
+            result = func(*args, **kwargs)
+        except self.exceptions as e:
+            self._on_failure()
+            raise BackendUnavailableError(f"{self.name} is unavailable: {e}") from e
+        except BaseException:
+            # the backend answered, the error is not about its availability
+            self._on_success()
+            raise
+        self._on_success()
+        return result
+
+    def is_open(self):
+        """Whether calls are currently rejected"""
+        with self.lock:
+            return self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def _before_call(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return
+
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # let this call through as the trial
+                self.state = self.HALF_OPEN
+                self._report_state()
+                return
+
+            metrics.incr(f"circuit_breaker.{self.name}.rejected")
+            raise CircuitOpenError(f"{self.name} is unavailable, circuit breaker is {self.state}")
+
+    def _on_success(self):
+        with self.lock:
+            self.failures = 0
+            if self.state != self.CLOSED:
+                print(f"Circuit breaker {self.name} closed")
+                self.state = self.CLOSED
+                self._report_state()
+
+    def _on_failure(self):
+        with self.lock:
+            self.failures += 1
+            metrics.incr(f"circuit_breaker.{self.name}.failures")
+
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"Circuit breaker {self.name} opened after {self.failures} failures")
+                    metrics.incr(f"circuit_breaker.{self.name}.opened")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._report_state()
+
+    def _report_state(self):
+        metrics.set_gauge(f"circuit_breaker.{self.name}.state", self.state)
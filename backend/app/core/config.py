@@ -1,6 +1,6 @@
 import os
 import secrets
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from pydantic import AnyHttpUrl, Field, validator
 from pydantic_settings import BaseSettings
@@ -13,6 +13,9 @@ class Settings(BaseSettings):
     VERSION: str = "0.1.0"
     API_V1_STR: str = "/api"
     SECRET_KEY: str = secrets.token_urlsafe(32)
+    # Token the /admin endpoints expect in the X-Admin-Token header. While it
+    # is empty the /admin endpoints refuse every request
+    ADMIN_TOKEN: str = ""
 
     # 60 minutes * 24 hours * 8 days = 8 days
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
@@ -35,15 +38,77 @@ class Settings(BaseSettings):
     DB_NAME: str = "stepin"     # For PostgreSQL
     DB_USER: str = "postgres"   # For PostgreSQL
     DB_PASSWORD: str = "postgres"  # For PostgreSQL
+    # Read replicas as a JSON list: Postgres DSNs, or file paths for SQLite.
+    # Reads are spread over them, writes always go to the primary
+    DB_REPLICA_URLS: List[str] = []
+    # Seconds after a write during which the reads of the same user or
+    # meeting stay on the primary, so they don't miss it on a lagging replica
+    DB_READ_YOUR_WRITES_SECONDS: float = 5.0
+
+    # Log retention settings. The logs are partitioned by time, partitions
+    # older than the retention are archived as gzipped NDJSON, then dropped
+    LOG_PARTITION_DAYS: int = 7
+    LOG_RETENTION_DAYS: int = 90
+    LOG_ARCHIVE_DIR: str = "log_archive"
 
     # Redis settings
     USE_FAKE_REDIS: bool = False
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
+    # Connect to a Redis Cluster, REDIS_HOST:REDIS_PORT being any of its nodes
+    REDIS_CLUSTER: bool = False
+    # Redis URLs of the geo shards, as a JSON list. The meeting positions are
+    # spread over them by the geohash cell (of REDIS_GEO_SHARD_PRECISION
+    # characters) they fall in. Empty keeps them in the main Redis
+    REDIS_GEO_SHARDS: List[str] = []
+    REDIS_GEO_SHARD_PRECISION: int = 3  # cells of about 156km x 156km
+    # Intern emails to integer IDs and store chat messages as msgpack
+    REDIS_COMPACT_ENCODING: bool = False
+    REDIS_SOCKET_TIMEOUT: float = 0.5  # seconds before a Redis command fails
+    REDIS_SOCKET_CONNECT_TIMEOUT: float = 0.5  # seconds before a Redis connection attempt fails
+
+    # Circuit breaker settings
+    BREAKER_FAILURE_THRESHOLD: int = 5  # consecutive Redis failures that open the breaker
+    BREAKER_RESET_TIMEOUT: float = 10.0  # seconds before a trial call is let through
+
+    # Meeting expiry settings
+    MEETING_EXPIRY_GRACE_SECONDS: int = 300  # per-meeting keys expire this long after t2
+    MEETING_SWEEP_INTERVAL: int = 5  # seconds between two sweeps for ended meetings
+    MEETING_STAGING_LEAD_SECONDS: int = 300  # build the Redis keys of a meeting this long before t1
+    INVITATION_INDEX_TTL: int = 86400  # rebuild a user's invitation index from the DB after this long
+    ACTIVE_MEETINGS_CACHE_TTL: float = 2.0  # serve the active meetings from memory for this long
+
+    # Location ingestion settings
+    LOCATION_THROTTLE_SECONDS: float = 2.0  # min time between two accepted pings of a user
+    LOCATION_REFRESH_SECONDS: float = 30.0  # re-evaluate a stationary user after this long
+    LOCATION_MIN_DISTANCE_METERS: float = 5.0  # smaller moves count as duplicates
+    LOCATION_TTL_SECONDS: int = 600  # forget a user's position after this long
+
+    # Rate limiting settings
+    RATE_LIMIT_ENABLED: bool = True
+    # (tokens per second, burst) per route and client, override as JSON: {"nearby": [2, 10]}
+    RATE_LIMITS: Dict[str, Tuple[float, int]] = {
+        "nearby": (2.0, 10),
+        "chat_post": (1.0, 5),
+        "messages": (5.0, 20),
+    }
+    # Addresses/networks of the reverse proxies whose X-Forwarded-For header is
+    # believed, as JSON: ["10.0.0.0/8"]. Without them clients are told apart by
+    # the address of the connection
+    TRUSTED_PROXIES: List[str] = []
+    MAX_CONCURRENT_REQUESTS: int = 64  # per worker process, 0 disables the limit
+    CONCURRENCY_QUEUE_TIMEOUT: float = 0.5  # seconds a request may wait for a slot before a 503
 
     # Application settings
     PORT: int = 8000
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # compress response bodies from this many bytes
+    COMPRESSION_LEVEL: int = 5  # gzip level, higher levels cost a lot more CPU for little gain
+    WEB_CONCURRENCY: int = 1  # number of worker processes serving requests
+
+    # Scheduler settings
+    SCHEDULER_ENABLED: bool = True  # set to False on processes that should never run background jobs
+    SCHEDULER_LOCK_TTL: int = 30  # seconds before another process takes over the jobs of a dead leader
 
     class Config:
         case_sensitive = True
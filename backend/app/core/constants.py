@@ -7,4 +7,35 @@ TIME_OUT = 3
 MAX_MEETING_DISTANCE = 100  # in meters
 
 # Time constants
-MEETING_CHECK_INTERVAL = 60  # seconds
\ No newline at end of file
+MEETING_CHECK_INTERVAL = 60  # seconds
+SYNC_OVERLAP = 5  # seconds an incremental sync looks back before its watermark
+FULL_SYNC_INTERVAL = 3600  # seconds between two full DB <-> Redis reconciles
+DEACTIVATE_CHUNK_SIZE = 500  # keys per pipeline when cleaning up an ended meeting
+
+# Search configurations
+SEARCH_PAGE_SIZE = 20  # results per page of a chat search, by default
+MAX_SEARCH_PAGE_SIZE = 100
+SEARCH_CACHE_SECONDS = 60  # lifetime of the ranked results of a live chat search in Redis
+
+# Message history configurations
+HISTORY_PAGE_SIZE = 50  # messages per page of a user's history, by default
+MAX_HISTORY_PAGE_SIZE = 200
+
+# Analytics configurations
+ANALYTICS_BATCH_SIZE = 5000  # log rows folded into the rollups per transaction
+ANALYTICS_MAX_BATCHES = 20  # batches folded per scheduler tick, the rest waits for the next one
+ANALYTICS_FOLD_LAG = 60  # seconds a log row waits before it is folded, so the rows still being committed are not skipped
+
+# Log configurations
+LOG_FETCH_SIZE = 10000  # rows fetched at a time when streaming the logs out
+
+# Occupancy configurations
+OCCUPANCY_MAX_POINTS = 1440  # points of an occupancy series, longer ranges are downsampled to fit
+
+# Heatmap configurations
+HEATMAP_PRECISION = 6  # finest geohash precision of the heatmap counters, cells of about 1.2km x 0.6km
+HEATMAP_MAX_CELLS = 4096  # cells of a heatmap response, larger boxes get a coarser precision
+
+# Map configurations
+GEOJSON_LIMIT = 500  # meetings of a GeoJSON response, by default
+MAX_GEOJSON_LIMIT = 5000
@@ -0,0 +1,50 @@
+import threading
+from collections import defaultdict
+
+class Metrics:
+    """In-process counters and gauges, every worker process keeps its own"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(int)
+        self.gauge_values = {}
+
+    def incr(self, name, value=1):
+        """Increase a counter"""
+        with self.lock:
+            self.counters[name] += value
+
+    def set_gauge(self, name, value):
+        """Set the current value of a gauge"""
+        with self.lock:
+            self.gauge_values[name] = value
+
+    def snapshot(self):
+        """Get a copy of all the counters"""
+        with self.lock:
+            return dict(self.counters)
+
+    def gauges(self):
+        """Get a copy of all the gauges"""
+        with self.lock:
+            return dict(self.gauge_values)
+
+    def reset(self):
+        """Set all the counters back to zero"""
+        with self.lock:
+            self.counters.clear()
+
+    def not_modified_ratios(self):
+        """Get the share of the requests of every cached endpoint answered with a 304"""
+        counters = self.snapshot()
+        ratios = {}
+        for name, requests in counters.items():
+            if not name.startswith("http_cached_requests."):
+                continue
+            endpoint = name.removeprefix("http_cached_requests.")
+            not_modified = counters.get(f"http_not_modified.{endpoint}", 0)
+            ratios[endpoint] = not_modified / requests if requests else 0.0
+        return ratios
+
+# Create a single instance of the metrics
+metrics = Metrics()
@@ -0,0 +1,163 @@
+import asyncio
+import ipaddress
+
+from fastapi import HTTPException, Request
+from starlette.responses import JSONResponse
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.circuit_breaker import BackendUnavailableError
+from app.services.redis_service import get_redis_manager, get_redis_breaker
+
+# Token bucket, refilled at `rate` tokens per second up to `burst` tokens.
+# The bucket state and the clock both live in Redis, so every worker process
+# shares the same budget. Returns {allowed, milliseconds until a token is back}
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate / 1000)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    allowed = 1
+    tokens = tokens - 1
+else
+    retry_after = math.ceil((1 - tokens) * 1000 / rate)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return {allowed, retry_after}
+"""
+
+
+class RateLimiter:
+    def __init__(self):
+        self.script = None  # registered on first use, so importing opens no connections
+
+    def _get_script(self):
+        if self.script is None:
+            self.script = get_redis_manager().redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+        return self.script
+
+    def hit(self, key, rate, burst):
+        """
+        Take a token from a bucket. Returns (allowed, seconds to wait before
+        the next token).
+        """
+        allowed, retry_after = self._get_script()(keys=[key], args=[rate, burst])
+        return bool(allowed), retry_after / 1000
+
+
+# Create a single instance of the rate limiter
+rate_limiter = RateLimiter()
+
+
+def _is_trusted_proxy(address):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in ipaddress.ip_network(proxy, strict=False) for proxy in settings.TRUSTED_PROXIES)
+
+
+def _client_identity(request: Request):
+    """
+    The address of the client. X-Forwarded-For is only believed when the
+    request comes from one of the TRUSTED_PROXIES, and then the client is the
+    right-most address that is not a trusted proxy itself, since everything
+    left of it could have been made up by the client.
+    """
+    address = request.client.host if request.client else "unknown"
+    if _is_trusted_proxy(address):
+        forwarded = [a.strip() for a in request.headers.get("x-forwarded-for", "").split(",") if a.strip()]
+        while forwarded:
+            address = forwarded.pop()
+            if not _is_trusted_proxy(address):
+                break
+    return f"ip:{address}"
+
+
+def enforce_rate_limit(route, request: Request):
+    """
+    Take a token from the bucket of the client on a route, with the
+    (rate, burst) configured for it in RATE_LIMITS. Raises a 429 when the
+    bucket is empty.
+    """
+    if not settings.RATE_LIMIT_ENABLED or route not in settings.RATE_LIMITS:
+        return
+
+    rate, burst = settings.RATE_LIMITS[route]
+    key = f"rate_limit:{route}:{_client_identity(request)}"
+    try:
+        allowed, retry_after = get_redis_breaker().call(rate_limiter.hit, key, rate, burst)
+    except BackendUnavailableError:
+        # a Redis failure must not take the endpoints down with it
+        metrics.incr(f"rate_limit_skipped.{route}")
+        return
+
+    if not allowed:
+        metrics.incr(f"rate_limited.{route}")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, please slow down",
+            headers={"Retry-After": str(max(1, round(retry_after)))}
+        )
+
+
+def rate_limit(route):
+    """
+    Dependency that throttles a route per client, see enforce_rate_limit.
+    """
+    def check_rate_limit(request: Request):
+        enforce_rate_limit(route, request)
+
+    return check_rate_limit
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Admission control for the API: a request waits at most
+    CONCURRENCY_QUEUE_TIMEOUT seconds for one of the MAX_CONCURRENT_REQUESTS
+    slots of the process, then it is rejected with a 503.
+    """
+
+    def __init__(self, app, max_requests, queue_timeout, path_prefix=""):
+        self.app = app
+        self.max_requests = max_requests
+        self.queue_timeout = queue_timeout
+        self.path_prefix = path_prefix
+        self.semaphore = None  # created inside the event loop
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or self.max_requests <= 0
+                or not scope["path"].startswith(self.path_prefix)):
+            await self.app(scope, receive, send)
+            return
+
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_requests)
+
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            metrics.incr("shed_requests")
+            response = JSONResponse(
+                {"detail": "Server is busy, please retry"},
+                status_code=503,
+                headers={"Retry-After": "1"}
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.semaphore.release()
@@ -1,33 +1,44 @@
+import os
 import time
+import uuid
+import socket
 import threading
 from datetime import datetime
 
-from app.services.meeting_service import MeetingService
-from app.core.constants import TIME_OUT
+from app.services.meeting_service import get_meeting_service
+from app.services.analytics_service import get_analytics_service
+from app.services.log_service import get_log_service
+from app.services.redis_service import get_redis_breaker
+from app.core.config import settings
+from app.core.constants import TIME_OUT, MEETING_CHECK_INTERVAL
 
 class MeetingScheduler:
-    def __init__(self, scan_interval=60):
-        self.meeting_service = MeetingService()
+    def __init__(self, scan_interval=MEETING_CHECK_INTERVAL, sweep_interval=settings.MEETING_SWEEP_INTERVAL):
+        self.meeting_service = None  # created on start, so importing opens no connections
         self.scan_interval = scan_interval
+        self.sweep_interval = sweep_interval
         self.running = False
+        self.stop_event = threading.Event()
         self.scheduler_thread = None
 
+        # With several worker processes only the one holding the lock runs the jobs
+        self.owner = None
+        self.is_leader = False
+
     def start(self):
         """Start the meeting scheduler"""
-        if self.running:
+        if self.running or not settings.SCHEDULER_ENABLED:
             return False
 
         self.running = True
-        try:
-            # Perform an initial scan
-            self._scan_meetings()
+        self.stop_event.clear()
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
 
-            # Start the scheduler thread
-            self.scheduler_thread = threading.Thread(target=self._scheduler_loop)
-            self.scheduler_thread.daemon = True
-            self.scheduler_thread.start()
-        except Exception as e:
-            print(f"Error in initial scan: {e}")
+        # Start the scheduler thread, the initial scan runs in it so it
+        # doesn't delay the startup
+        self.scheduler_thread = threading.Thread(target=self._scheduler_loop)
+        self.scheduler_thread.daemon = True
+        self.scheduler_thread.start()
 
         return True
 
@@ -37,26 +48,125 @@ class MeetingScheduler:
             return False
 
         self.running = False
+        self.stop_event.set()  # wake the loop up instead of waiting for the sleep
         if self.scheduler_thread:
             self.scheduler_thread.join(timeout=10)
+
+        # let another process take over right away
+        if self.is_leader:
+            try:
+                self._get_meeting_service().redis_mgr.release_scheduler_lock(self.owner)
+            except Exception as e:
+                print(f"Error releasing scheduler lock: {e}")
+            self.is_leader = False
         return True
 
     def _scheduler_loop(self):
         """Main scheduler loop"""
+        last_scan = None
         while self.running:
             try:
-                self._scan_meetings()
+                if self._elect_leader():
+                    # staged meetings go live and ended meetings are swept
+                    # often, the full sync runs less frequently
+                    self._promote_meetings()
+                    self._sweep_meetings()
+                    self._fold_analytics()
+                    if (last_scan is None or time.monotonic() - last_scan >= self.scan_interval
+                            or self._is_resync_requested()):
+                        last_scan = time.monotonic()
+                        self._scan_meetings()
+                        self._maintain_logs()
+                else:
+                    last_scan = None  # do a full scan as soon as we take over
             except Exception as e:
                 print(f"Error in scheduler loop: {e}")
-            time.sleep(self.scan_interval)
+                if isinstance(e, get_redis_breaker().exceptions):
+                    # the writes skipped meanwhile are caught up by a full sync, as soon as Redis is back
+                    self._get_meeting_service().request_resync()
+
+            if self.stop_event.wait(self._next_wait()):
+                break
+
+    def _next_wait(self):
+        """Seconds until the next tick, waking up early for the next staged meeting"""
+        if not self.is_leader:
+            return self.sweep_interval
+
+        try:
+            next_start = self._get_meeting_service().redis_mgr.get_next_staged_start()
+        except Exception as e:
+            print(f"Error reading the staged meetings: {e}")
+            return self.sweep_interval
+
+        if next_start is None or next_start <= time.time():
+            return self.sweep_interval
+        return min(self.sweep_interval, next_start - time.time())
+
+    def _elect_leader(self):
+        """Acquire or renew the scheduler lock, return whether this process holds it"""
+        redis_mgr = self._get_meeting_service().redis_mgr
+        is_leader = redis_mgr.acquire_scheduler_lock(self.owner, settings.SCHEDULER_LOCK_TTL)
+
+        if is_leader != self.is_leader:
+            print(f"Scheduler {self.owner} {'is now' if is_leader else 'is no longer'} running the background jobs")
+        self.is_leader = is_leader
+        return is_leader
+
+    def _get_meeting_service(self):
+        """Get the meeting service, connecting to the backends on first use"""
+        if self.meeting_service is None:
+            self.meeting_service = get_meeting_service()
+        return self.meeting_service
 
     def _scan_meetings(self):
-        """Scan database for meetings to activate or deactivate"""
+        """Scan database for meetings to activate, deactivate or stage"""
         try:
-            self.meeting_service.sync_meetings()
+            self._get_meeting_service().sync_meetings()
         except Exception as e:
             print(f"Error scanning meetings: {e}")
 
+        try:
+            self._get_meeting_service().stage_upcoming_meetings()
+        except Exception as e:
+            print(f"Error staging meetings: {e}")
+
+    def _is_resync_requested(self):
+        """Whether a process asked for a full sync, after Redis missed some of its writes"""
+        try:
+            return self._get_meeting_service().is_resync_requested()
+        except Exception as e:
+            print(f"Error reading the sync requests: {e}")
+            return False
+
+    def _promote_meetings(self):
+        """Make the staged meetings whose t1 has passed live"""
+        try:
+            self._get_meeting_service().promote_staged_meetings()
+        except Exception as e:
+            print(f"Error promoting meetings: {e}")
+
+    def _sweep_meetings(self):
+        """End the meetings whose t2 has passed"""
+        try:
+            self._get_meeting_service().sweep_expired_meetings()
+        except Exception as e:
+            print(f"Error sweeping meetings: {e}")
+
+    def _fold_analytics(self):
+        """Fold the new log rows into the attendance rollups"""
+        try:
+            get_analytics_service().fold_logs()
+        except Exception as e:
+            print(f"Error folding analytics: {e}")
+
+    def _maintain_logs(self):
+        """Create the upcoming log partitions, archive and drop the expired ones"""
+        try:
+            get_log_service().maintain_partitions()
+        except Exception as e:
+            print(f"Error maintaining the log partitions: {e}")
+
     def scan_now(self):
         """Manually trigger a scan for testing"""
         self._scan_meetings()
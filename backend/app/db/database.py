@@ -1,34 +1,148 @@
 import os
+import time
 import sqlite3
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import uuid
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime, timezone
 
 from app.core.config import settings
+from app.core.constants import LOG_FETCH_SIZE
+from app.utils.text_utils import tokenize
+from app.utils.time_utils import to_timestamp
+
+def _utc_datetime(ts):
+    """Naive UTC datetime of epoch second `ts`, the way log timestamps are stored"""
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+def _chunked(rows, size):
+    """Group an iterator of rows into lists of at most `size` row dicts"""
+    rows = iter(rows)
+    while True:
+        chunk = [dict(row) for row in itertools.islice(rows, size)]
+        if not chunk:
+            return
+        yield chunk
+
+# Set once the current request (or thread) has written, its later reads use the primary
+_wrote_in_context = ContextVar("wrote_in_context", default=False)
+
+# Marks of the users/meetings written recently, shared by all the worker
+# processes, see set_write_marks
+_write_marks = None
+
+def set_write_marks(write_marks):
+    """
+    Share the marks of the users/meetings written recently between processes.
+    `write_marks` has a `mark(keys, seconds)` method that marks them for
+    `seconds`, and a `has_any(keys)` one that tells whether any of them is
+    marked. Without it only the request that wrote reads its writes back.
+    """
+    global _write_marks
+    _write_marks = write_marks
 
 class Database:
     def __init__(self):
         # Check if we're using PostgreSQL or SQLite
         self.use_postgres = settings.USE_POSTGRES
 
+        # Connections of the current thread by URL (None for the primary). The
+        # requests run in the threadpool, every thread keeps its own connections
+        # so their transactions never mix
+        self.local = threading.local()
+
+        # Read replicas, used in turn
+        self.replicas = list(settings.DB_REPLICA_URLS)
+        self.next_replica = itertools.cycle(self.replicas)
+
+        # (name, start, end) of the known log partitions, see get_log_partitions
+        self.log_partitions = []
+
+        self.lock = threading.Lock()
+
+    def _connect(self, url=None):
+        """Connect to the primary, or to the replica at `url`"""
         if self.use_postgres:
-            # PostgreSQL connection
-            self.conn = psycopg2.connect(
-                host=settings.DB_HOST,
-                database=settings.DB_NAME,
-                user=settings.DB_USER,
-                password=settings.DB_PASSWORD,
-                cursor_factory=RealDictCursor
-            )
+            # imported on demand, SQLite setups don't need the driver
+            import psycopg2
+            from psycopg2.extras import RealDictCursor
+
+            if url is None:
+                # PostgreSQL connection
+                return psycopg2.connect(
+                    host=settings.DB_HOST,
+                    database=settings.DB_NAME,
+                    user=settings.DB_USER,
+                    password=settings.DB_PASSWORD,
+                    cursor_factory=RealDictCursor
+                )
+
+            conn = psycopg2.connect(url, cursor_factory=RealDictCursor)
+            # every read sees the latest replicated state, no transaction is kept open
+            conn.autocommit = True
+            return conn
         else:
             # SQLite connection
-            self.conn = sqlite3.connect(
-                settings.DB_PATH,
+            conn = sqlite3.connect(
+                url or settings.DB_PATH,
                 check_same_thread=False
             )
-            self.conn.row_factory = sqlite3.Row
+            conn.row_factory = sqlite3.Row
+            return conn
+
+    @property
+    def conn(self):
+        """Primary connection of the current thread, for the writes and the reads that can't lag behind"""
+        return self._thread_conn(None)
+
+    def _thread_conn(self, url):
+        """Connection of the current thread to the primary (None) or the replica at `url`"""
+        conns = getattr(self.local, "conns", None)
+        if conns is None:
+            conns = self.local.conns = {}
+
+        conn = conns.get(url)
+        if conn is not None and self.use_postgres:
+            from psycopg2.extensions import TRANSACTION_STATUS_INERROR
+
+            if conn.closed:
+                conn = None
+            elif conn.get_transaction_status() == TRANSACTION_STATUS_INERROR:
+                conn.rollback()  # a statement of an earlier call failed, don't fail this one with it
+        if conn is None:
+            conn = conns[url] = self._connect(url)
+        return conn
+
+    def _mark_written(self, *keys):
+        """
+        Record a write of the current request, and of the given users/meetings
+        ("user:<email>", "meeting:<id>"), so the reads that follow it are not
+        served by a lagging replica.
+        """
+        if not self.replicas:
+            return
+
+        _wrote_in_context.set(True)
+        if keys and _write_marks is not None:
+            _write_marks.mark(keys, settings.DB_READ_YOUR_WRITES_SECONDS)
 
-        self.create_tables()
+    def _read_url(self, *keys):
+        """URL of the replica for a read about the given users/meetings, None for the primary"""
+        if not self.replicas or _wrote_in_context.get():
+            return None
+
+        if keys and _write_marks is not None and _write_marks.has_any(keys):
+            return None
+
+        with self.lock:
+            return next(self.next_replica)
+
+    def _read_conn(self, *keys):
+        """The connection for a read about the given users/meetings"""
+        return self._thread_conn(self._read_url(*keys))
 
     def create_tables(self):
         """Create database tables if they don't exist"""
@@ -60,33 +174,139 @@ class Database:
                     t2 TIMESTAMP WITH TIME ZONE NOT NULL,
                     lat FLOAT NOT NULL,
                     long FLOAT NOT NULL,
-                    participants TEXT NOT NULL
+                    participants TEXT NOT NULL,
+                    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
                 )
             """)
 
-            # Create log table
+            # Change tracking for incremental syncs, on tables created before it existed
+            cur.execute("""
+                ALTER TABLE meetings
+                ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS meetings_t1_idx ON meetings (t1)")
+            cur.execute("CREATE INDEX IF NOT EXISTS meetings_t2_idx ON meetings (t2)")
+            cur.execute("CREATE INDEX IF NOT EXISTS meetings_updated_at_idx ON meetings (updated_at)")
+
+            # Create log table, partitioned by time. A log table from before the
+            # partitioning becomes the partition of everything up to the end
+            # of the current period
+            cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('logs')")
+            existing = cur.fetchone()
+            legacy = existing is not None and existing["relkind"] == "r"
+            if legacy:
+                cur.execute("ALTER TABLE logs RENAME TO logs_legacy")
+                cur.execute("ALTER INDEX logs_pkey RENAME TO logs_legacy_pkey")
+
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS logs (
-                    id SERIAL PRIMARY KEY,
+                    id BIGSERIAL,
+                    email VARCHAR(255) NOT NULL,
+                    meeting_id INTEGER NOT NULL,
+                    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    action SMALLINT NOT NULL CHECK (action IN (1, 2, 3)),
+                    PRIMARY KEY (id, timestamp)
+                ) PARTITION BY RANGE (timestamp)
+            """)
+            # created on every partition, for the lookups of a meeting or user in a time window
+            cur.execute("CREATE INDEX IF NOT EXISTS logs_meeting_idx ON logs (meeting_id, timestamp)")
+            cur.execute("CREATE INDEX IF NOT EXISTS logs_email_idx ON logs (email, timestamp)")
+
+            # Time range of each log partition, in epoch seconds (no start for the legacy one)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS log_partitions (
+                    name VARCHAR(64) PRIMARY KEY,
+                    period_start DOUBLE PRECISION,
+                    period_end DOUBLE PRECISION NOT NULL
+                )
+            """)
+
+            if legacy:
+                end = self.log_period(time.time())[1]
+                cur.execute("UPDATE logs_legacy SET timestamp = CURRENT_TIMESTAMP WHERE timestamp IS NULL")
+                cur.execute("ALTER TABLE logs_legacy ALTER COLUMN timestamp SET NOT NULL, ALTER COLUMN id TYPE BIGINT")
+                cur.execute(
+                    "ALTER TABLE logs ATTACH PARTITION logs_legacy FOR VALUES FROM (MINVALUE) TO (%s)",
+                    (_utc_datetime(end),)
+                )
+                cur.execute(
+                    "SELECT setval(pg_get_serial_sequence('logs', 'id'),"
+                    " (SELECT COALESCE(MAX(id), 0) + 1 FROM logs_legacy), false)"
+                )
+                cur.execute(
+                    "INSERT INTO log_partitions (name, period_start, period_end) VALUES ('logs_legacy', NULL, %s)",
+                    (end,)
+                )
+
+            # Attendance rollups, folded from the logs incrementally. Times are
+            # epoch seconds, `joined_at` is set while the user is in the meeting
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS attendance_rollups (
+                    meeting_id INTEGER NOT NULL,
                     email VARCHAR(255) NOT NULL,
+                    seconds_present DOUBLE PRECISION NOT NULL DEFAULT 0,
+                    sessions INTEGER NOT NULL DEFAULT 0,
+                    first_join DOUBLE PRECISION,
+                    join_latency DOUBLE PRECISION,
+                    joined_at DOUBLE PRECISION,
+                    PRIMARY KEY (meeting_id, email)
+                )
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS attendance_rollups_email_idx ON attendance_rollups (email)")
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS meeting_rollups (
+                    meeting_id INTEGER PRIMARY KEY,
+                    attendance INTEGER NOT NULL DEFAULT 0,
+                    peak_attendance INTEGER NOT NULL DEFAULT 0,
+                    peak_at DOUBLE PRECISION,
+                    joins INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+
+            # Last log ID folded into the rollups
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS analytics_state (
+                    name VARCHAR(64) PRIMARY KEY,
+                    watermark BIGINT NOT NULL
+                )
+            """)
+
+            # Syncs requested by any process, for the scheduler leader to run
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS sync_requests (
+                    name VARCHAR(64) PRIMARY KEY,
+                    requested_at DOUBLE PRECISION NOT NULL
+                )
+            """)
+
+            # Per-minute occupancy of the ended meetings, flushed from Redis.
+            # `minute` is in epoch seconds, `occupancy` is the one the minute closed with
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS meeting_occupancy (
                     meeting_id INTEGER NOT NULL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    action SMALLINT NOT NULL CHECK (action IN (1, 2, 3))
+                    minute BIGINT NOT NULL,
+                    peak INTEGER NOT NULL,
+                    occupancy INTEGER NOT NULL,
+                    PRIMARY KEY (meeting_id, minute)
                 )
             """)
 
-            # Create chat messages table
-            # cur.execute("""
-            #     CREATE TABLE IF NOT EXISTS chat_messages (
-            #         id SERIAL PRIMARY KEY,
-            #         meeting_id INTEGER NOT NULL,
-            #         email VARCHAR(255) NOT NULL,
-            #         message TEXT NOT NULL,
-            #         timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            #         FOREIGN KEY (meeting_id) REFERENCES meetings(meeting_id),
-            #         FOREIGN KEY (email) REFERENCES users(email)
-            #     )
-            # """)
+            # Create chat messages table, the chats of ended meetings are archived here
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS chat_messages (
+                    meeting_id INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    email VARCHAR(255) NOT NULL,
+                    message TEXT NOT NULL,
+                    timestamp TIMESTAMP NOT NULL,
+                    search_text TEXT NOT NULL,
+                    search_vector TSVECTOR GENERATED ALWAYS AS (to_tsvector('simple', search_text)) STORED,
+                    PRIMARY KEY (meeting_id, position)
+                )
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS chat_messages_search_idx ON chat_messages USING GIN (search_vector)")
+            # the history of a user, newest first
+            cur.execute("CREATE INDEX IF NOT EXISTS chat_messages_email_idx ON chat_messages (email, timestamp, meeting_id, position)")
 
             self.conn.commit()
 
@@ -113,36 +333,146 @@ class Database:
                     t2 TIMESTAMP NOT NULL,
                     lat REAL NOT NULL,
                     long REAL NOT NULL,
-                    participants TEXT NOT NULL
+                    participants TEXT NOT NULL,
+                    updated_at TIMESTAMP
                 )
             """)
 
-            # Create log table
+            # Change tracking for incremental syncs, on tables created before it existed
+            columns = [row["name"] for row in self.conn.execute("PRAGMA table_info(meetings)")]
+            if "updated_at" not in columns:
+                self.conn.execute("ALTER TABLE meetings ADD COLUMN updated_at TIMESTAMP")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS meetings_t1_idx ON meetings (t1)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS meetings_t2_idx ON meetings (t2)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS meetings_updated_at_idx ON meetings (updated_at)")
+
+            # Logs are kept in rolling tables, one per period, and read through
+            # the `logs` view. A log table from before the partitioning becomes
+            # the partition of everything up to the end of the current period
+            legacy = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'logs'"
+            ).fetchone() is not None
+            if legacy:
+                self.conn.execute("ALTER TABLE logs RENAME TO logs_legacy")
+
+            # Time range of each log partition, in epoch seconds (no start for the legacy one)
             self.conn.execute("""
-                CREATE TABLE IF NOT EXISTS logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                CREATE TABLE IF NOT EXISTS log_partitions (
+                    name TEXT PRIMARY KEY,
+                    period_start REAL,
+                    period_end REAL NOT NULL
+                )
+            """)
+
+            # Last log ID handed out, the IDs keep growing across the partitions
+            self.conn.execute("CREATE TABLE IF NOT EXISTS log_sequence (id INTEGER NOT NULL)")
+            if self.conn.execute("SELECT 1 FROM log_sequence").fetchone() is None:
+                last_id = 0
+                if legacy:
+                    last_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) AS id FROM logs_legacy").fetchone()["id"]
+                self.conn.execute("INSERT INTO log_sequence (id) VALUES (?)", (last_id,))
+
+            if legacy:
+                self.conn.execute(
+                    "INSERT INTO log_partitions (name, period_start, period_end) VALUES ('logs_legacy', NULL, ?)",
+                    (self.log_period(time.time())[1],)
+                )
+                self._index_log_partition_sqlite("logs_legacy")
+            self._create_logs_view_sqlite()
+
+            # Attendance rollups, folded from the logs incrementally. Times are
+            # epoch seconds, `joined_at` is set while the user is in the meeting
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS attendance_rollups (
+                    meeting_id INTEGER NOT NULL,
                     email TEXT NOT NULL,
+                    seconds_present REAL NOT NULL DEFAULT 0,
+                    sessions INTEGER NOT NULL DEFAULT 0,
+                    first_join REAL,
+                    join_latency REAL,
+                    joined_at REAL,
+                    PRIMARY KEY (meeting_id, email)
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS attendance_rollups_email_idx ON attendance_rollups (email)")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS meeting_rollups (
+                    meeting_id INTEGER PRIMARY KEY,
+                    attendance INTEGER NOT NULL DEFAULT 0,
+                    peak_attendance INTEGER NOT NULL DEFAULT 0,
+                    peak_at REAL,
+                    joins INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+
+            # Last log ID folded into the rollups
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS analytics_state (
+                    name TEXT PRIMARY KEY,
+                    watermark INTEGER NOT NULL
+                )
+            """)
+
+            # Syncs requested by any process, for the scheduler leader to run
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS sync_requests (
+                    name TEXT PRIMARY KEY,
+                    requested_at REAL NOT NULL
+                )
+            """)
+
+            # Per-minute occupancy of the ended meetings, flushed from Redis.
+            # `minute` is in epoch seconds, `occupancy` is the one the minute closed with
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS meeting_occupancy (
                     meeting_id INTEGER NOT NULL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    action INTEGER NOT NULL
+                    minute INTEGER NOT NULL,
+                    peak INTEGER NOT NULL,
+                    occupancy INTEGER NOT NULL,
+                    PRIMARY KEY (meeting_id, minute)
                 )
             """)
 
-            # Create chat messages table
-            # self.conn.execute("""
-            #     CREATE TABLE IF NOT EXISTS chat_messages (
-            #         id INTEGER PRIMARY KEY AUTOINCREMENT,
-            #         meeting_id INTEGER NOT NULL,
-            #         email TEXT NOT NULL,
-            #         message TEXT NOT NULL,
-            #         timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            #         FOREIGN KEY (meeting_id) REFERENCES meetings(meeting_id),
-            #         FOREIGN KEY (email) REFERENCES users(email)
-            #     )
-            # """)
+            # Create chat messages table, the chats of ended meetings are archived here
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS chat_messages (
+                    meeting_id INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    email TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    timestamp TIMESTAMP NOT NULL,
+                    search_text TEXT NOT NULL,
+                    PRIMARY KEY (meeting_id, position)
+                )
+            """)
+            # the history of a user, newest first
+            self.conn.execute("CREATE INDEX IF NOT EXISTS chat_messages_email_idx ON chat_messages (email, timestamp, meeting_id, position)")
+
+            # Full-text index of the archived messages, kept up to date by triggers.
+            # The meeting ID is indexed too, so a search within one meeting only
+            # walks the postings of that meeting
+            self.conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS chat_messages_fts USING fts5(
+                    search_text, meeting_id,
+                    content='chat_messages', content_rowid='rowid'
+                )
+            """)
+            self.conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS chat_messages_fts_insert AFTER INSERT ON chat_messages BEGIN
+                    INSERT INTO chat_messages_fts (rowid, search_text, meeting_id)
+                    VALUES (new.rowid, new.search_text, new.meeting_id);
+                END
+            """)
+            self.conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS chat_messages_fts_delete AFTER DELETE ON chat_messages BEGIN
+                    INSERT INTO chat_messages_fts (chat_messages_fts, rowid, search_text, meeting_id)
+                    VALUES ('delete', old.rowid, old.search_text, old.meeting_id);
+                END
+            """)
 
     def add_user(self, email, name, age, gender):
         """Add a new user to the database"""
+        self._mark_written(f"user:{email}")
         if self.use_postgres:
             with self.conn.cursor() as cur:
                 cur.execute(
@@ -159,6 +489,8 @@ class Database:
 
     def delete_user(self, email):
         """Delete a user from the database"""
+        self._mark_written(f"user:{email}")
+
         # First check if the user exists
         user = self.get_user(email)
         if not user:
@@ -180,15 +512,16 @@ class Database:
 
     def get_user(self, email):
         """Get user details by email"""
+        conn = self._read_conn(f"user:{email}")
         if self.use_postgres:
-            with self.conn.cursor() as cur:
+            with conn.cursor() as cur:
                 cur.execute("SELECT * FROM users WHERE email = %s", (email,))
                 user = cur.fetchone()
                 if user:
                     return dict(user)
                 return None
         else:
-            cursor = self.conn.cursor()
+            cursor = conn.cursor()
             cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
             user = cursor.fetchone()
             if user:
@@ -212,34 +545,44 @@ class Database:
                 )
                 meeting_id = cur.fetchone()["meeting_id"]
                 self.conn.commit()
-                return meeting_id
         else:
             cursor = self.conn.cursor()
             with self.conn:
                 cursor.execute(
                     """INSERT INTO meetings
-                       (title, description, t1, t2, lat, long, participants)
-                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                    (title, description, t1, t2, lat, long, participants)
+                       (title, description, t1, t2, lat, long, participants, updated_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (title, description, t1, t2, lat, long, participants, datetime.now(timezone.utc))
                 )
-                return cursor.lastrowid
+                meeting_id = cursor.lastrowid
+
+        self._mark_written(f"meeting:{meeting_id}", *self._participant_keys(participants))
+        return meeting_id
+
+    def _participant_keys(self, participants):
+        return [f"user:{email.strip()}" for email in participants.split(",") if email.strip()]
 
     def delete_meeting(self, meeting_id):
         """Delete a meeting from the database"""
+        self._mark_written(f"meeting:{meeting_id}")
+
         # First check if the meeting exists
         meeting = self.get_meeting(meeting_id)
         if not meeting:
             return None
+        self._mark_written(*self._participant_keys(meeting["participants"]))
 
         try:
             if self.use_postgres:
                 with self.conn.cursor() as cur:
-                    # Delete the meeting
+                    # Delete the meeting and its archived chat
                     cur.execute("DELETE FROM meetings WHERE meeting_id = %s", (meeting_id,))
+                    cur.execute("DELETE FROM chat_messages WHERE meeting_id = %s", (meeting_id,))
                     self.conn.commit()
             else:
                 with self.conn:
                     self.conn.execute("DELETE FROM meetings WHERE meeting_id = ?", (meeting_id,))
+                    self.conn.execute("DELETE FROM chat_messages WHERE meeting_id = ?", (meeting_id,))
             return True
         except Exception as e:
             print(f"Error deleting meeting: {e}")
@@ -249,8 +592,9 @@ class Database:
         """
         Return all meetings where participants column contains the email.
         """
+        conn = self._read_conn(f"user:{email}")
         if self.use_postgres:
-            with self.conn.cursor() as cur:
+            with conn.cursor() as cur:
                 cur.execute(
                     "SELECT meeting_id, title, description, t1, t2, lat, long, participants"
                     " FROM meetings"
@@ -259,7 +603,7 @@ class Database:
                 )
                 return [dict(row) for row in cur.fetchall()]
         else:
-            cursor = self.conn.cursor()
+            cursor = conn.cursor()
             cursor.execute(
                 "SELECT meeting_id, title, description, t1, t2, lat, long, participants"
                 " FROM meetings"
@@ -283,15 +627,16 @@ class Database:
 
     def get_meeting(self, meeting_id):
         """Get meeting details by ID"""
+        conn = self._read_conn(f"meeting:{meeting_id}")
         if self.use_postgres:
-            with self.conn.cursor() as cur:
+            with conn.cursor() as cur:
                 cur.execute("SELECT * FROM meetings WHERE meeting_id = %s", (meeting_id,))
                 meeting = cur.fetchone()
                 if meeting:
                     return dict(meeting)
                 return None
         else:
-            cursor = self.conn.cursor()
+            cursor = conn.cursor()
             cursor.execute("SELECT * FROM meetings WHERE meeting_id = ?", (meeting_id,))
             meeting = cursor.fetchone()
             if meeting:
@@ -307,15 +652,20 @@ class Database:
                 }
             return None
 
-    def get_active_meetings(self):
-        """Get list of active meeting IDs"""
+    def get_active_meetings(self, primary=False):
+        """
+        Get list of active meeting IDs. The background jobs act on the result,
+        so they read it from the `primary`, a lagging replica would miss
+        the newest meetings.
+        """
         current_time = datetime.now(timezone.utc)#.isoformat()
         print(f"Current time for active meetings check: {current_time}")
 
         # We'll extend meeting activation for 2 hours after creation
         # by using only t1 for "active" status check
+        conn = self.conn if primary else self._read_conn()
         if self.use_postgres:
-            with self.conn.cursor() as cur:
+            with conn.cursor() as cur:
                 cur.execute(
                     """SELECT meeting_id FROM meetings
                     WHERE t1 <= %s AND t2 >= %s""",
@@ -325,7 +675,7 @@ class Database:
                 print(f"PostgreSQL active meetings: {result}")
                 return result
         else:
-            cursor = self.conn.cursor()
+            cursor = conn.cursor()
             cursor.execute(
                 """SELECT meeting_id, title, t1, t2 FROM meetings
                 WHERE t1 <= ? AND t2 >= ?""",
@@ -341,24 +691,711 @@ class Database:
             print(f"SQLite active meetings: {result}")
             return result
 
+    def get_meetings(self, meeting_ids, primary=False):
+        """Get the details of many meetings in a single query, from the `primary` if set"""
+        if not meeting_ids:
+            return []
+
+        conn = self.conn if primary else self._read_conn(*(f"meeting:{meeting_id}" for meeting_id in meeting_ids))
+        if self.use_postgres:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT * FROM meetings WHERE meeting_id = ANY(%s)",
+                    (list(meeting_ids),)
+                )
+                return [dict(row) for row in cur.fetchall()]
+        else:
+            placeholders = ", ".join("?" for _ in meeting_ids)
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT * FROM meetings WHERE meeting_id IN ({placeholders})",
+                list(meeting_ids)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_upcoming_meetings(self, now, until):
+        """Get the IDs of the meetings that start after `now` and no later than `until`"""
+        if self.use_postgres:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    "SELECT meeting_id FROM meetings WHERE t1 > %s AND t1 <= %s",
+                    (now, until)
+                )
+                return [row["meeting_id"] for row in cur.fetchall()]
+        else:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "SELECT meeting_id FROM meetings WHERE t1 > ? AND t1 <= ?",
+                (now, until)
+            )
+            return [row["meeting_id"] for row in cursor.fetchall()]
+
+    def get_invitations(self, now, email=None):
+        """
+        Get the (meeting_id, t2, participants) of the meetings that have not
+        ended yet, only the ones that mention `email` if it is given.
+        """
+        query = "SELECT meeting_id, t2, participants FROM meetings WHERE t2 > {p}"
+        params = [now]
+        if email is not None:
+            # prefilter only, the caller matches the exact emails
+            query += " AND participants LIKE {p}"
+            params.append(f"%{email}%")
+
+        # the full warm-up of the invitation indexes must not miss recent meetings
+        conn = self._read_conn(f"user:{email}") if email is not None else self.conn
+        if self.use_postgres:
+            with conn.cursor() as cur:
+                cur.execute(query.format(p="%s"), params)
+                return [(row["meeting_id"], row["t2"], row["participants"]) for row in cur.fetchall()]
+        else:
+            cursor = conn.cursor()
+            cursor.execute(query.format(p="?"), params)
+            return [(row["meeting_id"], row["t2"], row["participants"]) for row in cursor.fetchall()]
+
+    def get_meeting_changes(self, since, now):
+        """
+        Get the meetings that started, ended or were modified between `since`
+        and `now`, as a list of (meeting_id, is_active) tuples.
+        """
+        query = """
+            SELECT meeting_id, (t1 <= {p} AND t2 >= {p}) AS is_active FROM meetings
+            WHERE (t1 > {p} AND t1 <= {p})
+               OR (t2 >= {p} AND t2 < {p})
+               OR updated_at > {p}
+        """
+        params = (now, now, since, now, since, now, since)
+
+        if self.use_postgres:
+            with self.conn.cursor() as cur:
+                cur.execute(query.format(p="%s"), params)
+                return [(row["meeting_id"], row["is_active"]) for row in cur.fetchall()]
+        else:
+            cursor = self.conn.cursor()
+            cursor.execute(query.format(p="?"), params)
+            return [(row["meeting_id"], bool(row["is_active"])) for row in cursor.fetchall()]
+
     def log_action(self, email, meeting_id, action):
         """Log a user action for a meeting"""
+        return self.log_actions([(email, meeting_id, action)])
+
+    def log_actions(self, actions):
+        """Log many (email, meeting_id, action) rows in a single statement"""
+        if not actions:
+            return True
+
+        # the rows are stamped here, so they land in the partition that was checked for
+        now = time.time()
+        partition = self.ensure_log_partition(now)
+        timestamp = _utc_datetime(now)
+
         if self.use_postgres:
+            from psycopg2.extras import execute_values
+
             with self.conn.cursor() as cur:
-                cur.execute(
-                    "INSERT INTO logs (email, meeting_id, action) VALUES (%s, %s, %s)",
-                    (email, meeting_id, action)
+                execute_values(
+                    cur,
+                    "INSERT INTO logs (email, meeting_id, action, timestamp) VALUES %s",
+                    [(*action, timestamp) for action in actions]
                 )
                 self.conn.commit()
                 return True
         else:
             with self.conn:
+                # the IDs are taken from the shared sequence while holding the write lock
+                self.conn.execute("UPDATE log_sequence SET id = id + ?", (len(actions),))
+                last_id = self.conn.execute("SELECT id FROM log_sequence").fetchone()["id"]
+                first_id = last_id - len(actions) + 1
+                self.conn.executemany(
+                    f"INSERT INTO {partition} (id, email, meeting_id, action, timestamp) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (first_id + i, *action, timestamp.isoformat(" "))
+                        for i, action in enumerate(actions)
+                    ]
+                )
+                return True
+
+    # Log partitions
+
+    def log_period(self, ts):
+        """(start, end) epoch seconds of the partition period of `ts`"""
+        period = settings.LOG_PARTITION_DAYS * 86400
+        start = ts // period * period
+        return start, start + period
+
+    def get_log_partitions(self):
+        """Get the (name, start, end) of the log partitions, oldest first"""
+        rows = self._fetch_log_partitions()
+        self.log_partitions = [(row["name"], row["period_start"], row["period_end"]) for row in rows]
+        return self.log_partitions
+
+    def _fetch_log_partitions(self):
+        query = "SELECT name, period_start, period_end FROM log_partitions ORDER BY period_end"
+        if self.use_postgres:
+            with self.conn.cursor() as cur:
+                cur.execute(query)
+                rows = cur.fetchall()
+                self.conn.commit()
+                return rows
+        return self.conn.execute(query).fetchall()
+
+    def _find_log_partition(self, ts):
+        """Name of the known log partition that holds epoch second `ts`, if any"""
+        for name, start, end in self.log_partitions:
+            if (start is None or start <= ts) and ts < end:
+                return name
+        return None
+
+    def ensure_log_partition(self, ts):
+        """Name of the log partition that holds epoch second `ts`, created if missing"""
+        name = self._find_log_partition(ts)
+        if name is None:
+            # another process may have created it
+            self.get_log_partitions()
+            name = self._find_log_partition(ts)
+        if name is not None:
+            return name
+
+        # the period is clipped to the partitions around it, in case LOG_PARTITION_DAYS changed
+        start, end = self.log_period(ts)
+        start = max([start] + [e for _, _, e in self.log_partitions if e <= ts])
+        end = min([end] + [s for _, s, _ in self.log_partitions if s is not None and s > ts])
+        name = "logs_" + _utc_datetime(start).strftime("%Y%m%d%H%M%S")
+        self.create_log_partition(name, start, end)
+        return name
+
+    def create_log_partition(self, name, start, end):
+        """Create the log partition `name` for [start, end) epoch seconds, if it doesn't exist"""
+        if self.use_postgres:
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute(
+                        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF logs FOR VALUES FROM (%s) TO (%s)",
+                        (_utc_datetime(start), _utc_datetime(end))
+                    )
+                    cur.execute(
+                        "INSERT INTO log_partitions (name, period_start, period_end) VALUES (%s, %s, %s)"
+                        " ON CONFLICT DO NOTHING",
+                        (name, start, end)
+                    )
+                    self.conn.commit()
+            except Exception as e:
+                # lost a race with another process creating the same partition
+                self.conn.rollback()
+                print(f"Could not create log partition {name}: {e}")
+        else:
+            with self.conn:
+                self.conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {name} (
+                        id INTEGER PRIMARY KEY,
+                        email TEXT NOT NULL,
+                        meeting_id INTEGER NOT NULL,
+                        timestamp TIMESTAMP NOT NULL,
+                        action INTEGER NOT NULL
+                    )
+                """)
+                self._index_log_partition_sqlite(name)
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO log_partitions (name, period_start, period_end) VALUES (?, ?, ?)",
+                    (name, start, end)
+                )
+                self._create_logs_view_sqlite()
+        self.get_log_partitions()
+
+    def drop_log_partition(self, name):
+        """Drop the log partition `name` and its rows"""
+        if self.use_postgres:
+            with self.conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {name}")
+                cur.execute("DELETE FROM log_partitions WHERE name = %s", (name,))
+                self.conn.commit()
+        else:
+            with self.conn:
+                self.conn.execute("DELETE FROM log_partitions WHERE name = ?", (name,))
+                self._create_logs_view_sqlite()
+                self.conn.execute(f"DROP TABLE IF EXISTS {name}")
+        self.get_log_partitions()
+
+    def get_log_partition_max_id(self, name):
+        """Get the highest log ID in the partition `name`, 0 if it is empty"""
+        query = f"SELECT COALESCE(MAX(id), 0) AS id FROM {name}"
+        if self.use_postgres:
+            with self.conn.cursor() as cur:
+                cur.execute(query)
+                row = cur.fetchone()
+                self.conn.commit()
+                return row["id"]
+        return self.conn.execute(query).fetchone()["id"]
+
+    def iter_log_partition(self, name, chunk_size=LOG_FETCH_SIZE):
+        """Iterate over the rows of the log partition `name` in ID order, in chunks of `chunk_size` rows"""
+        query = f"SELECT id, email, meeting_id, timestamp, action FROM {name} ORDER BY id"
+        if self.use_postgres:
+            yield from self._iter_server_side(self.conn, query, (), chunk_size)
+        else:
+            yield from _chunked(self.conn.execute(query), chunk_size)
+
+    def iter_logs(self, since=None, until=None, after=0, chunk_size=LOG_FETCH_SIZE):
+        """
+        Iterate over the log rows with an ID above `after`, stamped between
+        `since` and `until` (naive UTC datetimes, or None), in ID order and in
+        chunks of `chunk_size` rows. Only one chunk is held in memory.
+        """
+        conditions = ["id > {p}"]
+        params = [after]
+        if since is not None:
+            conditions.append("timestamp >= {p}")
+            params.append(since)
+        if until is not None:
+            conditions.append("timestamp <= {p}")
+            params.append(until)
+        query = "SELECT id, email, meeting_id, timestamp, action FROM {table} WHERE " + " AND ".join(conditions) + " ORDER BY id"
+
+        if self.use_postgres:
+            # the partitions out of the time range are pruned by the planner
+            with self._stream_conn(self._read_url()) as conn:
+                yield from self._iter_server_side(conn, query.format(table="logs", p="%s"), params, chunk_size)
+        else:
+            # only the partitions that overlap the time range are read, each by
+            # its rowid, and their sorted rows are merged lazily
+            since_ts = to_timestamp(since) if since is not None else float("-inf")
+            until_ts = to_timestamp(until) if until is not None else float("inf")
+            params = [p.isoformat(" ") if isinstance(p, datetime) else p for p in params]
+            partitions = [
+                name for name, start, end in self.get_log_partitions()
+                if (start is None or start <= until_ts) and end > since_ts
+            ]
+            with self._stream_conn() as conn:
+                cursors = [conn.execute(query.format(table=name, p="?"), params) for name in partitions]
+                yield from _chunked(heapq.merge(*cursors, key=lambda row: row["id"]), chunk_size)
+
+    def iter_meetings(self, since=None, until=None, after=0, chunk_size=LOG_FETCH_SIZE):
+        """
+        Iterate over the meetings with an ID above `after`, starting between
+        `since` and `until` (datetimes, or None), in ID order and in chunks of
+        `chunk_size` rows. Only one chunk is held in memory.
+        """
+        conditions = ["meeting_id > {p}"]
+        params = [after]
+        if since is not None:
+            conditions.append("t1 >= {p}")
+            params.append(since)
+        if until is not None:
+            conditions.append("t1 <= {p}")
+            params.append(until)
+        query = (
+            "SELECT meeting_id, title, description, t1, t2, lat, long, participants, updated_at"
+            " FROM meetings WHERE " + " AND ".join(conditions) + " ORDER BY meeting_id"
+        )
+
+        if self.use_postgres:
+            with self._stream_conn(self._read_url()) as conn:
+                yield from self._iter_server_side(conn, query.format(p="%s"), params, chunk_size)
+        else:
+            with self._stream_conn() as conn:
+                yield from _chunked(conn.execute(query.format(p="?"), params), chunk_size)
+
+    @contextmanager
+    def _stream_conn(self, url=None):
+        """
+        A connection of its own for a streamed read, to the primary (None) or
+        the replica at `url`. The chunks of a stream are pulled by whichever
+        thread serves it next, so it can't borrow the connection of a thread
+        """
+        conn = self._connect(url)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _iter_server_side(self, conn, query, params, chunk_size):
+        """Run a PostgreSQL query in a named cursor, which keeps the result on the server, and fetch it in chunks"""
+        # held over commits, the replicas run in autocommit
+        with conn.cursor(name=f"export_{uuid.uuid4().hex}", withhold=True) as cur:
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield [dict(row) for row in rows]
+        if not conn.autocommit:
+            conn.commit()
+
+    def _index_log_partition_sqlite(self, name):
+        """Index a SQLite log partition for the lookups of a meeting or user in a time window"""
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_meeting_idx ON {name} (meeting_id, timestamp)")
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_email_idx ON {name} (email, timestamp)")
+
+    def _create_logs_view_sqlite(self):
+        """(Re)create the `logs` view over all the SQLite log partitions"""
+        names = [row["name"] for row in self.conn.execute("SELECT name FROM log_partitions ORDER BY period_end")]
+        self.conn.execute("DROP VIEW IF EXISTS logs")
+        selects = [f"SELECT id, email, meeting_id, timestamp, action FROM {name}" for name in names]
+        if not selects:
+            # no partition yet, an empty view with the same columns
+            selects = ["SELECT NULL AS id, NULL AS email, NULL AS meeting_id, NULL AS timestamp, NULL AS action WHERE 0"]
+        self.conn.execute("CREATE VIEW logs AS " + " UNION ALL ".join(selects))
+
+    def get_logs_after(self, log_id, limit):
+        """Get up to `limit` log rows with an ID above `log_id`, in ID order"""
+        if self.use_postgres:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    "SELECT id, email, meeting_id, timestamp, action FROM logs"
+                    " WHERE id > %s ORDER BY id LIMIT %s",
+                    (log_id, limit)
+                )
+                return [dict(row) for row in cur.fetchall()]
+        else:
+            # every partition is read by its rowid, and the sorted reads are merged lazily
+            cursors = [
                 self.conn.execute(
-                    "INSERT INTO logs (email, meeting_id, action) VALUES (?, ?, ?)",
-                    (email, meeting_id, action)
+                    f"SELECT id, email, meeting_id, timestamp, action FROM {name}"
+                    " WHERE id > ? ORDER BY id LIMIT ?",
+                    (log_id, limit)
                 )
+                for name, _, _ in self.get_log_partitions()
+            ]
+            rows = heapq.merge(*cursors, key=lambda row: row["id"])
+            return [dict(row) for row in itertools.islice(rows, limit)]
+
+    def request_sync(self, name):
+        """Record that the sync `name` is needed, for whichever process runs the syncs"""
+        query = (
+            "INSERT INTO sync_requests (name, requested_at) VALUES ({p}, {p})"
+            " ON CONFLICT (name) DO UPDATE SET requested_at = excluded.requested_at"
+        )
+        params = (name, time.time())
+
+        if self.use_postgres:
+            with self.conn.cursor() as cur:
+                cur.execute(query.format(p="%s"), params)
+                self.conn.commit()
+        else:
+            with self.conn:
+                self.conn.execute(query.format(p="?"), params)
+
+    def get_sync_request(self, name):
+        """Get when the sync `name` was last requested (epoch seconds), None if it is not pending"""
+        if self.use_postgres:
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT requested_at FROM sync_requests WHERE name = %s", (name,))
+                row = cur.fetchone()
+        else:
+            row = self.conn.execute("SELECT requested_at FROM sync_requests WHERE name = ?", (name,)).fetchone()
+        return row["requested_at"] if row else None
+
+    def clear_sync_request(self, name, requested_at):
+        """Clear the request of the sync `name`, unless it was requested again after `requested_at`"""
+        if self.use_postgres:
+            with self.conn.cursor() as cur:
+                cur.execute("DELETE FROM sync_requests WHERE name = %s AND requested_at <= %s", (name, requested_at))
+                self.conn.commit()
+        else:
+            with self.conn:
+                self.conn.execute("DELETE FROM sync_requests WHERE name = ? AND requested_at <= ?", (name, requested_at))
+
+    def get_analytics_watermark(self, name):
+        """Get the last log ID folded into the rollups `name`, 0 if none was"""
+        if self.use_postgres:
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT watermark FROM analytics_state WHERE name = %s", (name,))
+                row = cur.fetchone()
+        else:
+            row = self.conn.execute("SELECT watermark FROM analytics_state WHERE name = ?", (name,)).fetchone()
+        return row["watermark"] if row else 0
+
+    def get_attendance_rollups(self, keys):
+        """Get the attendance rollups of many (meeting_id, email) pairs, keyed by them"""
+        if not keys:
+            return {}
+
+        keys = list(keys)
+        if self.use_postgres:
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT * FROM attendance_rollups WHERE (meeting_id, email) IN %s", (tuple(keys),))
+                rows = cur.fetchall()
+        else:
+            placeholders = ", ".join("(?, ?)" for _ in keys)
+            rows = self.conn.execute(
+                f"SELECT * FROM attendance_rollups WHERE (meeting_id, email) IN (VALUES {placeholders})",
+                [value for key in keys for value in key]
+            ).fetchall()
+        return {(row["meeting_id"], row["email"]): dict(row) for row in rows}
+
+    def get_meeting_rollups(self, meeting_ids):
+        """Get the attendance rollups of many meetings, keyed by meeting ID"""
+        if not meeting_ids:
+            return {}
+
+        meeting_ids = list(meeting_ids)
+        if self.use_postgres:
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT * FROM meeting_rollups WHERE meeting_id = ANY(%s)", (meeting_ids,))
+                rows = cur.fetchall()
+        else:
+            placeholders = ", ".join("?" for _ in meeting_ids)
+            rows = self.conn.execute(
+                f"SELECT * FROM meeting_rollups WHERE meeting_id IN ({placeholders})",
+                meeting_ids
+            ).fetchall()
+        return {row["meeting_id"]: dict(row) for row in rows}
+
+    def save_rollups(self, name, watermark, new_watermark, attendance, meetings):
+        """
+        Store folded attendance and meeting rollups (lists of row dicts) and
+        move the watermark of `name` from `watermark` to `new_watermark`, in
+        one transaction. Returns False, storing nothing, if the watermark
+        was moved by someone else in the meantime.
+        """
+        attendance_columns = ["meeting_id", "email", "seconds_present", "sessions", "first_join", "join_latency", "joined_at"]
+        meeting_columns = ["meeting_id", "attendance", "peak_attendance", "peak_at", "joins"]
+
+        def upsert(table, columns, keys, p):
+            updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c not in keys)
+            return (
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(p for _ in columns)})"
+                f" ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}"
+            )
+
+        # the watermark only moves if it is still where the rows were read from
+        move_watermark = (
+            "INSERT INTO analytics_state (name, watermark) VALUES ({p}, {p})"
+            " ON CONFLICT (name) DO UPDATE SET watermark = excluded.watermark"
+            " WHERE analytics_state.watermark = {p}"
+        )
+        attendance_rows = [tuple(row[c] for c in attendance_columns) for row in attendance]
+        meeting_rows = [tuple(row[c] for c in meeting_columns) for row in meetings]
+
+        if self.use_postgres:
+            with self.conn.cursor() as cur:
+                cur.execute(move_watermark.format(p="%s"), (name, new_watermark, watermark))
+                if cur.rowcount == 0:
+                    self.conn.rollback()
+                    return False
+                cur.executemany(upsert("attendance_rollups", attendance_columns, ["meeting_id", "email"], "%s"), attendance_rows)
+                cur.executemany(upsert("meeting_rollups", meeting_columns, ["meeting_id"], "%s"), meeting_rows)
+                self.conn.commit()
+                return True
+        else:
+            with self.conn:
+                cursor = self.conn.execute(move_watermark.format(p="?"), (name, new_watermark, watermark))
+                if cursor.rowcount == 0:
+                    return False
+                self.conn.executemany(upsert("attendance_rollups", attendance_columns, ["meeting_id", "email"], "?"), attendance_rows)
+                self.conn.executemany(upsert("meeting_rollups", meeting_columns, ["meeting_id"], "?"), meeting_rows)
+                return True
+
+    def get_meeting_stats(self, meeting_id, now):
+        """
+        Attendance stats of a meeting from the rollups, None if nobody attended
+        it. The sessions still open count up to `now` (epoch seconds).
+        """
+        query = (
+            "SELECT r.attendance, r.peak_attendance, r.peak_at, r.joins,"
+            " COUNT(a.email) AS attendees,"
+            " SUM(a.seconds_present + CASE WHEN a.joined_at IS NULL THEN 0 ELSE {p} - a.joined_at END) AS total_seconds,"
+            " AVG(a.join_latency) AS average_join_latency"
+            " FROM meeting_rollups r JOIN attendance_rollups a ON a.meeting_id = r.meeting_id"
+            " WHERE r.meeting_id = {p}"
+            " GROUP BY r.meeting_id, r.attendance, r.peak_attendance, r.peak_at, r.joins"
+        )
+        conn = self._read_conn(f"meeting:{meeting_id}")
+        if self.use_postgres:
+            with conn.cursor() as cur:
+                cur.execute(query.format(p="%s"), (now, meeting_id))
+                row = cur.fetchone()
+        else:
+            row = conn.execute(query.format(p="?"), (now, meeting_id)).fetchone()
+        return dict(row) if row else None
+
+    def get_user_stats(self, email, now):
+        """
+        Attendance stats of a user over all meetings, from the rollups. The
+        sessions still open count up to `now` (epoch seconds).
+        """
+        query = (
+            "SELECT COUNT(*) AS meetings_attended, COALESCE(SUM(sessions), 0) AS sessions,"
+            " COALESCE(SUM(seconds_present + CASE WHEN joined_at IS NULL THEN 0 ELSE {p} - joined_at END), 0) AS total_seconds,"
+            " AVG(join_latency) AS average_join_latency"
+            " FROM attendance_rollups WHERE email = {p}"
+        )
+        conn = self._read_conn(f"user:{email}")
+        if self.use_postgres:
+            with conn.cursor() as cur:
+                cur.execute(query.format(p="%s"), (now, email))
+                row = cur.fetchone()
+        else:
+            row = conn.execute(query.format(p="?"), (now, email)).fetchone()
+        return dict(row)
+
+    def archive_occupancy(self, meeting_id, buckets):
+        """
+        Store the occupancy of an ended meeting, as (minute, peak, occupancy)
+        buckets. Buckets that were already stored are replaced.
+        """
+        if not buckets:
+            return True
+
+        rows = [(meeting_id, *bucket) for bucket in buckets]
+        query = (
+            "INSERT INTO meeting_occupancy (meeting_id, minute, peak, occupancy) VALUES ({p}, {p}, {p}, {p})"
+            " ON CONFLICT (meeting_id, minute) DO UPDATE SET peak = excluded.peak, occupancy = excluded.occupancy"
+        )
+        if self.use_postgres:
+            with self.conn.cursor() as cur:
+                cur.executemany(query.format(p="%s"), rows)
+                self.conn.commit()
+                return True
+        else:
+            with self.conn:
+                self.conn.executemany(query.format(p="?"), rows)
                 return True
 
+    def get_occupancy(self, meeting_id, start=None, end=None):
+        """
+        Get the stored occupancy buckets of an ended meeting between the
+        minutes `start` and `end` (epoch seconds, open ended if None), as a
+        tuple of the last bucket before `start` (None if there is none) and
+        the list of the buckets in the range, each a (minute, peak, occupancy)
+        tuple. Returns None if the meeting has no stored occupancy.
+        """
+        select = "SELECT minute, peak, occupancy FROM meeting_occupancy WHERE meeting_id = {p}"
+        queries = []  # (query, params), in the order of the results
+        in_range, params = select, [meeting_id]
+        if start is not None:
+            in_range += " AND minute >= {p}"
+            params.append(start)
+            queries.append((select + " AND minute < {p} ORDER BY minute DESC LIMIT 1", (meeting_id, start)))
+        if end is not None:
+            in_range += " AND minute <= {p}"
+            params.append(end)
+        queries.insert(0, (in_range + " ORDER BY minute", params))
+        queries.append((select + " LIMIT 1", (meeting_id,)))
+
+        conn = self._read_conn(f"meeting:{meeting_id}")
+        results = []
+        for query, query_params in queries:
+            if self.use_postgres:
+                with conn.cursor() as cur:
+                    cur.execute(query.format(p="%s"), query_params)
+                    rows = cur.fetchall()
+            else:
+                rows = conn.execute(query.format(p="?"), query_params).fetchall()
+            results.append([(row["minute"], row["peak"], row["occupancy"]) for row in rows])
+
+        buckets, *before, any_bucket = results
+        if not any_bucket:
+            return None
+        return (before[0][0] if before and before[0] else None), buckets
+
+    def archive_messages(self, messages):
+        """
+        Archive chat messages as (meeting_id, position, email, message, timestamp)
+        rows. Messages that were already archived are skipped.
+        """
+        if not messages:
+            return True
+
+        # index the same tokens the live chats are searched by, so a query
+        # matches the same messages before and after a meeting ends
+        messages = [(*message, " ".join(tokenize(message[3]))) for message in messages]
+
+        if self.use_postgres:
+            from psycopg2.extras import execute_values
+
+            with self.conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    "INSERT INTO chat_messages (meeting_id, position, email, message, timestamp, search_text)"
+                    " VALUES %s ON CONFLICT DO NOTHING",
+                    messages
+                )
+                self.conn.commit()
+                return True
+        else:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO chat_messages (meeting_id, position, email, message, timestamp, search_text)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    messages
+                )
+                return True
+
+    def search_messages(self, meeting_id, tokens, offset, limit):
+        """
+        Rank the archived messages of a meeting that contain any of the tokens,
+        best match first. Returns up to `limit` message dicts with a "score"
+        (higher is better), starting at `offset`.
+        """
+        if not tokens:
+            return []
+
+        conn = self._read_conn(f"meeting:{meeting_id}")
+        if self.use_postgres:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """SELECT meeting_id, email, message, timestamp, ts_rank(search_vector, query) AS score
+                       FROM chat_messages, to_tsquery('simple', %s) AS query
+                       WHERE meeting_id = %s AND search_vector @@ query
+                       ORDER BY score DESC, position DESC
+                       LIMIT %s OFFSET %s""",
+                    (" | ".join(tokens), meeting_id, limit, offset)
+                )
+                return [dict(row) for row in cur.fetchall()]
+        else:
+            # the tokens are plain words, quoting them keeps them from being read as operators
+            match = f'meeting_id : "{meeting_id}" AND (' + " OR ".join(f'"{token}"' for token in tokens) + ")"
+            cursor = conn.cursor()
+            cursor.execute(
+                """SELECT m.meeting_id, m.email, m.message, m.timestamp,
+                          -bm25(chat_messages_fts, 1.0, 0.0) AS score
+                   FROM chat_messages_fts JOIN chat_messages m ON m.rowid = chat_messages_fts.rowid
+                   WHERE chat_messages_fts MATCH ?
+                   ORDER BY score DESC, m.position DESC
+                   LIMIT ? OFFSET ?""",
+                (match, limit, offset)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_user_messages(self, email, since, until, before, limit):
+        """
+        Get up to `limit` archived messages of a user, newest first, posted
+        between `since` and `until` (naive UTC datetimes, or None) and, if
+        `before` is given, older than its (timestamp, meeting_id, position).
+        """
+        conditions = ["email = {p}"]
+        params = [email]
+        if since is not None:
+            conditions.append("timestamp >= {p}")
+            params.append(since)
+        if until is not None:
+            conditions.append("timestamp <= {p}")
+            params.append(until)
+        if before is not None:
+            # row values compare like tuples, and seek in the index
+            conditions.append("(timestamp, meeting_id, position) < ({p}, {p}, {p})")
+            params.extend(before)
+
+        query = (
+            "SELECT meeting_id, position, email, message, timestamp FROM chat_messages"
+            " WHERE " + " AND ".join(conditions) +
+            " ORDER BY timestamp DESC, meeting_id DESC, position DESC LIMIT {p}"
+        )
+        params.append(limit)
+
+        conn = self._read_conn(f"user:{email}")
+        if self.use_postgres:
+            with conn.cursor() as cur:
+                cur.execute(query.format(p="%s"), params)
+                return [dict(row) for row in cur.fetchall()]
+        else:
+            # the archived timestamps are ISO strings, which sort like the times
+            params = [p.isoformat() if isinstance(p, datetime) else p for p in params]
+            cursor = conn.cursor()
+            cursor.execute(query.format(p="?"), params)
+            return [dict(row) for row in cursor.fetchall()]
+
     # def save_chat_message(self, meeting_id, email, message):
     #     """Save a chat message"""
     #     if self.use_postgres:
@@ -435,9 +1472,18 @@ class Database:
 # Database singleton
 _db_instance = None
 
+def _reset_database():
+    """Forget the parent's connection in a forked worker, it opens its own"""
+    global _db_instance
+    _db_instance = None
+
+os.register_at_fork(after_in_child=_reset_database)
+
 def get_database():
     """Get or create the database instance"""
     global _db_instance
     if _db_instance is None:
-        _db_instance = Database()
+        db = Database()
+        db.create_tables()
+        _db_instance = db
     return _db_instance
\ No newline at end of file
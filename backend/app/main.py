@@ -1,20 +1,69 @@
 import os
+from contextlib import asynccontextmanager
+
+import anyio
+
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse
 
 from app.core.config import settings
 from app.api.api_v1.api import api_router
 from app.core.scheduler import scheduler
+from app.core.rate_limit import ConcurrencyLimitMiddleware
+from app.db.database import get_database, set_write_marks
+from app.services.redis_service import get_redis_manager, RecentWrites
+
+# The reads that follow a write to the DB skip the replicas, in every worker
+set_write_marks(RecentWrites())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The endpoints are plain functions run in the threadpool, since they
+    # block on Redis and the DB. Give it a thread for every request the
+    # ConcurrencyLimitMiddleware lets in, each thread opens its own DB connections
+    if settings.MAX_CONCURRENT_REQUESTS > 0:
+        anyio.to_thread.current_default_thread_limiter().total_tokens = settings.MAX_CONCURRENT_REQUESTS
+
+    # Connect to the backends and create the tables. A backend that is not
+    # reachable yet doesn't stop the boot, it gets connected on first use
+    try:
+        get_database()
+        get_redis_manager()
+    except Exception as e:
+        print(f"Could not connect to the backends on startup: {e}")
+
+    # Start the scheduler
+    scheduler.start()
+
+    yield
+
+    scheduler.stop()
+
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     description=settings.PROJECT_DESCRIPTION,
     version=settings.VERSION,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
+# Compress big responses, with brotli when the optional brotli-asgi is installed
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=settings.COMPRESSION_MINIMUM_SIZE, gzip_fallback=True)
+except ImportError:
+    app.add_middleware(
+        GZipMiddleware,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+        compresslevel=settings.COMPRESSION_LEVEL
+    )
+
 # Add CORS middleware with explicit origins for development
 app.add_middleware(
     CORSMiddleware,
@@ -24,12 +73,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Shed load when too many API requests are in flight
+app.add_middleware(
+    ConcurrencyLimitMiddleware,
+    max_requests=settings.MAX_CONCURRENT_REQUESTS,
+    queue_timeout=settings.CONCURRENCY_QUEUE_TIMEOUT,
+    path_prefix=settings.API_V1_STR
+)
+
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
-# Start the scheduler
-scheduler.start()
-
 # Serve static files - First priority to the Vue.js frontend
 if os.path.exists("static/frontend"):
     app.mount("/static/frontend", StaticFiles(directory="static/frontend"), name="frontend")
@@ -49,7 +103,3 @@ async def read_root():
         return FileResponse("static/index.html")
     # API message as last resort
     return {"message": f"{settings.PROJECT_NAME} API is running. Visit /docs for API documentation."}
-
-@app.on_event("shutdown")
-def shutdown_event():
-    scheduler.stop()
\ No newline at end of file
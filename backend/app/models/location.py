@@ -0,0 +1,28 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel
+
+
+# Location models
+class LocationUpdate(BaseModel):
+    email: str
+    x: float
+    y: float
+    timestamp: Optional[datetime] = None  # time of the ping, defaults to arrival time
+
+
+class LocationBatchRequest(BaseModel):
+    updates: List[LocationUpdate]
+
+
+class GeofenceTransition(BaseModel):
+    email: str
+    meeting_id: int
+
+
+class LocationBatchResponse(BaseModel):
+    success: bool = True
+    accepted: int
+    dropped: int
+    joined: List[GeofenceTransition]
+    left: List[GeofenceTransition]
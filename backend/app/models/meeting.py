@@ -27,4 +27,28 @@ class MeetingIdResponse(BaseModel):
 
 
 class MeetingListResponse(BaseModel):
-    meetings: List[int]
\ No newline at end of file
+    meetings: List[int]
+
+
+class MeetingStatsResponse(BaseModel):
+    meeting_id: int
+    attendees: int  # users that joined at least once
+    joins: int
+    current_attendance: int
+    peak_attendance: int
+    peak_at: Optional[datetime] = None
+    total_seconds: float  # time spent in the meeting, summed over the attendees
+    average_seconds: float
+    average_join_latency: Optional[float] = None  # seconds from t1 to the first join of each attendee
+
+
+class OccupancyPoint(BaseModel):
+    timestamp: datetime  # start of the point
+    peak: int  # most participants joined at once during the point
+    occupancy: int  # participants joined at the end of the point
+
+
+class MeetingOccupancyResponse(BaseModel):
+    meeting_id: int
+    step: int  # seconds per point
+    points: List[OccupancyPoint]
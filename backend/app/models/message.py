@@ -18,4 +18,18 @@ class Message(BaseModel):
 
 
 class MessageListResponse(BaseModel):
-    messages: List[Message]
\ No newline at end of file
+    messages: List[Message]
+
+
+class MessageSearchResult(Message):
+    score: float
+
+
+class MessageSearchResponse(BaseModel):
+    messages: List[MessageSearchResult]
+    next_offset: Optional[int] = None
+
+
+class MessageHistoryResponse(BaseModel):
+    messages: List[Message]
+    next_cursor: Optional[str] = None
@@ -40,4 +40,12 @@ class ParticipantListResponse(BaseModel):
 
 class EndMeetingResponse(BaseModel):
     success: bool = True
-    timed_out_participants: List[str]
\ No newline at end of file
+    timed_out_participants: List[str]
+
+
+class UserStatsResponse(BaseModel):
+    email: str
+    meetings_attended: int
+    sessions: int
+    total_seconds: float
+    average_join_latency: Optional[float] = None  # seconds from t1 to the first join of each meeting
@@ -0,0 +1,146 @@
+import os
+from datetime import datetime, timezone
+
+from app.db.database import get_database
+from app.core.metrics import metrics
+from app.core.constants import JOIN_MEETING, ANALYTICS_BATCH_SIZE, ANALYTICS_MAX_BATCHES, ANALYTICS_FOLD_LAG
+from app.utils.time_utils import to_timestamp
+
+class AnalyticsService:
+    """
+    Attendance analytics. The rows of the `logs` table are folded into
+    rollups incrementally, from a watermark (the last folded log ID), so the
+    stats are read from the rollups instead of scanning the logs.
+
+    The IDs are handed out before the rows commit, so with several writers a
+    row can become visible after a higher ID was already folded. Only the rows
+    older than ANALYTICS_FOLD_LAG are folded: by then every row with a lower
+    ID has committed too.
+    """
+
+    # name of the watermark of the attendance rollups
+    ROLLUP = "attendance"
+
+    def __init__(self):
+        self.db = get_database()
+
+    def fold_logs(self, batch_size=ANALYTICS_BATCH_SIZE, max_batches=ANALYTICS_MAX_BATCHES):
+        """
+        Fold the new log rows into the rollups, one transaction per batch.
+        Returns the number of rows folded.
+        """
+        folded = 0
+        cutoff = datetime.now(timezone.utc).timestamp() - ANALYTICS_FOLD_LAG
+        for _ in range(max_batches):
+            watermark = self.db.get_analytics_watermark(self.ROLLUP)
+            logs = self.db.get_logs_after(watermark, batch_size)
+
+            # stop at the first row that is too recent, in ID order
+            recent = next((i for i, log in enumerate(logs) if to_timestamp(log["timestamp"]) >= cutoff), None)
+            complete = recent is None and len(logs) == batch_size
+            logs = logs[:recent]
+            if not logs:
+                break
+
+            attendance, meetings = self._fold(logs)
+            if not self.db.save_rollups(self.ROLLUP, watermark, logs[-1]["id"], attendance, meetings):
+                print(f"Analytics watermark moved past {watermark} while folding, retrying on the next run")
+                break
+
+            folded += len(logs)
+            metrics.incr("analytics_logs_folded", len(logs))
+            if not complete:
+                break
+
+        return folded
+
+    def _fold(self, logs):
+        """Apply a batch of log rows to their rollups, returns the changed (attendance, meeting) rows"""
+        keys = {(log["meeting_id"], log["email"]) for log in logs}
+        attendance = self.db.get_attendance_rollups(keys)
+        meetings = self.db.get_meeting_rollups({meeting_id for meeting_id, _ in keys})
+
+        # the start times are only needed for the first joins
+        first_joins = {
+            meeting_id for meeting_id, email in keys
+            if attendance.get((meeting_id, email), {}).get("first_join") is None
+        }
+        starts = {
+            meeting["meeting_id"]: to_timestamp(meeting["t1"])
+            for meeting in self.db.get_meetings(first_joins, primary=True)
+        }
+
+        for log in logs:
+            meeting_id, email = log["meeting_id"], log["email"]
+            timestamp = to_timestamp(log["timestamp"])
+            user = attendance.setdefault((meeting_id, email), {
+                "meeting_id": meeting_id, "email": email, "seconds_present": 0.0, "sessions": 0,
+                "first_join": None, "join_latency": None, "joined_at": None
+            })
+            meeting = meetings.setdefault(meeting_id, {
+                "meeting_id": meeting_id, "attendance": 0, "peak_attendance": 0, "peak_at": None, "joins": 0
+            })
+
+            if log["action"] == JOIN_MEETING:
+                meeting["joins"] += 1
+                if user["joined_at"] is not None:
+                    continue  # already in, a rejoin does not open a second session
+
+                user["joined_at"] = timestamp
+                user["sessions"] += 1
+                if user["first_join"] is None:
+                    user["first_join"] = timestamp
+                    if meeting_id in starts:
+                        user["join_latency"] = max(0.0, timestamp - starts[meeting_id])
+
+                meeting["attendance"] += 1
+                if meeting["attendance"] > meeting["peak_attendance"]:
+                    meeting["peak_attendance"] = meeting["attendance"]
+                    meeting["peak_at"] = timestamp
+            else:
+                # a leave or a timeout closes the open session, if any
+                if user["joined_at"] is None:
+                    continue
+
+                user["seconds_present"] += max(0.0, timestamp - user["joined_at"])
+                user["joined_at"] = None
+                meeting["attendance"] -= 1
+
+        return list(attendance.values()), list(meetings.values())
+
+    def get_meeting_stats(self, meeting_id):
+        """Get the attendance stats of a meeting, None if nobody attended it"""
+        stats = self.db.get_meeting_stats(meeting_id, datetime.now(timezone.utc).timestamp())
+        if stats is None:
+            return None
+
+        stats["meeting_id"] = meeting_id
+        stats["current_attendance"] = stats.pop("attendance")
+        stats["average_seconds"] = stats["total_seconds"] / stats["attendees"]
+        if stats["peak_at"] is not None:
+            stats["peak_at"] = datetime.fromtimestamp(stats["peak_at"], timezone.utc)
+        return stats
+
+    def get_user_stats(self, email):
+        """Get the attendance stats of a user over all meetings"""
+        stats = self.db.get_user_stats(email, datetime.now(timezone.utc).timestamp())
+        stats["email"] = email
+        return stats
+
+
+# AnalyticsService singleton, created on first use
+_analytics_service = None
+
+def _reset_analytics_service():
+    """Drop the instance inherited from the parent in a forked worker"""
+    global _analytics_service
+    _analytics_service = None
+
+os.register_at_fork(after_in_child=_reset_analytics_service)
+
+def get_analytics_service():
+    """Get or create the analytics service instance"""
+    global _analytics_service
+    if _analytics_service is None:
+        _analytics_service = AnalyticsService()
+    return _analytics_service
@@ -1,10 +1,12 @@
+import os
 from app.db.database import get_database
-from app.services.redis_service import get_redis_manager
+from app.services.redis_service import get_redis_manager, get_redis_breaker
 
 class ChatService:
     def __init__(self):
         self.db = get_database()
         self.redis_mgr = get_redis_manager()
+        self.redis_breaker = get_redis_breaker()
 
     def post_message(self, email, text):
         """Post a message to a meeting chat"""
@@ -14,6 +16,24 @@ class ChatService:
             return {"error": "User not found"}
 
         # Post message to Redis
-        result = self.redis_mgr.post_message(email, text)
+        result = self.redis_breaker.call(self.redis_mgr.post_message, email, text)
         if isinstance(result, dict) and "error" in result:
             return result # error message
+
+
+# ChatService singleton, created on first use
+_chat_service = None
+
+def _reset_chat_service():
+    """Drop the instance inherited from the parent in a forked worker"""
+    global _chat_service
+    _chat_service = None
+
+os.register_at_fork(after_in_child=_reset_chat_service)
+
+def get_chat_service():
+    """Get or create the chat service instance"""
+    global _chat_service
+    if _chat_service is None:
+        _chat_service = ChatService()
+    return _chat_service
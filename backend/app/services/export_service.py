@@ -0,0 +1,85 @@
+import io
+import os
+import csv
+
+import orjson
+
+from app.db.database import get_database
+from app.utils.time_utils import to_naive_utc
+
+class ExportService:
+    """
+    Streaming exports of the logs and the meetings, as NDJSON or CSV. The
+    rows are read in chunks through server-side cursors (PostgreSQL) or
+    iterative fetches (SQLite), so memory use does not grow with the tables.
+    """
+
+    # exported columns of each table, the first one is the resume cursor
+    COLUMNS = {
+        "logs": ["id", "email", "meeting_id", "timestamp", "action"],
+        "meetings": ["meeting_id", "title", "description", "t1", "t2", "lat", "long", "participants", "updated_at"],
+    }
+    FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+    def __init__(self):
+        self.db = get_database()
+
+    def export(self, table, fmt, since=None, until=None, after=0):
+        """
+        Export the rows of `table` whose time (the log timestamp, the meeting
+        start) is between `since` and `until`, and whose ID is above `after`,
+        in ID order. Pass the ID of the last row received as `after` to resume
+        an interrupted export. Returns an iterator of encoded chunks.
+        """
+        if table not in self.COLUMNS:
+            return {"error": f"Unknown table {table}, expected one of {', '.join(self.COLUMNS)}"}
+        if fmt not in self.FORMATS:
+            return {"error": f"Unknown format {fmt}, expected one of {', '.join(self.FORMATS)}"}
+
+        if table == "logs":
+            # the log timestamps are stored as naive UTC
+            chunks = self.db.iter_logs(
+                to_naive_utc(since) if since else None,
+                to_naive_utc(until) if until else None,
+                after
+            )
+        else:
+            chunks = self.db.iter_meetings(since, until, after)
+
+        if fmt == "csv":
+            return self._csv(self.COLUMNS[table], chunks)
+        return self._ndjson(chunks)
+
+    def _ndjson(self, chunks):
+        for rows in chunks:
+            yield b"".join(orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+
+    def _csv(self, columns, chunks):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for rows in chunks:
+            writer.writerows([row[column] for column in columns] for row in rows)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()  # the header of an empty export
+
+
+# ExportService singleton, created on first use
+_export_service = None
+
+def _reset_export_service():
+    """Drop the instance inherited from the parent in a forked worker"""
+    global _export_service
+    _export_service = None
+
+os.register_at_fork(after_in_child=_reset_export_service)
+
+def get_export_service():
+    """Get or create the export service instance"""
+    global _export_service
+    if _export_service is None:
+        _export_service = ExportService()
+    return _export_service
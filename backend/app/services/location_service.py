@@ -0,0 +1,96 @@
+import os
+from datetime import datetime, timezone
+
+from app.db.database import get_database
+from app.services.redis_service import get_redis_manager, get_redis_breaker
+from app.core.config import settings
+from app.core.constants import JOIN_MEETING, LEAVE_MEETING
+from app.utils.time_utils import to_timestamp
+
+class LocationService:
+    def __init__(self):
+        self.db = get_database()
+        self.redis_mgr = get_redis_manager()
+        self.redis_breaker = get_redis_breaker()
+
+    def _redis(self, func, *args):
+        """Call Redis through the circuit breaker"""
+        return self.redis_breaker.call(func, *args)
+
+    def ingest_locations(self, updates):
+        """
+        Store a batch of location pings and automatically join/leave the
+        meetings whose geofence the users entered or exited.
+
+        `updates` is a list of (email, x, y, timestamp) tuples. Returns the
+        number of accepted pings and the join/leave transitions performed.
+        """
+        # timestamps from the future are clamped to the arrival time (naive ones
+        # are UTC), they only order the pings of a user, the throttle times their arrival
+        now = datetime.now(timezone.utc).timestamp()
+        pings = [
+            (email, x, y, min(to_timestamp(ts), now) if isinstance(ts, datetime) else now)
+            for email, x, y, ts in updates
+        ]
+
+        # deduplicate/throttle and store the latest positions
+        accepted = self._redis(
+            self.redis_mgr.update_user_locations,
+            pings,
+            settings.LOCATION_THROTTLE_SECONDS,
+            settings.LOCATION_REFRESH_SECONDS,
+            settings.LOCATION_MIN_DISTANCE_METERS,
+            settings.LOCATION_TTL_SECONDS
+        )
+
+        # evaluate the geofences of all accepted pings in one batch
+        states = self._redis(self.redis_mgr.get_geofence_states, accepted)
+
+        joined, left, actions = [], [], []
+        for (email, *_), (nearby, invited, joined_meeting) in zip(accepted, states):
+            # user walked out of the meeting they are joined in
+            if joined_meeting is not None and joined_meeting not in nearby:
+                result = self._redis(self.redis_mgr.leave_meeting, email, joined_meeting)
+                if not (isinstance(result, dict) and "error" in result):
+                    left.append((email, int(joined_meeting)))
+                    actions.append((email, int(joined_meeting), LEAVE_MEETING))
+                    joined_meeting = None
+
+            if joined_meeting is not None:
+                continue # still inside the meeting they are joined in
+
+            # join the closest meeting the user is invited to
+            candidates = [m for m in nearby if m in invited]
+            if candidates:
+                result = self._redis(self.redis_mgr.join_meeting, email, candidates[0])
+                if not (isinstance(result, dict) and "error" in result):
+                    joined.append((email, int(candidates[0])))
+                    actions.append((email, int(candidates[0]), JOIN_MEETING))
+
+        # log all the transitions at once
+        self.db.log_actions(actions)
+
+        return {
+            "accepted": len(accepted),
+            "dropped": len(updates) - len(accepted),
+            "joined": joined,
+            "left": left
+        }
+
+
+# LocationService singleton, created on first use
+_location_service = None
+
+def _reset_location_service():
+    """Drop the instance inherited from the parent in a forked worker"""
+    global _location_service
+    _location_service = None
+
+os.register_at_fork(after_in_child=_reset_location_service)
+
+def get_location_service():
+    """Get or create the location service instance"""
+    global _location_service
+    if _location_service is None:
+        _location_service = LocationService()
+    return _location_service
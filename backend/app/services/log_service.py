@@ -0,0 +1,81 @@
+import os
+import gzip
+import time
+
+import orjson
+
+from app.db.database import get_database
+from app.services.analytics_service import AnalyticsService
+from app.core.config import settings
+from app.core.metrics import metrics
+
+class LogService:
+    """
+    Retention of the `logs` table. The logs are partitioned by time
+    (LOG_PARTITION_DAYS per partition); partitions that ended more than
+    LOG_RETENTION_DAYS ago are archived to LOG_ARCHIVE_DIR as gzipped NDJSON
+    and dropped, so inserts and lookups only touch recent, small tables.
+    """
+
+    def __init__(self):
+        self.db = get_database()
+
+    def maintain_partitions(self, now=None):
+        """
+        Create the partition of the next period ahead of time, then archive
+        and drop the expired ones. Returns the names of the archived partitions.
+        """
+        now = now if now is not None else time.time()
+        self.db.ensure_log_partition(now)
+        self.db.ensure_log_partition(self.db.log_period(now)[1])
+
+        cutoff = now - settings.LOG_RETENTION_DAYS * 86400
+        watermark = self.db.get_analytics_watermark(AnalyticsService.ROLLUP)
+
+        archived = []
+        for name, _, end in self.db.get_log_partitions():
+            if end > cutoff:
+                continue
+
+            # rows that are not in the rollups yet must not go away
+            if self.db.get_log_partition_max_id(name) > watermark:
+                print(f"Log partition {name} expired but is not folded into the analytics yet, keeping it")
+                continue
+
+            path = self.archive_partition(name)
+            self.db.drop_log_partition(name)
+            metrics.incr("log_partitions_archived")
+            print(f"Archived log partition {name} to {path}")
+            archived.append(name)
+
+        return archived
+
+    def archive_partition(self, name):
+        """Write the rows of a log partition to `<LOG_ARCHIVE_DIR>/<name>.ndjson.gz`, returns its path"""
+        os.makedirs(settings.LOG_ARCHIVE_DIR, exist_ok=True)
+        path = os.path.join(settings.LOG_ARCHIVE_DIR, f"{name}.ndjson.gz")
+
+        # written under a temporary name, so a crash never leaves a truncated archive behind
+        with gzip.open(path + ".tmp", "wb") as archive:
+            for rows in self.db.iter_log_partition(name):
+                archive.write(b"".join(orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE) for row in rows))
+        os.replace(path + ".tmp", path)
+        return path
+
+
+# LogService singleton, created on first use
+_log_service = None
+
+def _reset_log_service():
+    """Drop the instance inherited from the parent in a forked worker"""
+    global _log_service
+    _log_service = None
+
+os.register_at_fork(after_in_child=_reset_log_service)
+
+def get_log_service():
+    """Get or create the log service instance"""
+    global _log_service
+    if _log_service is None:
+        _log_service = LogService()
+    return _log_service
@@ -1,12 +1,63 @@
+import os
+import time
+import hashlib
+import orjson
 from app.db.database import get_database
-from app.services.redis_service import get_redis_manager
-from app.core.constants import JOIN_MEETING, LEAVE_MEETING, TIME_OUT
-from datetime import datetime, timezone
+from app.services.redis_service import get_redis_manager, get_redis_breaker
+from app.core.circuit_breaker import BackendUnavailableError
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.constants import JOIN_MEETING, LEAVE_MEETING, TIME_OUT, SYNC_OVERLAP, FULL_SYNC_INTERVAL, MAX_MEETING_DISTANCE
+from app.core.constants import SEARCH_PAGE_SIZE, MAX_SEARCH_PAGE_SIZE, HISTORY_PAGE_SIZE, MAX_HISTORY_PAGE_SIZE
+from app.core.constants import OCCUPANCY_MAX_POINTS, HEATMAP_PRECISION, HEATMAP_MAX_CELLS, GEOJSON_LIMIT, MAX_GEOJSON_LIMIT
+from app.utils.time_utils import to_timestamp, to_naive_utc, to_iso_utc
+from app.utils.geo_utils import calculate_distance, geohash_box_cell_count, geohash_cells_in_box, geohash_to_geojson
+from app.utils.geo_utils import meeting_to_geojson
+from app.utils.text_utils import tokenize
+from datetime import datetime, timedelta, timezone
 
 class MeetingService:
+    # name of the sync request of a full DB -> Redis sync, after Redis missed writes
+    RESYNC = "redis_full_sync"
+
     def __init__(self):
         self.db = get_database()
         self.redis_mgr = get_redis_manager()
+        self.redis_breaker = get_redis_breaker()
+
+        # In-process copy of the active meetings, see get_active_meetings_cached
+        self._active_cache = None
+
+    def _redis(self, func, *args):
+        """Call Redis through the circuit breaker"""
+        return self.redis_breaker.call(func, *args)
+
+    def _redis_write(self, func, *args):
+        """
+        Run a Redis write, or skip it while Redis is unavailable. The DB is the
+        source of truth, a skipped write requests a full sync that brings Redis
+        up to date again
+        """
+        try:
+            return self._redis(func, *args)
+        except BackendUnavailableError:
+            metrics.incr("redis_writes_skipped")
+            self.request_resync()
+            return None
+
+    def request_resync(self):
+        """
+        Record in the DB that Redis missed writes. The scheduler leader, in
+        whichever process it runs, then does a full sync
+        """
+        try:
+            self.db.request_sync(self.RESYNC)
+        except Exception as e:
+            print(f"Could not request a full sync of Redis: {e}")
+
+    def is_resync_requested(self):
+        """Whether a full sync of Redis was requested"""
+        return self.db.get_sync_request(self.RESYNC) is not None
 
     def create_meeting(self, title, description, t1, t2, lat, long, participants):
         """Create a new meeting"""
@@ -35,14 +86,19 @@ class MeetingService:
             if not meeting_id:
                 return {"error": "Could not load meeting in memory, after persistence"}
 
+            # Keep the cached invitation indexes up to date
+            self._redis_write(self.redis_mgr.add_invitations, meeting_id, participants, t2_datetime)
+
             # Also activate in Redis for real-time operations
             # Get current time in UTC
             now = datetime.now(timezone.utc)
 
             # Check if this is a current meeting
             if t1_datetime < now < t2_datetime:
-                # Activate in Redis
-                result = self.redis_mgr.activate_meeting(
+                # Activate in Redis. While Redis is unavailable the activation is
+                # left to the next sync, which finds the meeting through its updated_at
+                self._redis_write(
+                    self.redis_mgr.activate_meeting,
                     meeting_id,
                     title,
                     description,
@@ -52,9 +108,9 @@ class MeetingService:
                     t1_datetime,
                     t2_datetime
                 )
+                # only now, so a concurrent reload can't cache the set without it
+                self.invalidate_active_meetings_cache()
 
-            # Force a sync to make sure Redis is updated
-            self.sync_meetings() # maybe not needed
             return meeting_id
         except Exception as e:
             return {"error": f"Failed to create meeting: {str(e)}"}
@@ -80,12 +136,17 @@ class MeetingService:
     def get_meeting(self, meeting_id):
         """Get meeting details by ID"""
         # try to find in cache
-        meeting = self.redis_mgr.get_meeting_by_id(meeting_id)
+        try:
+            meeting = self._redis(self.redis_mgr.get_meeting_by_id, meeting_id)
+        except BackendUnavailableError:
+            meeting = None  # degraded mode, served from the db
 
         if not meeting:
             print("getting from db")
             # cache miss, retrieve from db
             meeting = self.db.get_meeting(meeting_id)
+            if not meeting:
+                return None
             # cast the stringified participants into a list
             # to be consistent with the return type
             meeting["participants"] = map(
@@ -100,7 +161,10 @@ class MeetingService:
     def find_nearby_meetings(self, email, x, y):
         """Find nearby active meetings that the user can join"""
         # Retrieve nearby active meetings for the user from Redis
-        result = self.redis_mgr.get_nearby_meetings_for_user(email, x, y)
+        try:
+            result = self._redis(self.redis_mgr.get_nearby_meetings_for_user, email, x, y)
+        except BackendUnavailableError:
+            result = self._find_nearby_meetings_in_db(email, x, y)
         # If no meetings found or empty set, return empty list
         if not result:
             return []
@@ -110,6 +174,17 @@ class MeetingService:
         except Exception:
             return []
 
+    def _find_nearby_meetings_in_db(self, email, x, y):
+        """Degraded mode version of find_nearby_meetings, filtering the active meetings of the db"""
+        meetings = self.db.get_meetings(self.db.get_active_meetings())
+        return [
+            meeting["meeting_id"]
+            for meeting in meetings
+            if email in (p.strip() for p in meeting["participants"].split(","))
+            # same axes as the geospatial index of Redis
+            and calculate_distance(y, x, meeting["long"], meeting["lat"]) * 1000 <= MAX_MEETING_DISTANCE
+        ]
+
     def join_meeting(self, email, meeting_id):
         """User joins a meeting"""
         # Check if user exists
@@ -123,7 +198,7 @@ class MeetingService:
         #     return {"error": "Meeting not found"}
 
         # Try to join meeting in Redis
-        result = self.redis_mgr.join_meeting(email, meeting_id)
+        result = self._redis(self.redis_mgr.join_meeting, email, meeting_id)
         if isinstance(result, dict) and "error" in result:
             return result # error message
 
@@ -143,13 +218,20 @@ class MeetingService:
         #     return {"error": "Meeting not found"}
 
         # Try to leave meeting in Redis
-        result = self.redis_mgr.leave_meeting(email, meeting_id)
+        result = self._redis(self.redis_mgr.leave_meeting, email, meeting_id)
         if isinstance(result, dict) and "error" in result:
             return result # error message
 
         # Log the action
         self.db.log_action(email, meeting_id, LEAVE_MEETING)
 
+    def get_meeting_version(self, meeting_id, resource):
+        """Get the (ETag, last modified) of a resource of an active meeting, if any"""
+        try:
+            return self._redis(self.redis_mgr.get_meeting_version, meeting_id, resource)
+        except BackendUnavailableError:
+            return None  # no conditional responses in degraded mode
+
     def get_meeting_participants(self, meeting_id):
         """Get participants who have joined a meeting"""
         # Check if the meeting exists
@@ -157,9 +239,45 @@ class MeetingService:
         # if not meeting:
         #     return {"error": "Could not find meeting"}
 
-        return self.redis_mgr.get_joined_participants(meeting_id)
+        return self._redis(self.redis_mgr.get_joined_participants, meeting_id)
+
+    def get_active_meetings_cached(self):
+        """
+        Get the active meeting IDs and an ETag for them. They are served from
+        memory for ACTIVE_MEETINGS_CACHE_TTL seconds, then revalidated against
+        the version of the active meetings in Redis.
+        """
+        now = time.monotonic()
+        cache = self._active_cache
+
+        try:
+            if cache is not None:
+                if now - cache["checked_at"] < settings.ACTIVE_MEETINGS_CACHE_TTL:
+                    return cache["meetings"], cache["etag"]
+
+                # only reload the set if it changed in the meantime
+                if self._redis(self.redis_mgr.get_active_meetings_version) == cache["version"]:
+                    cache["checked_at"] = now
+                    return cache["meetings"], cache["etag"]
+
+            version, meetings = self._redis(self.redis_mgr.get_active_meetings_snapshot)
+        except BackendUnavailableError:
+            # degraded mode, served from the db without caching
+            meetings = sorted(self.db.get_active_meetings())
+            return meetings, self._active_meetings_etag(meetings)
+
+        etag = self._active_meetings_etag(meetings)
+        self._active_cache = {"meetings": meetings, "etag": etag, "version": version, "checked_at": now}
+        return meetings, etag
 
-    def get_active_meetings(self, force_sync=True):
+    def _active_meetings_etag(self, meetings):
+        return '"' + hashlib.sha1(",".join(map(str, meetings)).encode()).hexdigest()[:16] + '"'
+
+    def invalidate_active_meetings_cache(self):
+        """Drop the in-process copy of the active meetings"""
+        self._active_cache = None
+
+    def get_active_meetings(self, force_sync=False):
         """Get all active meetings"""
 
         if force_sync:
@@ -177,29 +295,83 @@ class MeetingService:
         return redis_meetings
 
     def _get_active_meetings_from_db(self):
-        """Get active meetings directly from the database"""
-        return self.db.get_active_meetings()
-
-    def _activate_meeting_in_redis(self, meeting_id):
-        """Activate a meeting in Redis from the database"""
-        meeting = self.db.get_meeting(meeting_id)
-        if not meeting:
-            return {"error": "Could not find meeting"}
-
-        # Activate meeting in Redis
-        self.redis_mgr.activate_meeting(
-            meeting_id,
-            meeting["title"],
-            meeting["description"],
-            meeting["lat"],
-            meeting["long"],
-            meeting["participants"],
-            meeting["t1"],
-            meeting["t2"]
-        )
+        """Get active meetings directly from the primary database"""
+        return self.db.get_active_meetings(primary=True)
+
+    def _activate_meetings_in_redis(self, meeting_ids):
+        """Activate meetings in Redis from the database"""
+        # fetch all of them in a single query, from the primary that reported them
+        meetings = self.db.get_meetings(meeting_ids, primary=True)
+        if len(meetings) != len(meeting_ids):
+            missing = set(meeting_ids) - {m["meeting_id"] for m in meetings}
+            return {"error": f"Could not find meetings {missing}"}
+
+        for meeting in meetings:
+            # Activate meeting in Redis
+            self.redis_mgr.activate_meeting(
+                meeting["meeting_id"],
+                meeting["title"],
+                meeting["description"],
+                meeting["lat"],
+                meeting["long"],
+                meeting["participants"],
+                meeting["t1"],
+                meeting["t2"]
+            )
+        self.invalidate_active_meetings_cache()
 
     def sync_meetings(self):
-        """Force a sync to make sure Redis and DB are in sync"""
+        """
+        Sync the active meetings of the DB into Redis. Only the meetings that
+        started, ended or changed since the previous sync are processed, a full
+        reconcile runs on the first sync, every FULL_SYNC_INTERVAL seconds and
+        after Redis missed writes (see request_resync).
+        """
+        # staged meetings that are due go live the cheap way first
+        self.promote_staged_meetings()
+
+        now = datetime.now(timezone.utc)
+        watermark, last_full_sync = self.redis_mgr.get_sync_state()
+
+        resync = self.db.get_sync_request(self.RESYNC)
+        if resync is not None or watermark is None or now.timestamp() - last_full_sync >= FULL_SYNC_INTERVAL:
+            self._full_sync_meetings(rebuild_invitations=resync is not None)
+            self.redis_mgr.set_sync_state(now.timestamp(), now.timestamp())
+            if resync is not None:
+                self.db.clear_sync_request(self.RESYNC, resync)
+            return
+
+        # look a bit before the watermark, to catch rows that were committed
+        # after the previous sync but stamped before it
+        since = datetime.fromtimestamp(watermark - SYNC_OVERLAP, timezone.utc)
+        changes = self.db.get_meeting_changes(since, now)
+
+        if changes:
+            changed_ids = [meeting_id for meeting_id, _ in changes]
+            in_redis = dict(zip(changed_ids, self.redis_mgr.are_meetings_active(changed_ids)))
+
+            # Meetings to add to Redis
+            meetings_to_add = [m for m, is_active in changes if is_active and not in_redis[m]]
+            if meetings_to_add:
+                print(f"Syncing {len(meetings_to_add)} meetings from DB to Redis: {meetings_to_add}")
+                result = self._activate_meetings_in_redis(meetings_to_add)
+                if isinstance(result, dict) and "error" in result:
+                    raise ValueError(f"Error while activating meeting: {result['error']}")
+
+            # Meetings to remove from Redis
+            meetings_to_remove = [m for m, is_active in changes if not is_active and in_redis[m]]
+            if meetings_to_remove:
+                result = self.end_meetings(meetings_to_remove)
+                print(f"Deactivated meetings in Redis: {result}")
+
+        self.redis_mgr.set_sync_state(now.timestamp(), last_full_sync)
+
+    def _full_sync_meetings(self, rebuild_invitations=False):
+        """
+        Reconcile the whole set of active meetings between the DB and Redis.
+        With `rebuild_invitations` the cached invitation indexes are dropped
+        first, so the ones of deleted meetings go away too.
+        """
 
         # Get current active meetings from database
         db_meetings = self._get_active_meetings_from_db()
@@ -218,21 +390,57 @@ class MeetingService:
         meetings_to_add = db_meeting_ids - redis_meeting_ids
         if meetings_to_add:
             print(f"Syncing {len(meetings_to_add)} meetings from DB to Redis: {meetings_to_add}")
-            for meeting_id in meetings_to_add:
-                result = self._activate_meeting_in_redis(meeting_id)
-                if isinstance(result, dict) and "error" in result:
-                    raise ValueError(f"Error while activating meeting: {result['error']}")
-                print(f"Activated meeting {meeting_id} in Redis")
+            result = self._activate_meetings_in_redis(list(meetings_to_add))
+            if isinstance(result, dict) and "error" in result:
+                raise ValueError(f"Error while activating meeting: {result['error']}")
 
         # also do a sync to remove inactive meetings from redis
         meetings_to_remove = redis_meeting_ids - db_meeting_ids
         if meetings_to_remove:
             print(f"Removing {len(meetings_to_remove)} meetings from Redis: {meetings_to_remove}")
-            for meeting_id in meetings_to_remove:
-                result = self.end_meeting(meeting_id)
-                if isinstance(result, dict) and "error" in result:
-                    raise ValueError(f"Error while deactivating meeting: {result['error']}")
-                print(f"Deactivated meeting {meeting_id} in Redis: {result}")
+            result = self.end_meetings(meetings_to_remove)
+            print(f"Deactivated meetings in Redis: {result}")
+
+        # refresh the invitation indexes along with the full reconcile
+        if rebuild_invitations:
+            self.redis_mgr.drop_invitation_indexes()
+        self.warm_invitation_index()
+
+    def stage_upcoming_meetings(self):
+        """Pre-build in Redis the meetings that start within the staging lead time"""
+        now = datetime.now(timezone.utc)
+        until = now + timedelta(seconds=settings.MEETING_STAGING_LEAD_SECONDS)
+
+        upcoming = self.db.get_upcoming_meetings(now, until)
+        staged = self.redis_mgr.are_meetings_staged(upcoming)
+        meetings_to_stage = [m for m, is_staged in zip(upcoming, staged) if not is_staged]
+
+        if meetings_to_stage:
+            self.redis_mgr.stage_meetings(self.db.get_meetings(meetings_to_stage, primary=True))
+            print(f"Staged {len(meetings_to_stage)} upcoming meetings: {meetings_to_stage}")
+
+    def promote_staged_meetings(self):
+        """Make the staged meetings whose t1 has passed live"""
+        now = datetime.now(timezone.utc).timestamp()
+        promoted = self.redis_mgr.promote_staged_meetings(now)
+        if promoted:
+            self.invalidate_active_meetings_cache()
+            print(f"Activated {len(promoted)} staged meetings: {promoted}")
+        return promoted
+
+    def sweep_expired_meetings(self):
+        """End the active meetings whose t2 has passed, without waiting for a full sync"""
+        now = datetime.now(timezone.utc).timestamp()
+        expired = self.redis_mgr.get_expired_meetings(now)
+        if not expired:
+            return
+
+        result = self.end_meetings(expired)
+        for meeting_id in expired:
+            if str(meeting_id) not in result:
+                # not in the active meetings anymore, drop what is left of it
+                self.redis_mgr.purge_expired_meeting(meeting_id)
+        print(f"Meetings timed out: {result}")
 
     def end_meeting(self, meeting_id):
         """End a meeting and log timeouts for remaining participants"""
@@ -241,28 +449,241 @@ class MeetingService:
         # if not meeting:
         #     return {"error": "Could not find meeting"}
 
-        # Deactivate meeting and get remaining participants
+        # Keep the chat searchable and the occupancy, then deactivate meeting and get remaining participants
+        self._archive_chats([meeting_id])
+        self._archive_occupancy([meeting_id])
         result = self.redis_mgr.deactivate_meeting(meeting_id)
+        self.invalidate_active_meetings_cache()
 
         if isinstance(result, dict) and "error" in result:
             return result # error message
 
         # Log timeout for remaining participants
-        for email in result:
-            self.db.log_action(email, meeting_id, TIME_OUT)
+        self.db.log_actions([(email, meeting_id, TIME_OUT) for email in result])
 
         return result
 
-    def get_meeting_messages(self, meeting_id):
+    def end_meetings(self, meeting_ids):
+        """
+        End many meetings in one batch and log timeouts for their remaining
+        participants. Meetings that are not active are skipped.
+        """
+        self._archive_chats(meeting_ids)
+        self._archive_occupancy(meeting_ids)
+        result = self.redis_mgr.deactivate_meetings(meeting_ids)
+        if result:
+            self.invalidate_active_meetings_cache()
+
+        # Log all the timeouts in a single insert
+        self.db.log_actions([
+            (email, int(meeting_id), TIME_OUT)
+            for meeting_id, emails in result.items()
+            for email in emails
+        ])
+
+        return result
+
+    def _archive_chats(self, meeting_ids):
+        """Copy the chats of meetings that are about to end to the DB, chunk by chunk"""
+        for meeting_id in meeting_ids:
+            for messages in self.redis_mgr.iter_chat_archive(meeting_id):
+                self.db.archive_messages(messages)
+
+    def _archive_occupancy(self, meeting_ids):
+        """Copy the occupancy of meetings that are about to end to the DB"""
+        minute = int(time.time()) // 60 * 60
+        for meeting_id in meeting_ids:
+            occupancy = self.redis_mgr.get_occupancy(meeting_id)
+            if not occupancy or not occupancy[1]:
+                continue
+
+            # the remaining participants time out, so the meeting closes empty
+            buckets = occupancy[1]
+            last_minute, peak, current = buckets[-1]
+            if last_minute >= minute:
+                buckets[-1] = (last_minute, peak, 0)
+            else:
+                buckets.append((minute, current, 0))
+            self.db.archive_occupancy(int(meeting_id), buckets)
+
+    def get_meeting_occupancy(self, meeting_id, start=None, end=None, step=60):
+        """
+        Occupancy of a meeting over time, as points of `step` seconds (whole
+        minutes) from `start` to `end`, each with the peak occupancy in it and
+        the occupancy it closed with. The range defaults to the whole meeting
+        (up to now while it is active), and the step is widened if the range
+        needs more than OCCUPANCY_MAX_POINTS points. Active meetings are read
+        from Redis, ended ones from the DB. Returns None if the meeting has no
+        occupancy.
+        """
+        start = int(to_timestamp(start)) // 60 * 60 if start is not None else None
+        end = int(to_timestamp(end)) // 60 * 60 if end is not None else None
+        if start is not None and end is not None and end < start:
+            return {"error": "The end of the range is before its start"}
+        if step <= 0:
+            return {"error": "The step must be positive"}
+
+        live = True
+        occupancy = self._redis(self.redis_mgr.get_occupancy, meeting_id, start, end)
+        if occupancy is None:
+            live = False
+            occupancy = self.db.get_occupancy(meeting_id, start, end)
+            if occupancy is None:
+                return None
+        before, buckets = occupancy
+
+        if start is None:
+            if not buckets:
+                return {"meeting_id": meeting_id, "step": step, "points": []}
+            start = buckets[0][0]
+        if end is None:
+            if live:
+                end = int(time.time()) // 60 * 60
+            else:
+                end = buckets[-1][0] if buckets else before[0]
+
+        minutes = (end - start) // 60 + 1
+        step = max(-(-step // 60), -(-minutes // OCCUPANCY_MAX_POINTS)) * 60
+
+        # walk the points and the buckets together, the minutes without a
+        # bucket keep the occupancy of the previous one
+        current = before[2] if before else 0
+        points, i = [], 0
+        for timestamp in range(start, end + 1, step):
+            peak = current
+            while i < len(buckets) and buckets[i][0] < timestamp + step:
+                _, bucket_peak, current = buckets[i]
+                peak = max(peak, bucket_peak)
+                i += 1
+            points.append({
+                "timestamp": datetime.fromtimestamp(timestamp, timezone.utc),
+                "peak": peak,
+                "occupancy": current
+            })
+
+        return {"meeting_id": meeting_id, "step": step, "points": points}
+
+    def _parse_bbox(self, bbox):
+        """
+        Parse a "min_long,min_lat,max_long,max_lat" bounding box (the whole
+        world if None). min_long is above max_long for boxes that cross the
+        antimeridian.
+        """
+        if bbox is None:
+            return -180.0, -90.0, 180.0, 90.0
+
+        try:
+            min_long, min_lat, max_long, max_lat = (float(v) for v in bbox.split(","))
+        except ValueError:
+            return {"error": "The bounding box must be min_long,min_lat,max_long,max_lat"}
+        if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_long <= 180 and -180 <= max_long <= 180):
+            return {"error": "The bounding box is out of range"}
+        return min_long, min_lat, max_long, max_lat
+
+    def get_heatmap(self, bbox=None, precision=HEATMAP_PRECISION):
+        """
+        Active meetings and joined users per geohash cell within a bounding box
+        ("min_long,min_lat,max_long,max_lat", the whole world by default), as a
+        GeoJSON FeatureCollection of the non-empty cells. The precision is
+        lowered until the box spans at most HEATMAP_MAX_CELLS cells.
+        """
+        box = self._parse_bbox(bbox)
+        if isinstance(box, dict):
+            return box  # error message
+        min_long, min_lat, max_long, max_lat = box
+        if not 1 <= precision <= HEATMAP_PRECISION:
+            return {"error": f"The precision must be between 1 and {HEATMAP_PRECISION}"}
+
+        if max_long < min_long:
+            max_long += 360.0  # the box crosses the antimeridian
+        while precision > 1 and geohash_box_cell_count(min_lat, min_long, max_lat, max_long, precision) > HEATMAP_MAX_CELLS:
+            precision -= 1
+
+        cells = geohash_cells_in_box(min_lat, min_long, max_lat, max_long, precision)
+        counters = self._redis(self.redis_mgr.get_heatmap, cells)
+        return {
+            "type": "FeatureCollection",
+            "precision": precision,
+            "features": [
+                geohash_to_geojson(cell, {"meetings": meetings, "joined": joined})
+                for cell, meetings, joined in counters
+            ]
+        }
+
+    def get_active_meetings_geojson(self, bbox=None, limit=GEOJSON_LIMIT):
+        """
+        Active meetings within a bounding box ("min_long,min_lat,max_long,max_lat",
+        the whole world by default), up to `limit` of them nearest to its
+        center first. Returns an iterator of the encoded chunks of a GeoJSON
+        FeatureCollection, the meetings are read a chunk at a time.
+        """
+        box = self._parse_bbox(bbox)
+        if isinstance(box, dict):
+            return box  # error message
+        if not 1 <= limit <= MAX_GEOJSON_LIMIT:
+            return {"error": f"The limit must be between 1 and {MAX_GEOJSON_LIMIT}"}
+        min_long, min_lat, max_long, max_lat = box
+
+        # the positions are indexed in the (lat, long) order of the meetings,
+        # so the latitude is the x axis of the index and the longitude the y
+        long_ranges = [(min_long, max_long)] if min_long <= max_long else [(min_long, 180.0), (-180.0, max_long)]
+        positions = []
+        for low, high in long_ranges:
+            positions.extend(self._redis(
+                self.redis_mgr.search_positions_in_box, min_lat, low, max_lat, high, limit - len(positions)
+            ))
+        return self._stream_geojson(positions)
+
+    def _stream_geojson(self, positions):
+        """Encode the meetings at (meeting_id, lat, long) positions as GeoJSON, chunk by chunk"""
+        coordinates = {meeting_id: (lat, long) for meeting_id, lat, long in positions}
+        yield b'{"type":"FeatureCollection","features":['
+        separator = b""
+        for meetings in self.redis_mgr.iter_meeting_details(list(coordinates)):
+            features = []
+            for meeting_id, meeting in meetings:
+                lat, long = coordinates[meeting_id]
+                meeting.update(meeting_id=int(meeting_id), lat=lat, long=long)
+                features.append(orjson.dumps(meeting_to_geojson(meeting)))
+            if features:
+                yield separator + b",".join(features)
+                separator = b","
+        yield b"]}"
+
+    def search_meeting_messages(self, meeting_id, query, offset=0, limit=SEARCH_PAGE_SIZE):
+        """
+        Search the chat of a meeting, best match first. The chats of active
+        meetings are searched in Redis, the ones of ended meetings in the
+        archive. Returns (page of messages, offset of the next page or None).
+        """
+        offset = max(offset, 0)
+        limit = min(max(limit, 1), MAX_SEARCH_PAGE_SIZE)
+
+        if self._redis(self.redis_mgr.are_meetings_active, [meeting_id])[0]:
+            result = self._redis(self.redis_mgr.search_meeting_messages, meeting_id, query, offset, limit)
+            if isinstance(result, dict) and "error" in result:
+                return result # error message
+
+            matches, messages = result
+            next_offset = offset + limit if offset + limit < matches else None
+            return messages, next_offset
+
+        # one extra row tells if there is a next page
+        tokens = sorted(set(tokenize(query)))
+        messages = self.db.search_messages(meeting_id, tokens, offset, limit + 1)
+        next_offset = offset + limit if len(messages) > limit else None
+        return messages[:limit], next_offset
+
+    def get_meeting_messages(self, meeting_id, as_json=False):
         """Get all messages from a meeting chat"""
         # Check if the meeting exists
         # meeting = self.db.get_meeting(meeting_id)
         # if not meeting:
         #     return {"error": "Could not find meeting"}
 
-        return self.redis_mgr.get_meeting_messages(meeting_id)
+        return self._redis(self.redis_mgr.get_meeting_messages, meeting_id, as_json)
 
-    def get_user_messages(self, email, meeting_id=None):
+    def get_user_messages(self, email, meeting_id=None, as_json=False):
         """Get all messages posted by a user"""
         # Check if the meeting exists
         # if meeting_id:
@@ -275,31 +696,100 @@ class MeetingService:
         # if not user:
         #     return {"error": "User not found"}
 
-        return self.redis_mgr.get_user_meeting_messages(email, meeting_id)
+        return self._redis(self.redis_mgr.get_user_meeting_messages, email, meeting_id, as_json)
 
-    def get_meetings_by_user(self, email: str):
+    def get_user_message_history(self, email, since=None, until=None, cursor=None, limit=HISTORY_PAGE_SIZE):
         """
-        Retrieve all meetings where the given email is listed as a participant.
+        Get the messages a user posted across all meetings, newest first,
+        optionally between `since` and `until`. The messages of active meetings
+        come from Redis, the ones of ended meetings from the archive. Returns
+        (page of messages, cursor of the next page or None).
         """
+        limit = min(max(limit, 1), MAX_HISTORY_PAGE_SIZE)
+
+        # the cursor is the (timestamp, meeting ID, position) of the last message of a page
+        before = None
+        if cursor:
+            try:
+                timestamp, meeting_id, position = cursor.rsplit("_", 2)
+                before = (to_naive_utc(datetime.fromisoformat(timestamp.replace('Z', '+00:00'))), int(meeting_id), int(position))
+            except ValueError:
+                return {"error": "Invalid cursor"}
+
+        since = to_naive_utc(since) if since else None
+        until = to_naive_utc(until) if until else None
+
+        # one extra message from each side tells if there is a next page
+        live = self._redis(
+            self.redis_mgr.get_user_message_history,
+            email,
+            to_timestamp(since) if since else float("-inf"),
+            to_timestamp(until) if until else float("inf"),
+            (to_timestamp(before[0]), before[1], before[2]) if before else None,
+            limit + 1
+        )
+        archived = self.db.get_user_messages(email, since, until, before, limit + 1)
+
+        # a meeting that is ending can be in both for a moment
+        messages = {}
+        for message in archived + live:
+            message["timestamp"] = to_iso_utc(message["timestamp"])
+            messages[(message["meeting_id"], message["position"])] = message
+
+        messages = sorted(
+            messages.values(),
+            key=lambda m: (to_timestamp(m["timestamp"]), m["meeting_id"], m["position"]),
+            reverse=True
+        )
 
-        # try to find in cache
-        meeting_ids = self.redis_mgr.get_user_invited_meetings(email)
-
-        if meeting_ids:
-            return meeting_ids
+        next_cursor = None
+        if len(messages) > limit:
+            last = messages[limit - 1]
+            next_cursor = f"{last['timestamp']}_{last['meeting_id']}_{last['position']}"
+        return messages[:limit], next_cursor
 
-        # cache miss, retrieve from db
+    def get_meetings_by_user(self, email: str):
+        """
+        Retrieve all the active or scheduled meetings where the given email is
+        listed as a participant.
+        """
+        now = datetime.now(timezone.utc)
 
-        # Query DB for meetings matching the user
-        meetings = self.db.get_meetings_by_user(email)
+        # try to find in cache, users without invitations are cached too
+        try:
+            meeting_ids = self._redis(self.redis_mgr.get_user_invitations, email, now.timestamp())
+        except BackendUnavailableError:
+            # degraded mode, served from the db
+            invitations = self._invitations_by_user(self.db.get_invitations(now, email))
+            return sorted(invitations.get(email, {}))
 
-        # Return meeting IDs only
-        if meetings:
-            # Convert to integer IDs
-            meeting_ids = [meeting.get('meeting_id') for meeting in meetings]
-            print(f"Returning meeting IDs: {meeting_ids}")
+        if meeting_ids is not None:
             return meeting_ids
-        return []
+
+        # cache miss, retrieve from db and warm the user's index
+        invitations = self._invitations_by_user(self.db.get_invitations(now, email))
+        user_invitations = invitations.get(email, {})
+        self._redis_write(self.redis_mgr.set_user_invitations, {email: user_invitations}, now.timestamp())
+
+        return sorted(user_invitations)
+
+    def warm_invitation_index(self):
+        """Load the invitation index of every user with a not ended meeting from the DB"""
+        now = datetime.now(timezone.utc)
+        invitations = self._invitations_by_user(self.db.get_invitations(now))
+        if invitations:
+            self.redis_mgr.set_user_invitations(invitations, now.timestamp())
+            print(f"Warmed the invitation index of {len(invitations)} users")
+
+    def _invitations_by_user(self, rows):
+        """Group (meeting_id, t2, participants) rows into {email: {meeting_id: t2}}"""
+        invitations = {}
+        for meeting_id, t2, participants in rows:
+            for email in participants.split(","):
+                email = email.strip()
+                if email:
+                    invitations.setdefault(email, {})[meeting_id] = int(to_timestamp(t2))
+        return invitations
 
     def delete_meeting(self, meeting_id: int, email: str = None):
         """
@@ -311,12 +801,33 @@ class MeetingService:
             return None
 
         # If email is provided, ensure user is creator/participant
-        if email and email not in meeting.get("participants", []):
+        participants = list(meeting.get("participants", []))
+        if email and email not in participants:
             return {"error": "Not authorized to delete this meeting"}
 
-        # Deactivate in Redis if active
-        self.end_meeting(meeting_id)
+        # Deactivate in Redis if active, or drop it if it is only staged
+        self._redis_write(self.end_meeting, meeting_id)
+        self._redis_write(self.redis_mgr.unstage_meeting, meeting_id)
+        self._redis_write(self.redis_mgr.remove_invitations, meeting_id, ",".join(participants))
 
         # Delete in DB
         result = self.db.delete_meeting(meeting_id)
-        return result
\ No newline at end of file
+        return result
+
+
+# MeetingService singleton, created on first use
+_meeting_service = None
+
+def _reset_meeting_service():
+    """Drop the instance inherited from the parent in a forked worker"""
+    global _meeting_service
+    _meeting_service = None
+
+os.register_at_fork(after_in_child=_reset_meeting_service)
+
+def get_meeting_service():
+    """Get or create the meeting service instance"""
+    global _meeting_service
+    if _meeting_service is None:
+        _meeting_service = MeetingService()
+    return _meeting_service
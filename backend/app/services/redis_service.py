@@ -1,42 +1,776 @@
+import os
 import json
-import redis
-import fakeredis
-from geopy.distance import geodesic
-from datetime import datetime
+import math
+import time
+import zlib
+import hashlib
+from collections import Counter
+from datetime import datetime, timezone
+
+import orjson
 
 from app.core.config import settings
+from app.core.circuit_breaker import CircuitBreaker, BackendUnavailableError
+from app.core.metrics import metrics
+from app.core.constants import MAX_MEETING_DISTANCE, DEACTIVATE_CHUNK_SIZE, SEARCH_CACHE_SECONDS, HEATMAP_PRECISION
+from app.utils.geo_utils import geohash_encode, geohash_cells, geohash_box_cell_count, geohash_cells_in_box
+from app.utils.geo_utils import KM_PER_DEG_LAT, EARTH_RADIUS_KM
+from app.utils.time_utils import to_timestamp, to_naive_utc, to_iso_utc
+from app.utils.text_utils import tokenize
+
+# Record the occupancy of a meeting (the size of its joined set) in the bucket
+# of the current minute. The buckets are "<minute>:<peak>:<occupancy>" members
+# of a sorted set scored by the minute: the peak of the minute, and the
+# occupancy after its last change. A new bucket starts from the occupancy the
+# previous one closed with. Meetings activated without the set are skipped
+OCCUPANCY_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    return -1
+end
+local occupancy = redis.call('SCARD', KEYS[1])
+local minute = tonumber(ARGV[1])
+local peak = occupancy
+local bucket = redis.call('ZRANGEBYSCORE', KEYS[2], minute, minute)[1]
+if bucket then
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], minute, minute)
+    local _, bucket_peak = string.match(bucket, '^(%d+):(%d+):(%d+)$')
+    peak = math.max(peak, tonumber(bucket_peak))
+else
+    bucket = redis.call('ZREVRANGEBYSCORE', KEYS[2], '(' .. minute, '-inf', 'LIMIT', 0, 1)[1]
+    if bucket then
+        local _, _, closed = string.match(bucket, '^(%d+):(%d+):(%d+)$')
+        peak = math.max(peak, tonumber(closed))
+    end
+end
+redis.call('ZADD', KEYS[2], minute, minute .. ':' .. peak .. ':' .. occupancy)
+return occupancy
+"""
+
+# Update the heatmap counters, kept in a single hash: `m:<cell>` active
+# meetings and `u:<cell>` joined users, for every prefix of the geohash of each
+# meeting, plus `c:<id>` the geohash and `j:<id>` the joined users counted for
+# every active meeting, so a deactivation takes back exactly what was added
+# even after the keys of the meeting expired. ARGV is the operation, the
+# meeting ID, and the geohash (activate) or +1/-1 (join/leave)
+HEATMAP_SCRIPT = """
+local cell_field, joined_field = 'c:' .. ARGV[2], 'j:' .. ARGV[2]
+local function add(kind, cell, delta)
+    if delta == 0 then
+        return
+    end
+    for i = 1, #cell do
+        local field = kind .. ':' .. string.sub(cell, 1, i)
+        if redis.call('HINCRBY', KEYS[1], field, delta) <= 0 then
+            redis.call('HDEL', KEYS[1], field)
+        end
+    end
+end
+
+local cell = redis.call('HGET', KEYS[1], cell_field)
+if ARGV[1] == 'activate' or ARGV[1] == 'deactivate' then
+    if cell then
+        add('m', cell, -1)
+        add('u', cell, -tonumber(redis.call('HGET', KEYS[1], joined_field) or '0'))
+        redis.call('HDEL', KEYS[1], cell_field, joined_field)
+    end
+    if ARGV[1] == 'activate' then
+        redis.call('HSET', KEYS[1], cell_field, ARGV[3], joined_field, 0)
+        add('m', ARGV[3], 1)
+    end
+elseif cell then
+    local delta = tonumber(ARGV[3])
+    redis.call('HINCRBY', KEYS[1], joined_field, delta)
+    add('u', cell, delta)
+end
+return 1
+"""
+
+# Accept or drop a location ping of a user, against the last accepted one in
+# the same call, so concurrent batches can't both let a ping through. The
+# throttle runs on the clock of Redis, never on the time claimed by the client.
+# ARGV is x, y, throttle seconds, refresh seconds, min distance (meters), TTL
+# and the earth radius (meters). Returns 1 if the ping was accepted
+LOCATION_SCRIPT = """
+local x, y = tonumber(ARGV[1]), tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local prev = redis.call('HMGET', KEYS[1], 'x', 'y', 'ts')
+if prev[3] then
+    local elapsed = now - tonumber(prev[3])
+    if elapsed < tonumber(ARGV[3]) then
+        return 0
+    end
+
+    -- haversine distance from the last accepted position, x is the longitude
+    local lat1, lat2 = math.rad(tonumber(prev[2])), math.rad(y)
+    local dlat, dlon = lat2 - lat1, math.rad(x - tonumber(prev[1]))
+    local a = math.sin(dlat / 2) ^ 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ^ 2
+    local moved = 2 * tonumber(ARGV[7]) * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    if moved < tonumber(ARGV[5]) and elapsed < tonumber(ARGV[4]) then
+        return 0
+    end
+end
+
+redis.call('HSET', KEYS[1], 'x', ARGV[1], 'y', ARGV[2], 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[6]))
+return 1
+"""
+
+# Add a meeting to the invitation index of a user, only if the index is cached
+# (holds the sentinel). Checked in the same call, so an index that expires in
+# between is not recreated with this meeting alone. ARGV is the sentinel, the
+# meeting ID and its t2
+ADD_INVITATION_SCRIPT = """
+if redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+def _parse_bucket(member):
+    """(minute, peak, occupancy) of an occupancy bucket"""
+    minute, peak, occupancy = member.split(":")
+    return int(minute), int(peak), int(occupancy)
+
+# Latitude limits of the Redis geospatial indexes
+GEO_MAX_LATITUDE = 85.05112878
+
+def _split_emails(participants):
+    """Split a comma separated participants string into emails"""
+    emails = [email.strip() for email in participants.split(",")]
+    return [email for email in emails if email]  # Skip empty emails
+
+def _chunks(items, size):
+    """Split an iterable in lists of at most `size` items"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
 class RedisManager:
-    def __init__(self, fake=None):
+    def __init__(self, fake=None, compact=None, cluster=None):
         # Determine if using fake Redis based on settings or override parameter
         use_fake = fake if fake is not None else settings.USE_FAKE_REDIS
 
+        # In cluster mode the keys of a meeting, and the keys of a user, carry
+        # a hash tag so each group lives in a single slot. A fake Redis is a
+        # single node, but it can still be used to try out the key layout
+        self.cluster = cluster if cluster is not None else settings.REDIS_CLUSTER
+
+        # In compact mode emails are interned to integer user IDs and chat
+        # messages are stored as msgpack instead of JSON
+        self.compact = compact if compact is not None else settings.REDIS_COMPACT_ENCODING
+
+        # The backend clients are imported on demand, so only the one in use gets loaded
         if use_fake:
-            self.redis_client = fakeredis.FakeStrictRedis(decode_responses=True)
+            import fakeredis
+            server = fakeredis.FakeServer()
+            self.redis_client = fakeredis.FakeStrictRedis(server=server, decode_responses=True)
         else:
-            self.redis_client = redis.Redis(
-                host=settings.REDIS_HOST,
-                port=settings.REDIS_PORT,
-                db=settings.REDIS_DB,
-                decode_responses=True
-            )
-
-        # Redis keys
+            self.redis_client = self._connect(decode_responses=True)
+
+        # Chat lists are read/written through this client. msgpack payloads
+        # are binary, so compact mode needs a client that does not decode them
+        self.chat_client = self.redis_client
+        if self.compact:
+            import msgpack
+            self.msgpack = msgpack
+
+            if use_fake:
+                self.chat_client = fakeredis.FakeStrictRedis(server=server)
+            else:
+                self.chat_client = self._connect()
+
+        # The meeting positions are spread over the geo shards by region,
+        # without shards they live in the main Redis
+        self.geo_shards = None
+        if settings.REDIS_GEO_SHARDS:
+            if use_fake:
+                self.geo_shards = [
+                    fakeredis.FakeStrictRedis(server=fakeredis.FakeServer(), decode_responses=True)
+                    for _ in settings.REDIS_GEO_SHARDS
+                ]
+            else:
+                self.geo_shards = [self._connect_url(url) for url in settings.REDIS_GEO_SHARDS]
+
+        # Redis keys. Global structures are single keys, the per-meeting and
+        # per-user keys are built by the key builders below
         self.active_meetings_key = "active_meetings"  # Set of active meeting IDs
         self.meeting_prefix = "meeting:"  # Prefix for meeting hash
         self.meeting_positions_key = "meeting_positions" # Key for meetings geospatials
+        self.meeting_shards_key = "meeting_shards"  # Hash of active meeting ID -> geo shard of its position
+        self.meeting_expiry_key = "meeting_expiry"  # Sorted set of active meeting IDs scored by t2
+        self.staged_meetings_key = "staged_meetings"  # Sorted set of pre-staged meeting IDs scored by t1
+        self.staged_positions_key = "staged_positions"  # Geospatials of the pre-staged meetings
+        self.staging_prefix = "staging:"  # Prefix for the keys of a meeting before it goes live
         self.participants_prefix = "participants:"  # Prefix for participants set
         self.joined_prefix = "joined:"  # Prefix for joined participants set
         self.chat_prefix = "chat:"  # Prefix for chat list of meetings
+        self.chat_index_prefix = "chat_index:"  # Prefix for the chat positions of a word, per meeting
+        self.chat_terms_prefix = "chat_terms:"  # Prefix for the indexed words of a meeting chat
+        self.chat_search_prefix = "chat_search:"  # Prefix for the ranked results of a chat search
+        self.meeting_version_prefix = "meeting_version:"  # Prefix for the change counters of a meeting
+        self.occupancy_prefix = "occupancy:"  # Prefix for the per-minute occupancy buckets of a meeting
         self.user_joined_meeting = "user_joined_meeting:"  # Prefix for user's joined meeting
         self.user_participate_meetings = "user_participate_meetings:"  # Prefix for all meetings the user is a participant
+        self.user_location_prefix = "user_location:"  # Prefix for the latest reported position of a user
+        self.user_messages_prefix = "user_messages:"  # Prefix for the messages of a user in the active meetings, by time
+        self.user_ids_key = "user_ids"  # Hash of email -> interned user ID (compact mode)
+        self.user_emails_key = "user_emails"  # Hash of interned user ID -> email (compact mode)
+        self.user_id_counter_key = "user_id_counter"  # Last assigned user ID (compact mode)
+        self.scheduler_lock_key = "scheduler_leader"  # ID of the process that runs the background jobs
+        self.sync_state_key = "sync_state"  # Watermarks of the incremental DB -> Redis sync
+        self.heatmap_key = "heatmap"  # Hash of the per-geohash counters of active meetings and joined users
+        self.recent_write_prefix = "recent_write:"  # Prefix for the marks of the users/meetings just written to the DB
+        self.active_version_key = "active_meetings_version"  # Bumped whenever the active meetings change
+        self.user_invitations_prefix = "user_invitations:"  # Prefix for all not ended meetings the user is invited to
+        self.invitations_sentinel = "0"  # Member of every warmed invitation index, marks it as cached even if empty
+
+        # Interned IDs never change, so they can be cached per process
+        self._user_ids = {}
+        self._user_emails = {}
+
+        # registered on first use, so creating the manager opens no connections
+        self.occupancy_script = None
+        self.heatmap_script = None
+        self.location_script = None
+        self.add_invitation_script = None
+
+    def _connect(self, **kwargs):
+        """Connect to the Redis server, or to the cluster it is a node of"""
+        options = dict(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+            **kwargs
+        )
+        if self.cluster:
+            from redis.cluster import RedisCluster
+
+            # the rest of the nodes are discovered from this one, a cluster has no databases
+            return RedisCluster(**options)
+
+        import redis
+        return redis.Redis(db=settings.REDIS_DB, **options)
+
+    def _connect_url(self, url):
+        """Connect to a geo shard"""
+        import redis
+        return redis.Redis.from_url(
+            url,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+            decode_responses=True
+        )
+
+    # User references (emails or interned IDs)
+
+    def _intern_user(self, email, create=True):
+        """Get the integer ID of an email, assigning a new one if needed"""
+        user_id = self._user_ids.get(email)
+        if user_id is not None:
+            return user_id
+
+        user_id = self.redis_client.hget(self.user_ids_key, email)
+        if user_id is None:
+            if not create:
+                return None
+            new_id = self.redis_client.incr(self.user_id_counter_key)
+            # another process may have interned the same email in the meantime
+            if self.redis_client.hsetnx(self.user_ids_key, email, new_id):
+                self.redis_client.hset(self.user_emails_key, new_id, email)
+                user_id = new_id
+            else:
+                user_id = self.redis_client.hget(self.user_ids_key, email)
+
+        self._user_ids[email] = str(user_id)
+        self._user_emails[str(user_id)] = email
+        return str(user_id)
+
+    def _user_ref(self, email, create=True):
+        """
+        Get the value that represents a user in set members and key suffixes.
+        That is the email itself, or its interned ID in compact mode. Returns
+        None if `create` is False and the user was never interned.
+        """
+        if not self.compact:
+            return email
+        return self._intern_user(email, create)
+
+    def _user_refs(self, emails):
+        """Get the references of many users, interning the unknown ones"""
+        if not self.compact:
+            return list(emails)
+
+        missing = [e for e in emails if e not in self._user_ids]
+        if missing:
+            known = self.redis_client.hmget(self.user_ids_key, missing)
+            for email, user_id in zip(missing, known):
+                if user_id is not None:
+                    self._user_ids[email] = user_id
+                    self._user_emails[user_id] = email
+
+        return [self._intern_user(e) for e in emails]
+
+    def _user_emails_of(self, refs):
+        """Resolve user references (set members) back to emails"""
+        if not self.compact:
+            return list(refs)
+
+        refs = [str(r) for r in refs]
+        missing = [r for r in refs if r not in self._user_emails]
+        if missing:
+            emails = self.redis_client.hmget(self.user_emails_key, missing)
+            for user_id, email in zip(missing, emails):
+                if email is not None:
+                    self._user_emails[user_id] = email
+                    self._user_ids[email] = user_id
+
+        return [self._user_emails.get(r, r) for r in refs]
+
+    # Key builders
+
+    def _meeting_tag(self, meeting_id):
+        """The meeting ID in its keys, `{m:<id>}` in cluster mode so they share a slot"""
+        return f"{{m:{meeting_id}}}" if self.cluster else meeting_id
+
+    def _user_tag(self, user_ref):
+        """The user reference in its keys, `{u:<ref>}` in cluster mode so they share a slot"""
+        return f"{{u:{user_ref}}}" if self.cluster else user_ref
+
+    def _meeting_key(self, meeting_id):
+        return f"{self.meeting_prefix}{self._meeting_tag(meeting_id)}"
+
+    def _participants_key(self, meeting_id):
+        return f"{self.participants_prefix}{self._meeting_tag(meeting_id)}"
+
+    def _joined_key(self, meeting_id):
+        return f"{self.joined_prefix}{self._meeting_tag(meeting_id)}"
+
+    def _chat_key(self, meeting_id):
+        return f"{self.chat_prefix}{self._meeting_tag(meeting_id)}"
+
+    def _user_chat_key(self, meeting_id, user_ref):
+        return f"{self.chat_prefix}{self._meeting_tag(meeting_id)}:{user_ref}"
+
+    def _chat_index_key(self, meeting_id, token):
+        return f"{self.chat_index_prefix}{self._meeting_tag(meeting_id)}:{token}"
+
+    def _chat_terms_key(self, meeting_id):
+        return f"{self.chat_terms_prefix}{self._meeting_tag(meeting_id)}"
+
+    def _chat_search_key(self, meeting_id, version, tokens):
+        digest = hashlib.sha1(" ".join(sorted(tokens)).encode()).hexdigest()[:16]
+        return f"{self.chat_search_prefix}{self._meeting_tag(meeting_id)}:{version}:{digest}"
+
+    def _meeting_version_key(self, meeting_id):
+        return f"{self.meeting_version_prefix}{self._meeting_tag(meeting_id)}"
+
+    def _occupancy_key(self, meeting_id):
+        return f"{self.occupancy_prefix}{self._meeting_tag(meeting_id)}"
+
+    def _user_joined_key(self, user_ref):
+        return f"{self.user_joined_meeting}{self._user_tag(user_ref)}"
+
+    def _user_participate_key(self, user_ref):
+        return f"{self.user_participate_meetings}{self._user_tag(user_ref)}"
+
+    def _user_location_key(self, user_ref):
+        return f"{self.user_location_prefix}{self._user_tag(user_ref)}"
+
+    def _user_invitations_key(self, user_ref):
+        return f"{self.user_invitations_prefix}{self._user_tag(user_ref)}"
+
+    def _user_messages_key(self, user_ref):
+        return f"{self.user_messages_prefix}{self._user_tag(user_ref)}"
+
+    def _staging_key(self, key):
+        # the hash tag of `key` is kept, so RENAME moves it within the slot
+        return f"{self.staging_prefix}{key}"
+
+    def _pipeline(self, transaction=False):
+        """
+        A pipeline, wrapped in MULTI/EXEC if `transaction` is set. Transactions
+        can't span slots, so in cluster mode the commands are only batched,
+        in the order they were queued.
+        """
+        return self.redis_client.pipeline(transaction=transaction and not self.cluster)
+
+    # Meeting positions (geo shards)
+
+    def _geo_shard_of_cell(self, cell):
+        return zlib.crc32(cell.encode()) % len(self.geo_shards)
+
+    def _geo_shard(self, lon, lat):
+        """Index of the geo shard of the region a point falls in"""
+        return self._geo_shard_of_cell(geohash_encode(lat, lon, settings.REDIS_GEO_SHARD_PRECISION))
+
+    def _geo_shards_near(self, lon, lat, max_distance):
+        """Indexes of the geo shards whose regions overlap a search radius (meters)"""
+        cells = geohash_cells(lat, lon, max_distance / 1000, settings.REDIS_GEO_SHARD_PRECISION)
+        return sorted({self._geo_shard_of_cell(cell) for cell in cells})
+
+    def _add_positions(self, positions, pipe=None):
+        """
+        Index the (lon, lat, meeting_id) positions of live meetings. Without
+        geo shards they are queued on `pipe` if one is given, with geo shards
+        they are written right away.
+        """
+        if not self.geo_shards:
+            client = pipe if pipe is not None else self.redis_client
+            client.geoadd(self.meeting_positions_key, [v for position in positions for v in position])
+            return
+
+        by_shard = {}
+        for lon, lat, meeting_id in positions:
+            by_shard.setdefault(self._geo_shard(lon, lat), []).append((lon, lat, meeting_id))
+
+        for shard, shard_positions in by_shard.items():
+            self.geo_shards[shard].geoadd(
+                self.meeting_positions_key,
+                [v for position in shard_positions for v in position]
+            )
+
+        # remember the shard of every meeting, to find its position again
+        self.redis_client.hset(self.meeting_shards_key, mapping={
+            meeting_id: shard
+            for shard, shard_positions in by_shard.items()
+            for _, _, meeting_id in shard_positions
+        })
+
+    def _remove_positions(self, meeting_ids, pipe=None):
+        """
+        Drop meetings from the positions index. Without geo shards this is
+        queued on `pipe` if one is given.
+        """
+        if not self.geo_shards:
+            client = pipe if pipe is not None else self.redis_client
+            client.zrem(self.meeting_positions_key, *meeting_ids)
+            return
+
+        by_shard = {}
+        for meeting_id, shard in zip(meeting_ids, self.redis_client.hmget(self.meeting_shards_key, meeting_ids)):
+            if shard is not None:
+                by_shard.setdefault(int(shard), []).append(meeting_id)
+
+        for shard, shard_meeting_ids in by_shard.items():
+            self.geo_shards[shard].zrem(self.meeting_positions_key, *shard_meeting_ids)
+        self.redis_client.hdel(self.meeting_shards_key, *meeting_ids)
+
+    def _get_position(self, meeting_id):
+        """Get the (lon, lat) of a live meeting"""
+        if not self.geo_shards:
+            return self.redis_client.geopos(self.meeting_positions_key, meeting_id)[0]
+
+        shard = self.redis_client.hget(self.meeting_shards_key, meeting_id)
+        if shard is None:
+            return None
+        return self.geo_shards[int(shard)].geopos(self.meeting_positions_key, meeting_id)[0]
+
+    def _search_geo_shards(self, points, max_distance, sort=None):
+        """
+        Find the meetings within `max_distance` meters of every (x, y) point,
+        searching only the geo shards that overlap each radius, with one
+        pipeline per shard. Returns a list of meeting IDs per point, nearest
+        first if `sort` is "ASC".
+        """
+        searches = {}  # shard -> indexes of the points searched on it
+        for i, (x, y) in enumerate(points):
+            for shard in self._geo_shards_near(x, y, max_distance):
+                searches.setdefault(shard, []).append(i)
+
+        found = [[] for _ in points]
+        for shard, point_indexes in searches.items():
+            pipe = self.geo_shards[shard].pipeline(transaction=False)
+            for i in point_indexes:
+                x, y = points[i]
+                pipe.geosearch(
+                    self.meeting_positions_key,
+                    longitude=x,
+                    latitude=y,
+                    radius=max_distance,
+                    unit="m",
+                    withdist=True
+                )
+            for i, results in zip(point_indexes, pipe.execute()):
+                found[i].extend(results)
+            metrics.incr(f"geo_shard_searches.{shard}", len(point_indexes))
+
+        if sort == "ASC":
+            found = [sorted(results, key=lambda result: result[1]) for results in found]
+        return [[str(meeting_id) for meeting_id, _ in results] for results in found]
+
+    def _geo_shards_in_box(self, min_x, min_y, max_x, max_y):
+        """Indexes of the geo shards whose regions overlap a box of the positions index"""
+        precision = settings.REDIS_GEO_SHARD_PRECISION
+        if geohash_box_cell_count(min_y, min_x, max_y, max_x, precision) > 32 * len(self.geo_shards):
+            return list(range(len(self.geo_shards)))  # cheaper to ask every shard
+        cells = geohash_cells_in_box(min_y, min_x, max_y, max_x, precision)
+        return sorted({self._geo_shard_of_cell(cell) for cell in cells})
+
+    def search_positions_in_box(self, min_x, min_y, max_x, max_y, limit):
+        """
+        Find up to `limit` live meetings whose positions are within a box of
+        the positions index, nearest to its center first. Returns
+        (meeting_id, x, y) tuples.
+        """
+        min_y, max_y = max(min_y, -GEO_MAX_LATITUDE), min(max_y, GEO_MAX_LATITUDE)
+        if min_x > max_x or min_y > max_y or limit <= 0:
+            return []
+
+        # BYBOX takes the size of the box in meters, measured along the latitude
+        # of every position. Sizing it where the box is widest (closest to the
+        # equator) covers the whole box, and the matches are then cut to it
+        center_x, center_y = (min_x + max_x) / 2, (min_y + max_y) / 2
+        widest = 0.0 if min_y <= 0 <= max_y else min(abs(min_y), abs(max_y))
+        width = (max_x - min_x) * KM_PER_DEG_LAT * 1010 * math.cos(math.radians(widest)) + 1
+        height = (max_y - min_y) * KM_PER_DEG_LAT * 1010 + 1
+
+        if self.geo_shards:
+            clients = [self.geo_shards[shard] for shard in self._geo_shards_in_box(min_x, min_y, max_x, max_y)]
+        else:
+            clients = [self.redis_client]
+
+        found = []
+        for client in clients:
+            # positions just outside the box take slots of the COUNT, so ask
+            # for more until there are enough matches or no more positions
+            count = limit
+            while True:
+                results = client.geosearch(
+                    self.meeting_positions_key,
+                    longitude=center_x,
+                    latitude=center_y,
+                    width=width,
+                    height=height,
+                    unit="m",
+                    sort="ASC",
+                    count=count,
+                    withdist=True,
+                    withcoord=True
+                )
+                matches = [
+                    (distance, meeting_id, x, y)
+                    for meeting_id, distance, (x, y) in results
+                    if min_x <= x <= max_x and min_y <= y <= max_y
+                ]
+                if len(matches) >= limit or len(results) < count:
+                    break
+                count *= 4
+            found.extend(matches[:limit])
+
+        found.sort()
+        return [(meeting_id, x, y) for _, meeting_id, x, y in found[:limit]]
+
+    def iter_meeting_details(self, meeting_ids, chunk_size=DEACTIVATE_CHUNK_SIZE):
+        """
+        Read the details of many meetings with pipelined HGETALLs, yielding a
+        list of (meeting_id, details) per chunk. Meetings whose details are
+        gone are skipped.
+        """
+        for chunk in _chunks(meeting_ids, chunk_size):
+            pipe = self.redis_client.pipeline(transaction=False)
+            for meeting_id in chunk:
+                pipe.hgetall(self._meeting_key(meeting_id))
+            yield [(meeting_id, meeting) for meeting_id, meeting in zip(chunk, pipe.execute()) if meeting]
+
+    # Meeting expiry
+
+    def _meeting_deadline(self, meeting_id):
+        """Epoch second at which the keys of an active meeting expire (t2 + grace)"""
+        t2 = self.redis_client.zscore(self.meeting_expiry_key, meeting_id)
+        if t2 is None:
+            return None
+        return int(t2) + settings.MEETING_EXPIRY_GRACE_SECONDS
+
+    def _expire_with_meeting(self, meeting_id, *keys):
+        """Let keys created while a meeting is active expire together with it"""
+        deadline = self._meeting_deadline(meeting_id)
+        if deadline is None:
+            return
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.expireat(key, deadline)
+        pipe.execute()
+
+    # Meeting versions
+
+    def _new_meeting_version(self, pipe, meeting_id, deadline):
+        """Reset the change counters of a meeting that goes live"""
+        now = time.time()
+        version_key = self._meeting_version_key(meeting_id)
+        pipe.delete(version_key)
+        pipe.hset(version_key, mapping={
+            # the activation time tells apart the counters of two activations
+            "activated": now,
+            "participants": 0,
+            "participants_ts": now,
+            "messages": 0,
+            "messages_ts": now
+        })
+        pipe.expireat(version_key, deadline)
+
+    def _bump_meeting_version(self, meeting_id, resource):
+        """Mark the participants or messages of a meeting as changed"""
+        version_key = self._meeting_version_key(meeting_id)
+        pipe = self._pipeline(transaction=True)
+        pipe.hincrby(version_key, resource, 1)
+        pipe.hset(version_key, f"{resource}_ts", time.time())
+        pipe.execute()
+
+    def get_meeting_version(self, meeting_id, resource):
+        """
+        Get the (ETag, last modified epoch seconds) of a resource of an active
+        meeting: "meeting", "participants" or "messages". Returns None if the
+        meeting has no version.
+        """
+        version_key = self._meeting_version_key(meeting_id)
+        if resource == "meeting":
+            activated = self.redis_client.hget(version_key, "activated")
+            if activated is None:
+                return None
+            return f'"{meeting_id}.{activated}"', float(activated)
+
+        activated, counter, modified = self.redis_client.hmget(
+            version_key, "activated", resource, f"{resource}_ts"
+        )
+        if activated is None:
+            return None
+        return f'"{meeting_id}.{activated}.{counter}"', float(modified)
+
+    # Occupancy
+
+    def _new_occupancy(self, pipe, meeting_id, deadline):
+        """Start the occupancy of a meeting that goes live with an empty bucket"""
+        minute = int(time.time()) // 60 * 60
+        occupancy_key = self._occupancy_key(meeting_id)
+        pipe.delete(occupancy_key)
+        pipe.zadd(occupancy_key, {f"{minute}:0:0": minute})
+        pipe.expireat(occupancy_key, deadline)
+
+    def _record_occupancy(self, meeting_id):
+        """Update the occupancy bucket of the current minute after a join or leave"""
+        if self.occupancy_script is None:
+            self.occupancy_script = self.redis_client.register_script(OCCUPANCY_SCRIPT)
+        self.occupancy_script(
+            keys=[self._joined_key(meeting_id), self._occupancy_key(meeting_id)],
+            args=[int(time.time()) // 60 * 60]
+        )
+
+    def get_occupancy(self, meeting_id, start=None, end=None):
+        """
+        Get the occupancy buckets of an active meeting between the minutes
+        `start` and `end` (epoch seconds, open ended if None), as a tuple of
+        the last bucket before `start` (None if there is none) and the list of
+        the buckets in the range, each a (minute, peak, occupancy) tuple.
+        Returns None if the meeting has no occupancy in Redis.
+        """
+        occupancy_key = self._occupancy_key(meeting_id)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.exists(occupancy_key)
+        pipe.zrangebyscore(occupancy_key, "-inf" if start is None else start, "+inf" if end is None else end)
+        if start is not None:
+            pipe.zrevrangebyscore(occupancy_key, f"({start}", "-inf", start=0, num=1)
+        exists, buckets, *before = pipe.execute()
+        if not exists:
+            return None
+
+        before = _parse_bucket(before[0][0]) if before and before[0] else None
+        return before, [_parse_bucket(bucket) for bucket in buckets]
+
+    # Heatmap
+
+    def _update_heatmap(self, operation, meeting_id, value=""):
+        """
+        Update the heatmap counters for a meeting: "activate" it at a geohash,
+        "join"/"leave" it with +1/-1 users, or "deactivate" it
+        """
+        if self.heatmap_script is None:
+            self.heatmap_script = self.redis_client.register_script(HEATMAP_SCRIPT)
+        self.heatmap_script(keys=[self.heatmap_key], args=[operation, meeting_id, value])
+
+    def get_heatmap(self, cells):
+        """
+        Get the (geohash, active meetings, joined users) of the given cells,
+        skipping the empty ones
+        """
+        if not cells:
+            return []
+
+        counters = self.redis_client.hmget(
+            self.heatmap_key,
+            [f"m:{cell}" for cell in cells] + [f"u:{cell}" for cell in cells]
+        )
+        meetings, users = counters[:len(cells)], counters[len(cells):]
+        return [
+            (cell, int(cell_meetings or 0), int(cell_users or 0))
+            for cell, cell_meetings, cell_users in zip(cells, meetings, users)
+            if cell_meetings or cell_users
+        ]
+
+    # Chat message encoding
+
+    def _encode_message(self, user_ref, email, message, timestamp):
+        """Serialize a chat message for the chat list"""
+        if self.compact:
+            return self.msgpack.packb([int(user_ref), message, int(timestamp.timestamp())])
+        return json.dumps({
+            "email": email,
+            "message": message,
+            "timestamp": to_iso_utc(timestamp)
+        })
+
+    def _decode_messages(self, raw_messages):
+        """Deserialize chat list entries into message dicts"""
+        if not self.compact:
+            return [json.loads(msg) for msg in raw_messages]
+
+        unpacked = [self.msgpack.unpackb(msg) for msg in raw_messages]
+        emails = self._user_emails_of([user_id for user_id, _, _ in unpacked])
+        return [
+            {
+                "email": email,
+                "message": message,
+                "timestamp": to_iso_utc(datetime.fromtimestamp(ts, timezone.utc))
+            }
+            for email, (_, message, ts) in zip(emails, unpacked)
+        ]
+
+    def _message_score(self, timestamp):
+        """
+        Sort score of a message in the history of its user: the epoch seconds
+        of the timestamp it is read back with (whole seconds in compact mode)
+        """
+        if self.compact:
+            return int(to_timestamp(timestamp))
+        return to_timestamp(timestamp)
+
+    def _messages_json(self, raw_messages):
+        """
+        Serialize chat list entries into a JSON array. JSON entries are joined
+        as they are stored, without decoding them.
+        """
+        if not self.compact:
+            return ("[" + ",".join(raw_messages) + "]").encode()
+        return orjson.dumps(self._decode_messages(raw_messages))
 
     def activate_meeting(self, meeting_id, title, description, lat, long, participants, t1, t2):
         """Activate a meeting in Redis"""
         print(f"Activating meeting in Redis: ID={meeting_id}, title={title}")
 
+        # Activated without going through staging, drop any staged copy
+        self.unstage_meeting(meeting_id)
+
         # Store meeting details
-        meeting_key = f"{self.meeting_prefix}{meeting_id}"
+        meeting_key = self._meeting_key(meeting_id)
         meeting_data = {
             # "id": meeting_id,
             "title": title,
@@ -49,8 +783,15 @@ class RedisManager:
         }
         self.redis_client.hset(meeting_key, mapping=meeting_data)
 
+        # All the per-meeting keys expire on their own shortly after t2, so they
+        # don't outlive the meeting if the scheduler is down or lagging
+        t2_timestamp = int(to_timestamp(t2))
+        deadline = t2_timestamp + settings.MEETING_EXPIRY_GRACE_SECONDS
+        self.redis_client.zadd(self.meeting_expiry_key, {meeting_id: t2_timestamp})
+
         # Add geoposition of meeting
-        self.redis_client.geoadd(self.meeting_positions_key, [lat, long, meeting_id])
+        self._add_positions([(lat, long, meeting_id)])
+        self._update_heatmap("activate", meeting_id, geohash_encode(lat, long, HEATMAP_PRECISION))
 
         print(f"ADDED GEOSPATIAL")
         print(self.redis_client.zrange(self.meeting_positions_key, 0, -1))
@@ -58,27 +799,39 @@ class RedisManager:
         # Add to active meetings set - convert meeting_id to string for Redis
         meeting_id_str = str(meeting_id)
         self.redis_client.sadd(self.active_meetings_key, meeting_id_str)
+        self.redis_client.incr(self.active_version_key)
 
         # Initialize participants set
-        participants_key = f"{self.participants_prefix}{meeting_id}"
-        for email in participants.split(","):
-            email_clean = email.strip()
-            if email_clean:  # Skip empty emails
-                # add user to participant of meeting
-                self.redis_client.sadd(participants_key, email_clean)
+        participants_key = self._participants_key(meeting_id)
+        emails = _split_emails(participants)
+        for email, user_ref in zip(emails, self._user_refs(emails)):
+            # add user to participant of meeting
+            self.redis_client.sadd(participants_key, user_ref)
+
+            # add meeting to the participated meetings of user (secondary index)
+            user_participate_key = self._user_participate_key(user_ref)
+            self.redis_client.sadd(user_participate_key, meeting_id)
+
+            # the index is shared between meetings, so only extend its expiry
+            self.redis_client.expireat(user_participate_key, deadline, nx=True)
+            self.redis_client.expireat(user_participate_key, deadline, gt=True)
+
+            print(f"{email} participated meetings: {self.redis_client.smembers(user_participate_key)}")
 
-                # add meeting to the participated meetings of user (secondary index)
-                user_participate_key = f"{self.user_participate_meetings}{email_clean}"
-                self.redis_client.sadd(user_participate_key, meeting_id)
+        self.redis_client.expireat(meeting_key, deadline)
+        self.redis_client.expireat(participants_key, deadline)
 
-                print(f"{email_clean} participated meetings: {self.redis_client.smembers(user_participate_key)}")
+        pipe = self.redis_client.pipeline(transaction=False)
+        self._new_meeting_version(pipe, meeting_id, deadline)
+        self._new_occupancy(pipe, meeting_id, deadline)
+        pipe.execute()
 
         # Initialize joined participants set
-        joined_key = f"{self.joined_prefix}{meeting_id}"
+        joined_key = self._joined_key(meeting_id)
         self.redis_client.delete(joined_key)  # Ensure it's empty
 
         # Initialize chat list
-        chat_key = f"{self.chat_prefix}{meeting_id}"
+        chat_key = self._chat_key(meeting_id)
         self.redis_client.delete(chat_key)  # Ensure it's empty
 
         # Verify the meeting was added
@@ -87,77 +840,296 @@ class RedisManager:
 
         return True
 
+    def stage_meetings(self, meetings):
+        """
+        Build the Redis structures of upcoming meetings under staging keys, so
+        that they can go live at t1 with a single switch.
+        """
+        pipe = self.redis_client.pipeline(transaction=False)
+        for meeting in meetings:
+            meeting_id = meeting["meeting_id"]
+            t1, t2 = meeting["t1"], meeting["t2"]
+            deadline = int(to_timestamp(t2)) + settings.MEETING_EXPIRY_GRACE_SECONDS
+
+            staged_meeting_key = self._staging_key(self._meeting_key(meeting_id))
+            staged_participants_key = self._staging_key(self._participants_key(meeting_id))
+            pipe.delete(staged_meeting_key, staged_participants_key)
+
+            pipe.hset(staged_meeting_key, mapping={
+                "title": meeting["title"],
+                "description": meeting["description"],
+                "t1": t1.isoformat() if isinstance(t1, datetime) else t1,
+                "t2": t2.isoformat() if isinstance(t2, datetime) else t2
+            })
+            pipe.expireat(staged_meeting_key, deadline)
+
+            user_refs = self._user_refs(_split_emails(meeting["participants"]))
+            if user_refs:
+                pipe.sadd(staged_participants_key, *user_refs)
+                pipe.expireat(staged_participants_key, deadline)
+
+            # the secondary index is read through active_meetings, so it can
+            # already point to the meeting
+            for user_ref in user_refs:
+                user_participate_key = self._user_participate_key(user_ref)
+                pipe.sadd(user_participate_key, meeting_id)
+                pipe.expireat(user_participate_key, deadline, nx=True)
+                pipe.expireat(user_participate_key, deadline, gt=True)
+
+            pipe.geoadd(self.staged_positions_key, [meeting["lat"], meeting["long"], meeting_id])
+            pipe.zadd(self.staged_meetings_key, {meeting_id: int(to_timestamp(t1))})
+        pipe.execute()
+
+    def are_meetings_staged(self, meeting_ids):
+        """Check in one round trip which of the given meetings are staged"""
+        if not meeting_ids:
+            return []
+        return [score is not None for score in self.redis_client.zmscore(self.staged_meetings_key, meeting_ids)]
+
+    def get_next_staged_start(self):
+        """Get the t1 (epoch seconds) of the next staged meeting, if any"""
+        first = self.redis_client.zrange(self.staged_meetings_key, 0, 0, withscores=True)
+        return first[0][1] if first else None
+
+    def promote_staged_meetings(self, now):
+        """
+        Make the staged meetings whose t1 has passed live, in a single MULTI.
+        Returns the IDs of the promoted meetings.
+        """
+        meeting_ids = self.redis_client.zrangebyscore(self.staged_meetings_key, "-inf", now)
+        if not meeting_ids:
+            return []
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.geopos(self.staged_positions_key, *meeting_ids)
+        for meeting_id in meeting_ids:
+            pipe.hget(self._staging_key(self._meeting_key(meeting_id)), "t2")
+            pipe.exists(self._staging_key(self._participants_key(meeting_id)))
+        positions, *details = pipe.execute()
+
+        ready, stale = [], []
+        for i, meeting_id in enumerate(meeting_ids):
+            t2, has_participants = details[2 * i], details[2 * i + 1]
+            if t2 is None or positions[i] is None or to_timestamp(t2) <= now:
+                stale.append(meeting_id)  # ended or expired before it went live
+            else:
+                ready.append((meeting_id, positions[i], int(to_timestamp(t2)), has_participants))
+
+        for meeting_id in stale:
+            self.unstage_meeting(meeting_id)
+
+        if not ready:
+            return []
+
+        # everything was prepared beforehand, the switch is just renames and set additions.
+        # The meetings are renamed before they are indexed, so without a transaction
+        # (cluster mode) no meeting is ever listed as active before its keys exist.
+        # The geo shards are other servers, outside of the pipeline: the positions
+        # are written there once the switch went through
+        pipe = self._pipeline(transaction=True)
+        for meeting_id, position, t2, has_participants in ready:
+            pipe.rename(self._staging_key(self._meeting_key(meeting_id)), self._meeting_key(meeting_id))
+            if has_participants:
+                pipe.rename(self._staging_key(self._participants_key(meeting_id)), self._participants_key(meeting_id))
+            pipe.delete(self._joined_key(meeting_id), self._chat_key(meeting_id))
+            self._new_meeting_version(pipe, meeting_id, t2 + settings.MEETING_EXPIRY_GRACE_SECONDS)
+            self._new_occupancy(pipe, meeting_id, t2 + settings.MEETING_EXPIRY_GRACE_SECONDS)
+        promoted = [meeting_id for meeting_id, _, _, _ in ready]
+        positions = [(*position, meeting_id) for meeting_id, position, _, _ in ready]
+        if not self.geo_shards:
+            self._add_positions(positions, pipe)
+        pipe.zadd(self.meeting_expiry_key, {meeting_id: t2 for meeting_id, _, t2, _ in ready})
+        pipe.sadd(self.active_meetings_key, *promoted)
+        pipe.incr(self.active_version_key)
+        pipe.zrem(self.staged_meetings_key, *promoted)
+        pipe.zrem(self.staged_positions_key, *promoted)
+        pipe.execute()
+
+        if self.geo_shards:
+            self._add_positions(positions)
+
+        # the positions are indexed in the (lat, long) order of the meetings
+        for meeting_id, (lat, long), _, _ in ready:
+            self._update_heatmap("activate", meeting_id, geohash_encode(float(lat), float(long), HEATMAP_PRECISION))
+
+        return promoted
+
+    def unstage_meeting(self, meeting_id):
+        """Drop the staged copy of a meeting, if there is one"""
+        if self.redis_client.zscore(self.staged_meetings_key, meeting_id) is None:
+            return
+
+        staged_meeting_key = self._staging_key(self._meeting_key(meeting_id))
+        staged_participants_key = self._staging_key(self._participants_key(meeting_id))
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for user_ref in self.redis_client.smembers(staged_participants_key):
+            pipe.srem(self._user_participate_key(user_ref), meeting_id)
+        pipe.delete(staged_meeting_key, staged_participants_key)
+        pipe.zrem(self.staged_meetings_key, meeting_id)
+        pipe.zrem(self.staged_positions_key, meeting_id)
+        pipe.execute()
+
     def deactivate_meeting(self, meeting_id):
         """Deactivate a meeting in Redis"""
-        # Convert to string for Redis
-        meeting_id_str = str(meeting_id)
-
-        # Check if meeting is active
-        if not self.redis_client.sismember(self.active_meetings_key, meeting_id_str):
+        deactivated = self.deactivate_meetings([meeting_id])
+        if str(meeting_id) not in deactivated:
             print(f"{meeting_id} is not active")
             return {"error": f"Meeting {meeting_id} is not active"}
+        return deactivated[str(meeting_id)]
 
-        # Remove from active meetings set
-        self.redis_client.srem(self.active_meetings_key, meeting_id_str)
-
-        # Remove from geopositions
-        self.redis_client.zrem(self.meeting_positions_key, meeting_id_str)
-
-        print(f"REMOVED GEOSPATIAL")
-        print(self.redis_client.zrange(self.meeting_positions_key, 0, -1))
-
-        # Get list of joined participants for timeout logging
-        joined_key = f"{self.joined_prefix}{meeting_id}"
-        joined_participants = self.redis_client.smembers(joined_key)
-
-        # Clean up Redis keys
-        meeting_key = f"{self.meeting_prefix}{meeting_id}"
-        participants_key = f"{self.participants_prefix}{meeting_id}"
-        chat_key = f"{self.chat_prefix}{meeting_id}"
+    def deactivate_meetings(self, meeting_ids):
+        """
+        Deactivate many meetings in Redis. Returns a dict with the emails of
+        the joined users of every meeting that was active, for timeout logging.
+        """
+        meeting_ids = [str(m) for m in meeting_ids]
+        active = [m for m, is_active in zip(meeting_ids, self.are_meetings_active(meeting_ids)) if is_active]
+        if not active:
+            return {}
+
+        # Take the meetings out of the indexes first, so they stop being
+        # visible right away, and get their joined users for timeout logging
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.srem(self.active_meetings_key, *active)
+        self._remove_positions(active, pipe)
+        pipe.zrem(self.meeting_expiry_key, *active)
+        pipe.incr(self.active_version_key)
+        queued = len(pipe)
+        for meeting_id in active:
+            pipe.exists(self._meeting_key(meeting_id))
+            pipe.smembers(self._joined_key(meeting_id))
+        details = pipe.execute()[queued:]
+
+        deactivated = {}
+        for i, meeting_id in enumerate(active):
+            meeting_exists, joined_participants = details[2 * i], details[2 * i + 1]
+            if not meeting_exists:
+                # the per-meeting keys already expired on their own, so the joined
+                # users and the participants are gone along with them
+                print(f"Meeting {meeting_id} timed out after its keys expired, timeouts were not logged")
+
+            self._cleanup_meeting(meeting_id, joined_participants)
+            self._update_heatmap("deactivate", meeting_id)
+            deactivated[meeting_id] = self._user_emails_of(joined_participants)
+
+        print(f"Deactivated meetings {active} from Redis")
+        return deactivated
+
+    def _cleanup_meeting(self, meeting_id, joined_participants):
+        """Delete the keys of a deactivated meeting, in chunked pipelines"""
+        pipe = self.redis_client.pipeline(transaction=False)
 
         # For each joined user, remove this meeting from their active meeting
-        for email in joined_participants:
-            user_meetings_key = f"{self.user_joined_meeting}{email}"
-            self.redis_client.delete(user_meetings_key)
-
-        # For each participant, remove this meeting from their participated meetings, and chats
-        for email in self.redis_client.smembers(participants_key):
-            user_participate_key = f"{self.user_participate_meetings}{email}"
-            self.redis_client.srem(user_participate_key, meeting_id)
-            self.redis_client.delete(f"{chat_key}:{email}") # remove messages indices of user
-            print(f"removed {meeting_id} from {email}")
-            print(f"{email} participated meetings: {self.redis_client.smembers(user_participate_key)}")
-
-        # Delete all keys related to this meeting
-        self.redis_client.delete(meeting_key, participants_key, joined_key, chat_key)
-
-        print(f"Deactivated meeting {meeting_id} from Redis")
-        return list(joined_participants)
+        for chunk in _chunks(joined_participants, DEACTIVATE_CHUNK_SIZE):
+            user_joined_keys = [self._user_joined_key(user_ref) for user_ref in chunk]
+            if self.cluster:
+                # the keys of different users live in different slots
+                for user_joined_key in user_joined_keys:
+                    pipe.unlink(user_joined_key)
+            else:
+                pipe.unlink(*user_joined_keys)
+        pipe.execute()
+
+        # For each participant, remove this meeting from their participated
+        # meetings, and their messages from their history and indices. The set
+        # is scanned in chunks, so huge meetings don't block Redis or build huge replies
+        participants_key = self._participants_key(meeting_id)
+        participants = self.redis_client.sscan_iter(participants_key, count=DEACTIVATE_CHUNK_SIZE)
+        for chunk in _chunks(participants, DEACTIVATE_CHUNK_SIZE):
+            user_chat_keys = [self._user_chat_key(meeting_id, user_ref) for user_ref in chunk]
+            for user_chat_key in user_chat_keys:
+                pipe.lrange(user_chat_key, 0, -1)
+            positions = pipe.execute()
+
+            for user_ref, user_positions in zip(chunk, positions):
+                pipe.srem(self._user_participate_key(user_ref), meeting_id)
+                if user_positions:
+                    pipe.zrem(
+                        self._user_messages_key(user_ref),
+                        *[f"{meeting_id}:{position}" for position in user_positions]
+                    )
+            pipe.unlink(*user_chat_keys)
+            pipe.execute()
+
+        # Delete the search index of the chat, word by word
+        terms_key = self._chat_terms_key(meeting_id)
+        terms = self.redis_client.sscan_iter(terms_key, count=DEACTIVATE_CHUNK_SIZE)
+        for chunk in _chunks(terms, DEACTIVATE_CHUNK_SIZE):
+            pipe.unlink(*[self._chat_index_key(meeting_id, token) for token in chunk])
+            pipe.execute()
+
+        # Delete all keys related to this meeting, big ones are freed in the background
+        pipe.unlink(
+            self._meeting_key(meeting_id),
+            participants_key,
+            self._joined_key(meeting_id),
+            self._chat_key(meeting_id),
+            self._meeting_version_key(meeting_id),
+            self._occupancy_key(meeting_id),
+            terms_key
+        )
+        pipe.execute()
 
     def get_meeting_by_id(self, meeting_id):
         """Get meeting attributes from a given a meeting id"""
         # get the basic meeting attributes
-        meeting_key = f"{self.meeting_prefix}{meeting_id}"
+        meeting_key = self._meeting_key(meeting_id)
         meeting = self.redis_client.hgetall(meeting_key)
 
         if not meeting:
             return None
 
-        # get the position of the meeting
-        long, lat = self.redis_client.geopos(self.meeting_positions_key, meeting_id)[0]
+        # get the position of the meeting. A meeting whose position is not indexed
+        # (yet, on the geo shards) is left to the db
+        position = self._get_position(meeting_id)
+        if position is None:
+            return None
+        long, lat = position
 
         # get the participants of the meeting
-        meeting_participants_key = f"{self.participants_prefix}{meeting_id}"
+        meeting_participants_key = self._participants_key(meeting_id)
         participants = self.redis_client.smembers(meeting_participants_key)
 
         # add all the attributes together
         meeting["meeting_id"] = meeting_id
         meeting["long"] = long
         meeting["lat"] = lat
-        meeting["participants"] = participants
+        meeting["participants"] = set(self._user_emails_of(participants))
 
         return meeting
 
+    def are_meetings_active(self, meeting_ids):
+        """Check in one round trip which of the given meetings are active"""
+        if not meeting_ids:
+            return []
+        return [bool(flag) for flag in self.redis_client.smismember(self.active_meetings_key, meeting_ids)]
+
+    def get_sync_state(self):
+        """Get the (watermark, last full sync) epoch seconds of the meeting sync"""
+        watermark, last_full = self.redis_client.hmget(self.sync_state_key, "watermark", "last_full")
+        if watermark is None:
+            return None, None
+        return float(watermark), float(last_full)
+
+    def set_sync_state(self, watermark, last_full):
+        """Store the (watermark, last full sync) epoch seconds of the meeting sync"""
+        self.redis_client.hset(self.sync_state_key, mapping={"watermark": watermark, "last_full": last_full})
+
+    def get_active_meetings_version(self):
+        """Get the version of the active meetings set, bumped on every change"""
+        return int(self.redis_client.get(self.active_version_key) or 0)
+
+    def get_active_meetings_snapshot(self):
+        """Get the version and the IDs of the active meetings, consistent with each other"""
+        # the version is read first, so without a transaction (cluster mode) a
+        # concurrent change makes the snapshot look stale rather than current
+        pipe = self._pipeline(transaction=True)
+        pipe.get(self.active_version_key)
+        pipe.smembers(self.active_meetings_key)
+        version, meetings = pipe.execute()
+        return int(version or 0), sorted(int(m) for m in meetings)
+
     def get_active_meetings(self):
         """Get list of all active meeting IDs"""
         meetings = self.redis_client.smembers(self.active_meetings_key)
@@ -168,20 +1140,26 @@ class RedisManager:
         print(f"Converted Redis active meetings: {result}")
         return result
 
-    def get_nearby_meetings_for_user(self, email, x, y, max_distance=100):
+    def get_nearby_meetings_for_user(self, email, x, y, max_distance=MAX_MEETING_DISTANCE):
         """Get active meetings near user's location where user is a participant"""
+        user_ref = self._user_ref(email, create=False)
+        if user_ref is None:
+            return set() # user is not a participant of any meeting
 
         # get all nearby meetings of (x, y) using meters
-        nearby_meetings = self.redis_client.geosearch(
-            self.meeting_positions_key,
-            longitude=x,
-            latitude=y,
-            radius=max_distance,
-            unit="m"
-        )
+        if self.geo_shards:
+            nearby_meetings = self._search_geo_shards([(x, y)], max_distance)[0]
+        else:
+            nearby_meetings = self.redis_client.geosearch(
+                self.meeting_positions_key,
+                longitude=x,
+                latitude=y,
+                radius=max_distance,
+                unit="m"
+            )
 
 
-        user_participate_key = f"{self.user_participate_meetings}{email}"
+        user_participate_key = self._user_participate_key(user_ref)
         meetings_participate = self.redis_client.smembers(user_participate_key)
 
 
@@ -191,11 +1169,91 @@ class RedisManager:
         # the intersection of these sets are the nearby meetings the user can join
         return nearby_meetings_str & meetings_participate
 
+    def update_user_locations(self, updates, throttle_seconds, refresh_seconds, min_distance, ttl):
+        """
+        Store the latest position of each user and return the updates that
+        need a geofence evaluation.
+
+        `updates` is a list of (email, x, y, timestamp) tuples, where timestamp
+        is in epoch seconds. Pings of the same user inside the batch are
+        collapsed to the newest one. A ping is dropped if it arrives less than
+        `throttle_seconds` after the last accepted one, or if the user moved
+        less than `min_distance` meters and `refresh_seconds` have not passed.
+        The arrival is timed by Redis, the timestamps only order the pings.
+        """
+        # keep only the newest ping of each user
+        latest = {}
+        for email, x, y, ts in updates:
+            if email not in latest or ts >= latest[email][2]:
+                latest[email] = (x, y, ts)
+
+        if self.location_script is None:
+            self.location_script = self.redis_client.register_script(LOCATION_SCRIPT)
+
+        # check and store every ping atomically, in one round trip. A cluster
+        # pipeline doesn't load the script on the nodes, so there each ping is
+        # its own call
+        emails = list(latest)
+        client = self.redis_client if self.cluster else self.redis_client.pipeline(transaction=False)
+        results = [
+            self.location_script(
+                keys=[self._user_location_key(user_ref)],
+                args=[*latest[email][:2], throttle_seconds, refresh_seconds, min_distance, ttl, EARTH_RADIUS_KM * 1000],
+                client=client
+            )
+            for email, user_ref in zip(emails, self._user_refs(emails))
+        ]
+        if not self.cluster:
+            results = client.execute()
+
+        return [(email, *latest[email]) for email, result in zip(emails, results) if result]
+
+    def get_geofence_states(self, locations, max_distance=MAX_MEETING_DISTANCE):
+        """
+        For each (email, x, y, ...) location, return a tuple of
+        (nearby meetings ordered by distance, invited meetings, joined meeting),
+        all fetched in a single round trip (plus one per searched geo shard).
+        """
+        user_refs = self._user_refs([email for email, *_ in locations])
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for (email, x, y, *_), user_ref in zip(locations, user_refs):
+            if not self.geo_shards:
+                pipe.geosearch(
+                    self.meeting_positions_key,
+                    longitude=x,
+                    latitude=y,
+                    radius=max_distance,
+                    unit="m",
+                    sort="ASC"
+                )
+            pipe.smembers(self._user_participate_key(user_ref))
+            pipe.get(self._user_joined_key(user_ref))
+        results = pipe.execute()
+
+        if self.geo_shards:
+            points = [(x, y) for email, x, y, *_ in locations]
+            nearby_meetings = self._search_geo_shards(points, max_distance, sort="ASC")
+            return [
+                (nearby, invited, joined)
+                for nearby, invited, joined in zip(nearby_meetings, results[::2], results[1::2])
+            ]
+
+        states = []
+        for i in range(0, len(results), 3):
+            nearby, invited, joined = results[i:i + 3]
+            states.append(([str(m) for m in nearby], invited, joined))
+        return states
+
     def join_meeting(self, email, meeting_id):
         """User joins a meeting"""
+        user_ref = self._user_ref(email, create=False)
+        if user_ref is None:
+            print(f"{email} not member of {meeting_id}")
+            return {"error": "You are not a participant of the meeting"}
 
         # Check if user is on other meeting
-        user_meetings_key = f"{self.user_joined_meeting}{email}"
+        user_meetings_key = self._user_joined_key(user_ref)
         if self.redis_client.get(user_meetings_key) is not None:
             print(f"{email} is already in other meeting ({self.redis_client.get(user_meetings_key)})")
             return {"error": "You are already joined in another meeting"}
@@ -206,14 +1264,14 @@ class RedisManager:
             return {"error": f"Meeting {meeting_id} is not active"}
 
         # Check if user is in participants list
-        participants_key = f"{self.participants_prefix}{meeting_id}"
-        if not self.redis_client.sismember(participants_key, email):
+        participants_key = self._participants_key(meeting_id)
+        if not self.redis_client.sismember(participants_key, user_ref):
             print(f"{email} not member of {meeting_id}")
             return {"error": "You are not a participant of the meeting"}
 
         # Add user to joined participants
-        joined_key = f"{self.joined_prefix}{meeting_id}"
-        self.redis_client.sadd(joined_key, email)
+        joined_key = self._joined_key(meeting_id)
+        self.redis_client.sadd(joined_key, user_ref)
 
         print(f"{email} joined meeting {meeting_id}")
         # Set meeting to user's joined meeting
@@ -221,11 +1279,19 @@ class RedisManager:
         self.redis_client.set(user_meetings_key, meeting_id)
         print(f"all good. User joined meeting: {self.redis_client.get(user_meetings_key)}")
 
+        self._expire_with_meeting(meeting_id, joined_key, user_meetings_key)
+        self._bump_meeting_version(meeting_id, "participants")
+        self._record_occupancy(meeting_id)
+        self._update_heatmap("join", meeting_id, 1)
+
     def leave_meeting(self, email, meeting_id):
         """User leaves a meeting"""
+        user_ref = self._user_ref(email, create=False)
+        if user_ref is None:
+            return {"error": "You are not joined in the meeting"}
 
         # Check if user is in the meeting
-        user_meetings_key = f"{self.user_joined_meeting}{email}"
+        user_meetings_key = self._user_joined_key(user_ref)
         if self.redis_client.get(user_meetings_key) != str(meeting_id):
             print(f"{email} is not joined in meeting {self.redis_client.get(user_meetings_key)}")
             return {"error": "You are not joined in the meeting"}
@@ -236,8 +1302,8 @@ class RedisManager:
             return {"error": f"Meeting {meeting_id} is not active"}
 
         # Remove user from joined participants
-        joined_key = f"{self.joined_prefix}{meeting_id}"
-        result = self.redis_client.srem(joined_key, email)
+        joined_key = self._joined_key(meeting_id)
+        result = self.redis_client.srem(joined_key, user_ref)
         print(f"removed from list")
 
         # Delete meeting from user's joined meeting
@@ -247,6 +1313,10 @@ class RedisManager:
         if result <= 0:
             return {"error": f"User not part of joined participants"}
 
+        self._bump_meeting_version(meeting_id, "participants")
+        self._record_occupancy(meeting_id)
+        self._update_heatmap("leave", meeting_id, -1)
+
     def get_joined_participants(self, meeting_id):
         """Get list of emails of participants who have joined the meeting"""
 
@@ -255,8 +1325,8 @@ class RedisManager:
             print(f"{meeting_id} is not active")
             return {"error": f"Meeting {meeting_id} is not active"}
 
-        joined_key = f"{self.joined_prefix}{meeting_id}"
-        return list(self.redis_client.smembers(joined_key))
+        joined_key = self._joined_key(meeting_id)
+        return self._user_emails_of(self.redis_client.smembers(joined_key))
 
     def post_message(self, email, message):
         """User posts a message to a meeting chat"""
@@ -266,35 +1336,215 @@ class RedisManager:
         if not meeting_id:
             return {"error": "User not joined in any meeting"}
 
+        user_ref = self._user_ref(email)
+
         # Create message object
-        chat_message = {
-            "email": email,
-            "message": message,
-            "timestamp": datetime.now().isoformat()
-        }
+        timestamp = datetime.now(timezone.utc)
+        chat_message = self._encode_message(user_ref, email, message, timestamp)
 
         # Add message to chat list of meeting
-        chat_key = f"{self.chat_prefix}{meeting_id}"
-        position = self.redis_client.rpush(chat_key, json.dumps(chat_message)) - 1
+        chat_key = self._chat_key(meeting_id)
+        position = self.chat_client.rpush(chat_key, chat_message) - 1
 
         # Add message index to chat list of user
-        user_chat_key = f"{chat_key}:{email}"
+        user_chat_key = self._user_chat_key(meeting_id, user_ref)
         self.redis_client.rpush(user_chat_key, position)
 
-    def get_meeting_messages(self, meeting_id):
-        """Get all messages from a meeting chat in chronological order"""
+        # Add message to the history of user across meetings, ordered by time.
+        # It spans meetings, so it does not expire with this one: the messages
+        # of a meeting are removed from it when the meeting is cleaned up
+        self.redis_client.zadd(
+            self._user_messages_key(user_ref),
+            {f"{meeting_id}:{position}": self._message_score(timestamp)}
+        )
+
+        # Index the words of the message for search, scored by how often they occur
+        index_keys = self._index_message(meeting_id, position, message)
+
+        self._expire_with_meeting(meeting_id, chat_key, user_chat_key, *index_keys)
+        self._bump_meeting_version(meeting_id, "messages")
+
+    def _index_message(self, meeting_id, position, message):
+        """Add a chat message to the word index of its meeting, returns the keys it touched"""
+        counts = Counter(tokenize(message))
+        if not counts:
+            return []
+
+        # zero padded, so messages with the same score sort by position
+        member = f"{position:010d}"
+        terms_key = self._chat_terms_key(meeting_id)
+        index_keys = [terms_key]
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for token, count in counts.items():
+            index_key = self._chat_index_key(meeting_id, token)
+            pipe.zadd(index_key, {member: count})
+            index_keys.append(index_key)
+        pipe.sadd(terms_key, *counts)
+        pipe.execute()
+        return index_keys
+
+    def search_meeting_messages(self, meeting_id, query, offset, limit):
+        """
+        Rank the messages of an active meeting against the words of `query`
+        (term frequency times inverse document frequency, newest first on
+        ties). Returns (number of matches, page of message dicts with a "score").
+
+        The ranked results are kept for SEARCH_CACHE_SECONDS under the current
+        messages version of the meeting, so the next pages only read a range.
+        """
+        if not self.redis_client.sismember(self.active_meetings_key, meeting_id):
+            return {"error": f"Meeting {meeting_id} is not active"}
+
+        tokens = sorted(set(tokenize(query)))
+        if not tokens:
+            return 0, []
+
+        version = self.redis_client.hget(self._meeting_version_key(meeting_id), "messages") or 0
+        search_key = self._chat_search_key(meeting_id, version, tokens)
+        if not self.redis_client.exists(search_key):
+            index_keys = [self._chat_index_key(meeting_id, token) for token in tokens]
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.llen(self._chat_key(meeting_id))
+            for index_key in index_keys:
+                pipe.zcard(index_key)
+            total, *frequencies = pipe.execute()
+
+            # rare words weigh more than common ones
+            weights = {
+                index_key: math.log(1 + total / frequency)
+                for index_key, frequency in zip(index_keys, frequencies)
+                if frequency
+            }
+            if not weights:
+                return 0, []
+
+            pipe.zunionstore(search_key, weights)
+            pipe.expire(search_key, SEARCH_CACHE_SECONDS)
+            pipe.execute()
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.zcard(search_key)
+        pipe.zrevrange(search_key, offset, offset + limit - 1, withscores=True)
+        matches, ranked = pipe.execute()
+
+        chat_key = self._chat_key(meeting_id)
+        pipe = self.chat_client.pipeline(transaction=False)
+        for position, _ in ranked:
+            pipe.lindex(chat_key, int(position))
+        found = [(entry, score) for entry, (_, score) in zip(pipe.execute(), ranked) if entry is not None]
+        messages = self._decode_messages([entry for entry, _ in found])
+
+        for message, (_, score) in zip(messages, found):
+            message["meeting_id"] = int(meeting_id)
+            message["score"] = score
+        return matches, messages
+
+    def get_user_message_history(self, email, min_score, max_score, before, count):
+        """
+        Get up to `count` messages a user posted in the active meetings, newest
+        first, with a score (see `_message_score`) in [min_score, max_score]
+        and, if `before` is given, older than its (score, meeting_id, position).
+        Returns message dicts with their meeting_id and position.
+        """
+        user_ref = self._user_ref(email, create=False)
+        if user_ref is None:
+            return []
+
+        user_messages_key = self._user_messages_key(user_ref)
+        if before is not None:
+            # inclusive, the messages posted at the same time are filtered below
+            max_score = min(max_score, before[0])
+
+        entries = []
+        start = 0
+        while len(entries) < count:
+            batch = self.redis_client.zrevrangebyscore(
+                user_messages_key, max_score, min_score, start=start, num=count, withscores=True
+            )
+            start += len(batch)
+
+            candidates = []
+            for member, score in batch:
+                meeting_id, position = (int(part) for part in member.split(":"))
+                if before is None or (score, meeting_id, position) < before:
+                    candidates.append((score, meeting_id, position, member))
+
+            # meetings whose keys expired on their own may still be in the history
+            meeting_ids = sorted({meeting_id for _, meeting_id, _, _ in candidates})
+            active = {m for m, is_active in zip(meeting_ids, self.are_meetings_active(meeting_ids)) if is_active}
+            stale = [member for _, meeting_id, _, member in candidates if meeting_id not in active]
+            if stale:
+                self.redis_client.zrem(user_messages_key, *stale)
+                start -= len(stale)
+
+            entries.extend(entry for entry in candidates if entry[1] in active)
+            if len(batch) < count:
+                break
+
+        entries = sorted(entries, reverse=True)[:count]
+
+        # get the messages themselves, in one round trip
+        pipe = self.chat_client.pipeline(transaction=False)
+        for _, meeting_id, position, _ in entries:
+            pipe.lindex(self._chat_key(meeting_id), position)
+        found = [(entry, raw) for entry, raw in zip(entries, pipe.execute()) if raw is not None]
+        messages = self._decode_messages([raw for _, raw in found])
+
+        for message, ((_, meeting_id, position, _), _) in zip(messages, found):
+            message["meeting_id"] = meeting_id
+            message["position"] = position
+        return messages
+
+    def iter_chat_archive(self, meeting_id, chunk_size=DEACTIVATE_CHUNK_SIZE):
+        """
+        Read the chat of a meeting in chunks, as lists of
+        (meeting_id, position, email, message, timestamp) rows for the archive.
+        """
+        chat_key = self._chat_key(meeting_id)
+        start = 0
+        while True:
+            raw_messages = self.chat_client.lrange(chat_key, start, start + chunk_size - 1)
+            if not raw_messages:
+                return
+
+            # archived as naive UTC, like every timestamp of the DB
+            yield [
+                (int(meeting_id), start + i, message["email"], message["message"],
+                 to_naive_utc(datetime.fromisoformat(message["timestamp"].replace("Z", "+00:00"))).isoformat())
+                for i, message in enumerate(self._decode_messages(raw_messages))
+            ]
+            start += len(raw_messages)
+
+    def get_meeting_messages(self, meeting_id, as_json=False):
+        """
+        Get all messages from a meeting chat in chronological order, as a
+        JSON array if `as_json` is set.
+        """
 
         # Check if meeting is active
         if not self.redis_client.sismember(self.active_meetings_key, meeting_id):
             print(f"{meeting_id} is not active")
             return {"error": f"Meeting {meeting_id} is not active"}
 
-        chat_key = f"{self.chat_prefix}{meeting_id}"
-        messages = self.redis_client.lrange(chat_key, 0, -1)
-        return [json.loads(msg) for msg in messages]
+        chat_key = self._chat_key(meeting_id)
+        messages = self.chat_client.lrange(chat_key, 0, -1)
+        if as_json:
+            return self._messages_json(messages)
+        return self._decode_messages(messages)
 
-    def get_user_meeting_messages(self, email, meeting_id=None):
-        """Get all messages posted by a user in a meeting"""
+    def get_user_meeting_messages(self, email, meeting_id=None, as_json=False):
+        """
+        Get all messages posted by a user in a meeting, as a JSON array if
+        `as_json` is set.
+        """
+        user_messages = self._user_meeting_chat_entries(email, meeting_id)
+        if as_json:
+            return self._messages_json(user_messages)
+        return self._decode_messages(user_messages)
+
+    def _user_meeting_chat_entries(self, email, meeting_id):
+        """Get the raw chat list entries posted by a user in a meeting"""
         # If meeting_id not provided, get it from user's joined meeting
         if not meeting_id:
             meeting_id = self.get_user_joined_meeting(email)
@@ -305,37 +1555,162 @@ class RedisManager:
         if not self.redis_client.sismember(self.active_meetings_key, meeting_id):
             return [] # inactive meeting
 
+        user_ref = self._user_ref(email, create=False)
+        if user_ref is None:
+            return [] # user is not a participant of any meeting
+
         # check if user is a participant of the meeting
-        participants_key = f"{self.participants_prefix}{meeting_id}"
-        if not self.redis_client.sismember(participants_key, email):
+        participants_key = self._participants_key(meeting_id)
+        if not self.redis_client.sismember(participants_key, user_ref):
             return [] # user is not a participant of the meeting
 
-        meeting_chat_key = f"{self.chat_prefix}{meeting_id}"
+        meeting_chat_key = self._chat_key(meeting_id)
 
         # get the messages positions of the user in the meeting
-        user_chat_key = f"{meeting_chat_key}:{email}"
+        user_chat_key = self._user_chat_key(meeting_id, user_ref)
         user_messages_positions = self.redis_client.lrange(user_chat_key, 0, -1)
 
-        print(f"msgs positions: {user_messages_positions}")
+        # get the final messages from the indices, in one round trip
+        pipe = self.chat_client.pipeline(transaction=False)
+        for msg_position in user_messages_positions:
+            pipe.lindex(meeting_chat_key, msg_position)
+        return pipe.execute()
 
-        # get the final messages from the indices
-        user_messages = [
-            # parse each messages into a json
-            json.loads(self.redis_client.lindex(meeting_chat_key, msg_position))
-            for msg_position in user_messages_positions
-        ]
+    def get_user_invited_meetings(self, email):
+        """Get the active meeting IDs that a user is a participant of"""
+        user_ref = self._user_ref(email, create=False)
+        if user_ref is None:
+            return set()
+
+        # meetings whose keys expired on their own may still be in the index
+        invited_meetings_key = self._user_participate_key(user_ref)
+        if not self.cluster:
+            return self.redis_client.sinter(invited_meetings_key, self.active_meetings_key)
+
+        # the two sets live in different slots, intersect them here
+        invited = list(self.redis_client.smembers(invited_meetings_key))
+        if not invited:
+            return set()
+        flags = self.redis_client.smismember(self.active_meetings_key, invited)
+        return {meeting_id for meeting_id, flag in zip(invited, flags) if flag}
+
+    def get_user_invitations(self, email, now):
+        """
+        Get the IDs of the not ended meetings (active or scheduled) that a user
+        is invited to, or None if the user's invitation index is not cached.
+        """
+        user_ref = self._user_ref(email, create=False)
+        if user_ref is None:
+            return None
 
-        return user_messages
+        # the sentinel scores +inf, so it is returned whenever the index exists
+        members = self.redis_client.zrangebyscore(self._user_invitations_key(user_ref), now, "+inf")
+        if not members:
+            return None
+        return sorted(int(m) for m in members if m != self.invitations_sentinel)
 
-    def get_user_invited_meetings(self, email):
-        """Get the meeting IDs that a user is a participant of"""
-        invited_meetings_key = f"{self.user_participate_meetings}{email}"
-        meetings_ids = self.redis_client.smembers(invited_meetings_key)
-        return meetings_ids
+    def set_user_invitations(self, invitations, now):
+        """
+        Warm the invitation index of many users in one pipeline. `invitations`
+        maps every email to a {meeting_id: t2 epoch seconds} dict, which may be
+        empty to cache that the user has no invitations.
+        """
+        emails = list(invitations)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for email, user_ref in zip(emails, self._user_refs(emails)):
+            user_invitations_key = self._user_invitations_key(user_ref)
+            pipe.zadd(user_invitations_key, {self.invitations_sentinel: float("inf"), **invitations[email]})
+            pipe.zremrangebyscore(user_invitations_key, "-inf", f"({now}")  # ended meetings
+            pipe.expire(user_invitations_key, settings.INVITATION_INDEX_TTL)
+        pipe.execute()
+
+    def drop_invitation_indexes(self):
+        """Drop every cached invitation index, they are loaded from the DB again"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in self.redis_client.scan_iter(match=f"{self.user_invitations_prefix}*", count=1000):
+            pipe.unlink(key)
+        pipe.execute()
+
+    def add_invitations(self, meeting_id, participants, t2):
+        """Add a new meeting to the invitation index of the users that have it cached"""
+        user_refs = self._user_refs(_split_emails(participants))
+        if not user_refs:
+            return
+
+        if self.add_invitation_script is None:
+            self.add_invitation_script = self.redis_client.register_script(ADD_INVITATION_SCRIPT)
+
+        # users without a cached index load it with the meeting from the DB later.
+        # Pipelined outside of cluster mode, see update_user_locations
+        score = int(to_timestamp(t2))
+        client = self.redis_client if self.cluster else self.redis_client.pipeline(transaction=False)
+        for user_ref in user_refs:
+            self.add_invitation_script(
+                keys=[self._user_invitations_key(user_ref)],
+                args=[self.invitations_sentinel, meeting_id, score],
+                client=client
+            )
+        if not self.cluster:
+            client.execute()
+
+    def remove_invitations(self, meeting_id, participants):
+        """Remove a deleted meeting from the invitation index of its participants"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for user_ref in self._user_refs(_split_emails(participants)):
+            pipe.zrem(self._user_invitations_key(user_ref), meeting_id)
+        pipe.execute()
+
+    def mark_recent_writes(self, keys, seconds):
+        """Mark users/meetings ("user:<email>", "meeting:<id>") as written to the DB for `seconds`"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.set(f"{self.recent_write_prefix}{key}", 1, px=max(1, int(seconds * 1000)))
+        pipe.execute()
+
+    def has_recent_writes(self, keys):
+        """Check whether any of the users/meetings was written to the DB recently"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.exists(f"{self.recent_write_prefix}{key}")
+        return any(pipe.execute())
+
+    def acquire_scheduler_lock(self, owner, ttl):
+        """
+        Try to become (or stay) the process that runs the background jobs.
+        The lock expires after `ttl` seconds unless the owner renews it.
+        """
+        if self.redis_client.set(self.scheduler_lock_key, owner, nx=True, ex=ttl):
+            return True
+
+        if self.redis_client.get(self.scheduler_lock_key) == owner:
+            self.redis_client.expire(self.scheduler_lock_key, ttl)
+            return True
+
+        return False
+
+    def release_scheduler_lock(self, owner):
+        """Give up the background jobs, so another process takes them over right away"""
+        if self.redis_client.get(self.scheduler_lock_key) == owner:
+            self.redis_client.delete(self.scheduler_lock_key)
+
+    def get_expired_meetings(self, now):
+        """Get the IDs of the active meetings whose t2 is before `now` (epoch seconds)"""
+        expired = self.redis_client.zrangebyscore(self.meeting_expiry_key, "-inf", now)
+        return [int(m) for m in expired]
+
+    def purge_expired_meeting(self, meeting_id):
+        """Drop the leftovers of a meeting that is no longer in the active meetings"""
+        self.redis_client.zrem(self.meeting_expiry_key, meeting_id)
+        self._remove_positions([meeting_id])
+        self._update_heatmap("deactivate", meeting_id)
 
     def get_user_joined_meeting(self, email):
         """Get the meeting ID that a user has joined (if any)"""
-        user_meeting_key = f"{self.user_joined_meeting}{email}"
+        user_ref = self._user_ref(email, create=False)
+        if user_ref is None:
+            return None
+
+        user_meeting_key = self._user_joined_key(user_ref)
         meeting_id = self.redis_client.get(user_meeting_key)
         return meeting_id
 
@@ -350,10 +1725,13 @@ class RedisManager:
         if joined_meeting_id:
             self.leave_meeting(email, joined_meeting_id)
 
-        # remove invited meetings key
-        self.redis_client.delete(
-            f"{self.user_participate_meetings}{email}"
-        )
+        # remove invited meetings keys
+        user_ref = self._user_ref(email, create=False)
+        if user_ref is not None:
+            self.redis_client.delete(
+                self._user_participate_key(user_ref),
+                self._user_invitations_key(user_ref)
+            )
 
         # return the meeting the use was joined in for logging purposes
         return joined_meeting_id
@@ -361,9 +1739,53 @@ class RedisManager:
 # Redis manager singleton
 _redis_instance = None
 
+def _reset_redis_manager():
+    """Forget the parent's connections in a forked worker, it opens its own"""
+    global _redis_instance, _redis_breaker
+    _redis_instance = None
+    _redis_breaker = None
+
+os.register_at_fork(after_in_child=_reset_redis_manager)
+
 def get_redis_manager():
     """Get or create the Redis manager instance"""
     global _redis_instance
     if _redis_instance is None:
         _redis_instance = RedisManager()
-    return _redis_instance
\ No newline at end of file
+    return _redis_instance
+
+# Circuit breaker guarding the Redis calls, created on first use
+_redis_breaker = None
+
+def get_redis_breaker():
+    """Get or create the circuit breaker of Redis"""
+    global _redis_breaker
+    if _redis_breaker is None:
+        from redis.exceptions import ConnectionError, TimeoutError
+
+        _redis_breaker = CircuitBreaker(
+            "redis",
+            failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=settings.BREAKER_RESET_TIMEOUT,
+            exceptions=(ConnectionError, TimeoutError)
+        )
+    return _redis_breaker
+
+
+class RecentWrites:
+    """
+    Marks of the users/meetings just written to the DB, kept in Redis so every
+    worker process sees them, see set_write_marks of app.db.database
+    """
+
+    def mark(self, keys, seconds):
+        try:
+            get_redis_breaker().call(get_redis_manager().mark_recent_writes, keys, seconds)
+        except BackendUnavailableError:
+            pass  # while Redis is unavailable has_any sends every read to the primary
+
+    def has_any(self, keys):
+        try:
+            return get_redis_breaker().call(get_redis_manager().has_recent_writes, keys)
+        except BackendUnavailableError:
+            return True  # the marks can't be checked, don't risk a stale read
@@ -1,3 +1,4 @@
+import os
 from app.db.database import get_database
 from app.services.redis_service import get_redis_manager
 from app.core.constants import LEAVE_MEETING
@@ -63,4 +64,22 @@ class UserService:
         if isinstance(result, dict) and "error" in result:
             return result  # Return error message
 
-        return result  # Return True for success or None for not found
\ No newline at end of file
+        return result  # Return True for success or None for not found
+
+
+# UserService singleton, created on first use
+_user_service = None
+
+def _reset_user_service():
+    """Drop the instance inherited from the parent in a forked worker"""
+    global _user_service
+    _user_service = None
+
+os.register_at_fork(after_in_child=_reset_user_service)
+
+def get_user_service():
+    """Get or create the user service instance"""
+    global _user_service
+    if _user_service is None:
+        _user_service = UserService()
+    return _user_service
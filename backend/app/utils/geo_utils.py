@@ -61,6 +61,148 @@ def get_bounding_box(lat: float, lon: float, distance_km: float) -> Tuple[float,
     
     return (min_lat, min_lon, max_lat, max_lon)
 
+# Alphabet of the geohash cells
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash_encode(lat: float, lon: float, precision: int) -> str:
+    """
+    Encode a point as a geohash.
+
+    Args:
+        lat: Latitude in degrees
+        lon: Longitude in degrees
+        precision: Number of characters of the geohash
+
+    Returns:
+        Geohash of the cell that contains the point
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits, bit_count, even = 0, 0, True
+
+    # bits alternate between longitude and latitude, 5 bits per character
+    while len(geohash) < precision:
+        value, value_range = (lon, lon_range) if even else (lat, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            value_range[0] = mid
+        else:
+            bits = bits * 2
+            value_range[1] = mid
+
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_BASE32[bits])
+            bits, bit_count = 0, 0
+
+    return "".join(geohash)
+
+def geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """
+    Get the size of the geohash cells of a precision.
+
+    Args:
+        precision: Number of characters of the geohashes
+
+    Returns:
+        Tuple of (height, width) of a cell in degrees
+    """
+    # latitude gets the smaller half of the bits
+    lat_bits = precision * 5 // 2
+    lon_bits = precision * 5 - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+def geohash_bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """
+    Decode a geohash to the cell it stands for.
+
+    Args:
+        geohash: Geohash of the cell
+
+    Returns:
+        Tuple of (min_lat, min_lon, max_lat, max_lon) of the cell
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = GEOHASH_BASE32.index(char)
+        for shift in range(4, -1, -1):
+            value_range = lon_range if even else lat_range
+            mid = (value_range[0] + value_range[1]) / 2
+            if bits >> shift & 1:
+                value_range[0] = mid
+            else:
+                value_range[1] = mid
+            even = not even
+
+    return (lat_range[0], lon_range[0], lat_range[1], lon_range[1])
+
+def geohash_box_cell_count(min_lat: float, min_lon: float, max_lat: float, max_lon: float, precision: int) -> int:
+    """
+    Estimate how many geohash cells overlap a bounding box, without listing them.
+
+    Args:
+        min_lat, min_lon, max_lat, max_lon: Bounding box in degrees
+        precision: Number of characters of the geohashes
+
+    Returns:
+        Upper bound of the number of cells the box overlaps
+    """
+    cell_height, cell_width = geohash_cell_size(precision)
+    rows = min(int((max_lat - min_lat) / cell_height) + 2, round(180.0 / cell_height))
+    columns = min(int((max_lon - min_lon) / cell_width) + 2, round(360.0 / cell_width))
+    return rows * columns
+
+def geohash_cells_in_box(min_lat: float, min_lon: float, max_lat: float, max_lon: float, precision: int) -> List[str]:
+    """
+    Find the geohash cells that overlap a bounding box.
+
+    Args:
+        min_lat, min_lon, max_lat, max_lon: Bounding box in degrees, max_lon
+            may go past 180 for boxes that cross the antimeridian
+        precision: Number of characters of the geohashes
+
+    Returns:
+        Geohashes of all the cells the box overlaps
+    """
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    if max_lon - min_lon >= 360.0:
+        min_lon, max_lon = -180.0, 180.0
+
+    cell_height, cell_width = geohash_cell_size(precision)
+
+    def steps(start, end, size):
+        # points at most one cell apart, so every cell in between gets one
+        count = int((end - start) / size) + 1
+        return [start + i * size for i in range(count)] + [end]
+
+    cells = set()
+    for cell_lat in steps(min_lat, max_lat, cell_height):
+        for cell_lon in steps(min_lon, max_lon, cell_width):
+            # wrap around the antimeridian
+            cell_lon = (cell_lon + 180.0) % 360.0 - 180.0
+            cells.add(geohash_encode(cell_lat, cell_lon, precision))
+    return sorted(cells)
+
+def geohash_cells(lat: float, lon: float, distance_km: float, precision: int) -> List[str]:
+    """
+    Find the geohash cells that overlap the bounding box around a point.
+
+    Args:
+        lat: Latitude of center point in degrees
+        lon: Longitude of center point in degrees
+        distance_km: Distance in kilometers
+        precision: Number of characters of the geohashes
+
+    Returns:
+        Geohashes of all the cells the box overlaps
+    """
+    return geohash_cells_in_box(*get_bounding_box(lat, lon, distance_km), precision)
+
 def format_location_for_display(lat: float, lon: float) -> str:
     """
     Format a location for display in a user-friendly format.
@@ -126,4 +268,31 @@ def meetings_to_geojson_collection(meetings: List[Dict[str, Any]]) -> Dict[str,
     return {
         "type": "FeatureCollection",
         "features": features
-    }
\ No newline at end of file
+    }
+
+def geohash_to_geojson(geohash: str, properties: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a geohash cell to GeoJSON format for map display.
+
+    Args:
+        geohash: Geohash of the cell
+        properties: Properties of the feature
+
+    Returns:
+        GeoJSON Feature with the cell as a polygon
+    """
+    min_lat, min_lon, max_lat, max_lon = geohash_bounds(geohash)
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [[
+                [min_lon, min_lat],
+                [max_lon, min_lat],
+                [max_lon, max_lat],
+                [min_lon, max_lat],
+                [min_lon, min_lat]
+            ]]
+        },
+        "properties": {"geohash": geohash, **properties}
+    }
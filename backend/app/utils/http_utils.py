@@ -0,0 +1,115 @@
+"""HTTP caching utilities for the StepIn application."""
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+
+from fastapi import Request, Response
+
+from app.core.metrics import metrics
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Check whether the If-None-Match header of a request matches an ETag.
+
+    Args:
+        request: Incoming request
+        etag: Current (quoted) ETag of the resource
+
+    Returns:
+        True if the client already has the current representation
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+
+    # weak comparison, as recommended for If-None-Match
+    tags = [tag.strip() for tag in header.split(",")]
+    return any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in tags)
+
+
+def not_modified_since(request: Request, last_modified: float) -> bool:
+    """
+    Check whether the If-Modified-Since header of a request is not older than
+    the last modification of a resource.
+
+    Args:
+        request: Incoming request
+        last_modified: Last modification of the resource (epoch seconds)
+
+    Returns:
+        True if the resource did not change since the given date
+    """
+    header = request.headers.get("if-modified-since")
+    if not header:
+        return False
+    try:
+        since = parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+    # HTTP dates have a one second precision
+    return int(last_modified) <= since
+
+
+def not_modified(etag: str, last_modified: Optional[float] = None) -> Response:
+    """
+    Build an empty 304 response for a resource.
+
+    Args:
+        etag: Current (quoted) ETag of the resource
+        last_modified: Last modification of the resource (epoch seconds)
+
+    Returns:
+        304 Not Modified response
+    """
+    response = Response(status_code=304)
+    set_cache_headers(response, etag, last_modified)
+    return response
+
+
+def set_cache_headers(response: Response, etag: str, last_modified: Optional[float] = None) -> None:
+    """
+    Add the validators of a resource to a response.
+
+    Args:
+        response: Outgoing response
+        etag: Current (quoted) ETag of the resource
+        last_modified: Last modification of the resource (epoch seconds)
+    """
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    if last_modified is not None:
+        response.headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+
+
+def check_not_modified(request: Request, endpoint: str, version: Optional[Tuple[str, Optional[float]]]) -> Optional[Response]:
+    """
+    Answer a conditional GET with a 304 if the client is up to date, and
+    count the outcome in the metrics of the endpoint.
+
+    Args:
+        request: Incoming request
+        endpoint: Name of the endpoint in the metrics
+        version: (ETag, last modified) of the resource, None if unknown
+
+    Returns:
+        304 response, or None if the full response has to be sent
+    """
+    metrics.incr(f"http_cached_requests.{endpoint}")
+    if version is None:
+        return None
+
+    etag, last_modified = version
+    if "if-none-match" in request.headers:
+        # If-Modified-Since is ignored when an ETag is given
+        is_current = etag_matches(request, etag)
+    else:
+        is_current = last_modified is not None and not_modified_since(request, last_modified)
+
+    if not is_current:
+        return None
+
+    metrics.incr(f"http_not_modified.{endpoint}")
+    return not_modified(etag, last_modified)
@@ -0,0 +1,27 @@
+"""Text utilities for the chat search."""
+import re
+import unicodedata
+from typing import List
+
+# Longest token that gets indexed, longer words are cut
+MAX_TOKEN_LENGTH = 32
+
+_WORD = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a text into search tokens.
+
+    Words are lowercased and their accents are dropped ("Καλημέρα" and
+    "καλημερα" give the same token). Live chats and archived chats are both
+    indexed with these tokens.
+
+    Args:
+        text: Text of a message or a search query
+
+    Returns:
+        The tokens of the text, in order, with repetitions
+    """
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return [word[:MAX_TOKEN_LENGTH] for word in _WORD.findall(stripped)]
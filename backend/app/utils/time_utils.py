@@ -1,5 +1,5 @@
 """Time and date utilities for the StepIn application."""
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Union, Optional, Tuple
 
 def parse_iso_datetime(date_str: str) -> datetime:
@@ -97,4 +97,49 @@ def get_next_meeting_times(interval_minutes: int = 30) -> Tuple[str, str]:
     # Default meeting duration: 1 hour
     end_time = start_time + timedelta(hours=1)
     
-    return start_time.isoformat(), end_time.isoformat()
\ No newline at end of file
+    return start_time.isoformat(), end_time.isoformat()
+def to_timestamp(dt: Union[str, datetime]) -> float:
+    """
+    Convert a datetime (or ISO datetime string) to epoch seconds.
+
+    Args:
+        dt: Datetime object or ISO string, naive values are treated as UTC
+
+    Returns:
+        Seconds since the epoch
+    """
+    if isinstance(dt, str):
+        dt = parse_iso_datetime(dt.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+
+    return dt.timestamp()
+
+def to_naive_utc(dt: datetime) -> datetime:
+    """
+    Convert a datetime to a naive UTC datetime, the way timestamps are stored.
+
+    Args:
+        dt: Datetime object, naive values are treated as UTC
+
+    Returns:
+        The same time in UTC, without a timezone
+    """
+    if dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+def to_iso_utc(dt: Union[str, datetime]) -> str:
+    """
+    Format a datetime (or ISO datetime string) as an ISO string in UTC, with
+    an explicit `Z`.
+
+    Args:
+        dt: Datetime object or ISO string, naive values are treated as UTC
+
+    Returns:
+        The ISO string, e.g. 2023-04-01T09:00:00.250000Z
+    """
+    if isinstance(dt, str):
+        dt = parse_iso_datetime(dt.replace('Z', '+00:00'))
+    return to_naive_utc(dt).isoformat() + "Z"
@@ -11,16 +11,24 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+from app.core.config import settings
+
 def main():
     """Start the application server"""
     port = int(os.getenv("PORT", 8000))
-    
+    reload = os.getenv("ENV", "development") == "development"
+
+    # Each worker is a separate process that opens its own connections after
+    # the fork, the background jobs run in a single one of them
+    workers = 1 if reload else settings.WEB_CONCURRENCY
+
     # Start Uvicorn server
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
         port=port,
-        reload=True if os.getenv("ENV", "development") == "development" else False,
+        reload=reload,
+        workers=workers,
         log_level="info"
     )
 
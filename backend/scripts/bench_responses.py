@@ -0,0 +1,104 @@
+"""
+Measure the CPU time per request of the message and participant endpoints.
+
+A meeting with many joined participants and a long chat is loaded into a
+fake Redis, then each endpoint is requested repeatedly in-process. The CPU
+time includes the test client, so compare runs of the same script (e.g.
+before and after a change) rather than absolute numbers.
+
+Usage (from the backend folder):
+    python scripts/bench_responses.py --participants 2000 --messages 5000 --requests 200
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def seed(redis_mgr, participants, messages):
+    """Load one active meeting with joined participants and a chat"""
+    now = datetime.now(timezone.utc)
+    users = [f"user{i:07d}@example-university.edu" for i in range(participants)]
+    redis_mgr.activate_meeting(
+        1, "Benchmark", "Meeting for the response benchmark", 37.99, 23.73,
+        ",".join(users), now - timedelta(minutes=5), now + timedelta(hours=1)
+    )
+    for email in users:
+        redis_mgr.join_meeting(email, 1)
+    for i in range(messages):
+        redis_mgr.post_message(users[i % len(users)], f"message number {i} of the benchmark chat")
+    return users
+
+
+def measure(client, path, requests, headers):
+    """Return the CPU ms, wall ms and body bytes per request"""
+    client.get(path, headers=headers)  # warm up
+
+    cpu, wall = time.process_time(), time.perf_counter()
+    for _ in range(requests):
+        response = client.get(path, headers=headers)
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+
+    assert response.status_code == 200, response.text
+    size = int(response.headers.get("content-length") or len(response.content))
+    return cpu * 1000 / requests, wall * 1000 / requests, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--participants", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--compact", action="store_true", help="use the compact Redis encoding")
+    args = parser.parse_args()
+
+    os.environ["USE_FAKE_REDIS"] = "True"
+    os.environ["USE_POSTGRES"] = "False"
+    os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["SCHEDULER_ENABLED"] = "False"
+    os.environ["REDIS_COMPACT_ENCODING"] = str(args.compact)
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.services.redis_service import get_redis_manager
+
+    # keep the debug output of the seeding out of the report
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        users = seed(get_redis_manager(), args.participants, args.messages)
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+
+    endpoints = [
+        ("messages", "/api/meetings/1/messages"),
+        ("user messages", f"/api/meetings/1/messages/{users[0]}"),
+        ("participants", "/api/meetings/1/participants"),
+    ]
+
+    print(f"{args.participants} participants, {args.messages} messages, {args.requests} requests per endpoint")
+    print(f"{'endpoint':<16}{'encoding':<10}{'cpu ms/req':>12}{'wall ms/req':>13}{'bytes':>11}")
+    with TestClient(app) as client:
+        sys.stdout = open(os.devnull, "w")
+        try:
+            results = [
+                (name, encoding, measure(client, path, args.requests, {"Accept-Encoding": encoding}))
+                for name, path in endpoints
+                for encoding in ("identity", "gzip")
+            ]
+        finally:
+            sys.stdout.close()
+            sys.stdout = real_stdout
+
+    for name, encoding, (cpu, wall, size) in results:
+        print(f"{name:<16}{encoding:<10}{cpu:>12.2f}{wall:>13.2f}{size:>11,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark request throughput for an increasing number of worker processes.
+
+For every worker count the server is started with `uvicorn --workers N`,
+warmed up, and then loaded by client processes that send keep-alive
+requests for a fixed duration. Run it against real Redis/PostgreSQL servers
+(the fake Redis is per process) on a machine with several cores.
+
+Usage (from the backend folder):
+    python scripts/bench_workers.py --workers 1 2 4 8 --duration 10
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def client(port, path, duration, results):
+    """Send requests on a keep-alive connection until the time is up"""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    done, errors = 0, 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            if response.status < 500:
+                done += 1
+            else:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    results.put((done, errors))
+
+
+def wait_until_up(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def run(workers, port, path, clients, duration):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_until_up(port)
+        time.sleep(1)  # let every worker finish its startup
+
+        results = multiprocessing.Queue()
+        procs = [
+            multiprocessing.Process(target=client, args=(port, path, duration, results))
+            for _ in range(clients)
+        ]
+        for p in procs:
+            p.start()
+        totals = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+    finally:
+        server.terminate()
+        server.wait(timeout=15)
+
+    done = sum(d for d, _ in totals)
+    errors = sum(e for _, e in totals)
+    return done / duration, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=None, help="client processes (default: 4 per worker)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per run")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--path", default="/api/meetings/nearby?email=bench@example.com&x=37.99&y=23.73")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cores, {args.duration:.0f}s per run, GET {args.path}")
+    print(f"{'workers':>8}{'clients':>9}{'req/s':>12}{'speedup':>10}{'errors':>8}")
+
+    baseline = None
+    for workers in args.workers:
+        clients = args.clients or 4 * workers
+        throughput, errors = run(workers, args.port, args.path, clients, args.duration)
+        baseline = baseline or throughput
+        print(f"{workers:>8}{clients:>9}{throughput:>12.0f}{throughput / baseline:>9.2f}x{errors:>8}")
+
+
+if __name__ == "__main__":
+    main()
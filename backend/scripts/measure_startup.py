@@ -0,0 +1,67 @@
+"""
+Measure how long it takes to import the application and to boot it.
+
+Each run happens in a fresh interpreter:
+  * import: `import app.main`
+  * boot:   running the application startup (lifespan enter)
+  * stop:   running the application shutdown (lifespan exit)
+
+Usage (from the backend folder):
+    python scripts/measure_startup.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+CHILD = """
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+import app.main
+t1 = time.perf_counter()
+
+async def boot():
+    lifespan = app.main.app.router.lifespan_context(app.main.app)
+    await lifespan.__aenter__()
+    t2 = time.perf_counter()
+    await lifespan.__aexit__(None, None, None)
+    return t2
+
+t2 = asyncio.run(boot())
+t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "boot": t2 - t1, "stop": t3 - t2, "modules": len(sys.modules)}))
+"""
+
+
+def run_once():
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout
+    # the application prints debug output, the measurement is the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+
+    for name in ("import", "boot", "stop"):
+        values = [r[name] * 1000 for r in runs]
+        print(f"{name:<8} median {statistics.median(values):8.1f} ms   min {min(values):8.1f} ms   max {max(values):8.1f} ms")
+    print(f"modules  {runs[-1]['modules']} loaded after import")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Compare the Redis memory footprint of the default and the compact encoding.
+
+The same synthetic dataset (meetings, invitations, joins and chat messages)
+is loaded once per mode into an empty Redis database, and the memory used by
+each key family is measured with MEMORY USAGE.
+
+WARNING: the target database is flushed before each run, so point it to a
+dedicated database index.
+
+Usage (from the backend folder):
+    python scripts/redis_memory_report.py --db 15 --meetings 200 --participants 500
+"""
+
+import argparse
+import os
+import random
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def key_family(key):
+    """Group a key with the other keys of the same pattern"""
+    if key.startswith("chat:") and key.count(":") >= 2:
+        return "chat:<id>:<user>"
+    for prefix in ("meeting:", "participants:", "joined:", "chat:",
+                   "user_participate_meetings:", "user_joined_meeting:", "user_location:"):
+        if key.startswith(prefix):
+            return f"{prefix}*"
+    return key
+
+
+def load_dataset(redis_mgr, meetings, participants, joined_ratio, messages, seed):
+    """Load the synthetic dataset through the RedisManager"""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    users = [f"user{i:07d}@example-university.edu" for i in range(participants * 4)]
+
+    for meeting_id in range(1, meetings + 1):
+        invited = rng.sample(users, participants)
+        redis_mgr.activate_meeting(
+            meeting_id,
+            f"Meeting {meeting_id}",
+            "Synthetic meeting for the memory report",
+            rng.uniform(-80, 80),
+            rng.uniform(-80, 80),
+            ",".join(invited),
+            now - timedelta(minutes=5),
+            now + timedelta(hours=1)
+        )
+
+    # every user can be joined in a single meeting
+    free_users = set(users)
+    for meeting_id in range(1, meetings + 1):
+        invited = redis_mgr.get_meeting_by_id(meeting_id)["participants"]
+        candidates = sorted(free_users & set(invited))
+        for email in candidates[:int(len(candidates) * joined_ratio)]:
+            redis_mgr.join_meeting(email, meeting_id)
+            free_users.discard(email)
+
+            for i in range(messages):
+                redis_mgr.post_message(email, f"message {i} from {email}")
+
+
+def measure(client):
+    """Return the memory usage in bytes and the encodings of each key family"""
+    usage = defaultdict(int)
+    counts = defaultdict(int)
+    encodings = defaultdict(set)
+
+    for key in client.scan_iter(count=1000):
+        family = key_family(key)
+        usage[family] += client.memory_usage(key, samples=0) or 0
+        counts[family] += 1
+        encodings[family].add(client.object("encoding", key))
+
+    return usage, counts, encodings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", type=int, required=True, help="dedicated Redis database index (gets flushed)")
+    parser.add_argument("--meetings", type=int, default=100)
+    parser.add_argument("--participants", type=int, default=200, help="invitations per meeting")
+    parser.add_argument("--joined-ratio", type=float, default=0.3)
+    parser.add_argument("--messages", type=int, default=5, help="messages per joined user")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ["REDIS_DB"] = str(args.db)
+    os.environ["USE_FAKE_REDIS"] = "False"
+
+    from app.services.redis_service import RedisManager
+
+    # keep the per-meeting debug output out of the report
+    real_stdout = sys.stdout
+
+    results = {}
+    for compact in (False, True):
+        redis_mgr = RedisManager(fake=False, compact=compact)
+        redis_mgr.redis_client.flushdb()
+
+        sys.stdout = open(os.devnull, "w")
+        try:
+            load_dataset(redis_mgr, args.meetings, args.participants,
+                         args.joined_ratio, args.messages, args.seed)
+        finally:
+            sys.stdout.close()
+            sys.stdout = real_stdout
+
+        results[compact] = measure(redis_mgr.redis_client)
+        redis_mgr.redis_client.flushdb()
+
+    default_usage, counts, default_enc = results[False]
+    compact_usage, compact_counts, compact_enc = results[True]
+
+    families = sorted(set(default_usage) | set(compact_usage))
+    print(f"{'key family':<32}{'keys':>8}{'default':>14}{'compact':>14}{'saved':>8}  encodings")
+    for family in families:
+        before, after = default_usage.get(family, 0), compact_usage.get(family, 0)
+        saved = f"{(1 - after / before) * 100:.0f}%" if before else "-"
+        encodings = f"{','.join(sorted(default_enc.get(family, {'-'})))} -> {','.join(sorted(compact_enc.get(family, {'-'})))}"
+        keys = max(counts.get(family, 0), compact_counts.get(family, 0))
+        print(f"{family:<32}{keys:>8}{before:>14,}{after:>14,}{saved:>8}  {encodings}")
+
+    before, after = sum(default_usage.values()), sum(compact_usage.values())
+    print(f"{'total':<32}{'':>8}{before:>14,}{after:>14,}{(1 - after / before) * 100:>7.0f}%")
+
+
+if __name__ == "__main__":
+    main()